@@ -44,3 +44,39 @@ logger = logging.getLogger(logger_mode)
 SQLALCHEMY_DATABASE_URL = os.environ.get('DB_URL')
 
 SECRET = os.environ.get('SECRET')
+
+DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'queue')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = bool(int(os.environ.get('DB_POOL_PRE_PING', True)))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 100))
+
+CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 300))
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', 2048))
+
+CATALOG_PAGE_SIZE = int(os.environ.get('CATALOG_PAGE_SIZE', 50))
+CATALOG_PAGE_MAX_SIZE = int(os.environ.get('CATALOG_PAGE_MAX_SIZE', 500))
+CATALOG_SEARCH_SIZE = int(os.environ.get('CATALOG_SEARCH_SIZE', 20))
+CATALOG_SEARCH_MAX_SIZE = int(os.environ.get('CATALOG_SEARCH_MAX_SIZE', 100))
+
+GAME_EXECUTION_MODE = os.environ.get('GAME_EXECUTION_MODE', 'orm')
+GAME_CONFLICT_RETRIES = int(os.environ.get('GAME_CONFLICT_RETRIES', 3))
+GAME_CONFLICT_BACKOFF_MS = int(os.environ.get('GAME_CONFLICT_BACKOFF_MS', 20))
+GAME_CONFLICT_BACKOFF_MAX_MS = int(os.environ.get('GAME_CONFLICT_BACKOFF_MAX_MS', 500))
+GAME_BATCH_MAX_TIMES = int(os.environ.get('GAME_BATCH_MAX_TIMES', 100))
+GAME_PLAN_MAX_ACTIONS = int(os.environ.get('GAME_PLAN_MAX_ACTIONS', 20))
+
+BALANCE_STORAGE = os.environ.get('BALANCE_STORAGE', 'rows')
+
+EXCHANGE_TICKER = bool(int(os.environ.get('EXCHANGE_TICKER', True)))
+EXCHANGE_TICK_SECONDS = float(os.environ.get('EXCHANGE_TICK_SECONDS', 5))
+EXCHANGE_STREAM_HEARTBEAT = float(os.environ.get('EXCHANGE_STREAM_HEARTBEAT', 15))
+
+MARKET_SETTLE_INTERVAL = float(os.environ.get('MARKET_SETTLE_INTERVAL', 0.2))
+MARKET_DEPTH = int(os.environ.get('MARKET_DEPTH', 20))
+MARKET_SETTLE_BACKOFF_MAX = float(os.environ.get('MARKET_SETTLE_BACKOFF_MAX', 30))
+MARKET_SETTLE_ALERT_FAILURES = int(os.environ.get('MARKET_SETTLE_ALERT_FAILURES', 10))
+MARKET_COMPACT_MIN = int(os.environ.get('MARKET_COMPACT_MIN', 1024))
+MARKET_RUNNER_RETRY = float(os.environ.get('MARKET_RUNNER_RETRY', 5))
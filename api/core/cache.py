@@ -0,0 +1,123 @@
+from collections import OrderedDict, defaultdict
+from config import CATALOG_CACHE_TTL, CATALOG_CACHE_SIZE
+from typing import Any, Awaitable, Callable, Hashable
+
+import asyncio
+import time
+
+
+_MISSING = object()
+
+
+class Cache:
+    """ In-process TTL + LRU cache with single-flight loading.
+    Keys are grouped by namespace, so one namespace can be invalidated at once
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._loading = {}
+        self._generations = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_load(
+            self,
+            namespace: Hashable,
+            key: Hashable,
+            loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """ Get value from cache or load it. Concurrent misses of one key wait for a single loader call
+        :param namespace:
+        :param key:
+        :param loader: coroutine function, None result is not cached
+        :return:
+        """
+        full_key = (namespace, key)
+
+        while True:
+            value = self._get(full_key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+
+            future = self._loading.get(full_key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[full_key] = future
+        generation = self._generations[namespace]
+
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            self._loading.pop(full_key, None)
+
+        if value is not None and generation == self._generations[namespace]:
+            self._set(full_key, value)
+        future.set_result(value)
+        return value
+
+    def get(self, namespace: Hashable, key: Hashable, default: Any = None) -> Any:
+        value = self._get((namespace, key))
+        return default if value is _MISSING else value
+
+    def set(self, namespace: Hashable, key: Hashable, value: Any) -> None:
+        self._set((namespace, key), value)
+
+    def invalidate(self, *namespaces: Hashable) -> None:
+        """ Drop all keys of namespaces. Loads started before invalidation are not stored
+        :param namespaces:
+        :return:
+        """
+        namespaces = set(namespaces)
+        for namespace in namespaces:
+            self._generations[namespace] += 1
+        for full_key in [full_key for full_key in self._data if full_key[0] in namespaces]:
+            del self._data[full_key]
+
+    def clear(self) -> None:
+        self.invalidate(*{full_key[0] for full_key in self._data})
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _get(self, full_key: tuple) -> Any:
+        item = self._data.get(full_key, None)
+        if item is None:
+            return _MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[full_key]
+            return _MISSING
+        self._data.move_to_end(full_key)
+        return value
+
+    def _set(self, full_key: tuple, value: Any) -> None:
+        self._data[full_key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(full_key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+
+catalog_cache = Cache(max_size=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL)
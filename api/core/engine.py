@@ -1,15 +1,146 @@
-from config import SQLALCHEMY_DATABASE_URL
+from config import (
+    SQLALCHEMY_DATABASE_URL,
+    DB_POOL_MODE,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE,
+)
 from typing import AsyncGenerator
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import NullPool, AsyncAdaptedQueuePool
 
+import time
 
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+
+class PoolStats:
+    """ Connection pool telemetry: checked out connections, checkout wait time and connect latency
+    """
+
+    def __init__(self):
+        self.checked_out = 0
+        self.checkouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.connects = 0
+        self.connect_time_total = 0.0
+        self.connect_time_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_time_total += seconds
+        self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def record_connect(self, seconds: float) -> None:
+        self.connects += 1
+        self.connect_time_total += seconds
+        self.connect_time_max = max(self.connect_time_max, seconds)
+
+    def snapshot(self) -> dict:
+        """ Current stats values, times in milliseconds
+        :return:
+        """
+        return {
+            "checked_out": self.checked_out,
+            "checkouts": self.checkouts,
+            "wait_ms_avg": self._avg_ms(self.wait_time_total, self.checkouts),
+            "wait_ms_max": round(self.wait_time_max * 1000, 3),
+            "connects": self.connects,
+            "connect_ms_avg": self._avg_ms(self.connect_time_total, self.connects),
+            "connect_ms_max": round(self.connect_time_max * 1000, 3),
+        }
+
+    @staticmethod
+    def _avg_ms(total: float, count: int) -> float:
+        return round(total / count * 1000, 3) if count else 0.0
+
+
+class InstrumentedPoolMixin:
+    """ Collects PoolStats for pool checkouts and new connections
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedPoolMixin, self).__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        event.listen(self, "checkout", self._on_checkout)
+        event.listen(self, "checkin", self._on_checkin)
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super(InstrumentedPoolMixin, self).connect()
+        finally:
+            self.stats.record_wait(time.perf_counter() - start)
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super(InstrumentedPoolMixin, self)._create_connection()
+        finally:
+            self.stats.record_connect(time.perf_counter() - start)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self.stats.checked_out += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        self.stats.checked_out = max(self.stats.checked_out - 1, 0)
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    ...
+
+
+class InstrumentedNullPool(InstrumentedPoolMixin, NullPool):
+    ...
+
+
+def get_engine_options(database_url: str) -> dict:
+    """ Engine options by DB_POOL_* settings. DB_POOL_MODE=null opens a connection per session
+    :param database_url:
+    :return:
+    """
+    options = {}
+
+    if DB_POOL_MODE == "null":
+        options["poolclass"] = InstrumentedNullPool
+    else:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    options["pool_pre_ping"] = DB_POOL_PRE_PING
+
+    if database_url and make_url(database_url).get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+def get_pool_stats() -> dict:
+    """ Stats of the engine connection pool
+    :return:
+    """
+    pool = engine.pool
+    stats = pool.stats.snapshot() if hasattr(pool, "stats") else {}
+    stats["status"] = pool.status()
+    return stats
+
+
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
@@ -1,11 +1,21 @@
+from config import BALANCE_STORAGE
+from core.cache import catalog_cache
 from core.engine import async_session_maker
 from datetime import datetime
-from game import models, schemas
-from sqlalchemy import select, insert
+from game import domain, models, schemas
+from sqlalchemy import (
+    select, insert, update, inspect, func, tuple_, cast, case, bindparam, Integer, String,
+    and_, column, exists, literal, true, values,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import load_only, raiseload, selectinload
 
-from typing import List, Union
+from typing import Dict, List, Set, Tuple, Union
 
 
+# First key of transaction advisory locks serializing catalog versions, the second one is catalog table hash
+CATALOG_VERSION_LOCK = 1
+
 async def init_db() -> None:
     """ Initialisation empty db
     :return:
@@ -39,8 +49,19 @@ async def init_db() -> None:
             await session.commit()
 
 
+class CatalogSnapshot:
+    """ Catalog rows with the catalog version they were loaded at
+    """
+
+    def __init__(self, version: int, items: list):
+        self.version = version
+        self.items = items
+
+
 class Base:
     model = None
+    catalog = False
+    owned_kind = None
 
     def __init__(self, session):
         self.session = session
@@ -65,6 +86,9 @@ class Base:
         """ Base repository method for get objects list
         :return:
         """
+        if self.catalog:
+            snapshot = await self.get_snapshot()
+            return snapshot.items
         query = select(self.model)
         result = await self.session.execute(query)
         return self._all(result)
@@ -87,9 +111,237 @@ class Base:
             models.Business
     ]:
         query = select(self.model).filter(self.model.id == object_id)
+        if self.catalog:
+            item = await catalog_cache.get_or_load(
+                self.model, object_id, lambda: self._load_detached(query, self._first)
+            )
+            return await self.session.merge(item, load=False) if item else None
         result = await self.session.execute(query)
         return self._first(result)
 
+    async def get_objects_page(
+            self,
+            limit: int,
+            after_id: int | None = None,
+            order_by: str = "id",
+            currency_id: int | None = None,
+            price_min: int | None = None,
+            price_max: int | None = None,
+            skill_id: int | None = None,
+            home_id: int | None = None,
+            transport_id: int | None = None,
+            fields: Tuple[str, ...] | None = None
+    ) -> list:
+        """ Keyset page of objects ordered by order_by and id, filtered in db. Empty order values are ordered as 0.
+        Relationships are not loaded, with fields only their columns are selected
+        :param limit: page size
+        :param after_id: id of the last object of previous page
+        :param order_by: id, price or income
+        :param currency_id:
+        :param price_min:
+        :param price_max:
+        :param skill_id: required skill
+        :param home_id: required home
+        :param transport_id: required transport
+        :param fields: columns to load, all when None
+        :return:
+        """
+        order_column_names = {
+            "id": ("id",),
+            "price": ("price",),
+            "income": ("income_min", "income"),
+        }
+        order_column = self._get_column(*order_column_names[order_by])
+        if order_column.nullable:
+            # NULL in keyset tuple comparison drops all next pages, so NULL is ordered as 0
+            order_column = func.coalesce(order_column, 0)
+
+        filters = []
+        for field, value in (
+                ("currency_id", currency_id),
+                ("skill_id", skill_id),
+                ("home_id", home_id),
+                ("transport_id", transport_id),
+        ):
+            if value is not None:
+                filters.append(self._get_column(field) == value)
+        if price_min is not None:
+            filters.append(self._get_column("price") >= price_min)
+        if price_max is not None:
+            filters.append(self._get_column("price") <= price_max)
+
+        query = select(self.model).filter(*filters)
+        order_columns = [order_column]
+        if order_column is not self.model.id:
+            order_columns.append(self.model.id)
+
+        if after_id is not None:
+            if order_column is self.model.id:
+                query = query.filter(self.model.id > after_id)
+            else:
+                after_value = select(order_column).filter(self.model.id == after_id).scalar_subquery()
+                query = query.filter(tuple_(order_column, self.model.id) > tuple_(after_value, after_id))
+
+        query = query.order_by(*order_columns).limit(limit).options(*self._get_load_only(fields), raiseload("*"))
+        result = await self.session.execute(query)
+        return self._all(result)
+
+    def _get_load_only(self, fields: Tuple[str, ...] | None) -> tuple:
+        """ Load option of model columns named by fields, primary key is always loaded
+        :param fields: columns to load, all when None
+        :return:
+        """
+        if not fields:
+            return ()
+        return (load_only(*(self._get_column(field) for field in fields)),)
+
+    def _get_column(self, *names: str):
+        """ First existing model column from names
+        :param names:
+        :return:
+        """
+        for name in names:
+            column = getattr(self.model, name, None)
+            if column is not None:
+                return column
+        raise ValueError(f"{self.model.__name__} has no {names[0]} field")
+
+    async def get_snapshot(self) -> CatalogSnapshot:
+        """ Cached catalog rows with catalog version
+        :return:
+        """
+        return await catalog_cache.get_or_load(self.model, "list", self._load_snapshot)
+
+    def get_action_plan(self, item) -> domain.ActionPlan:
+        """ Compiled game rules of catalog row. Plans are cached next to catalog rows,
+        so they are dropped by the same invalidation
+        :param item: catalog row
+        :return:
+        """
+        key = ("plan", item.id)
+        plan = catalog_cache.get(self.model, key) if self.catalog else None
+        if plan is None:
+            plan = domain.compile_plan(kind=self.model.__name__.lower(), row=item)
+            if self.catalog:
+                catalog_cache.set(self.model, key, plan)
+        return plan
+
+    async def get_version(self) -> int:
+        """ Catalog version, id of the last catalog change
+        :return:
+        """
+        snapshot = await self.get_snapshot()
+        return snapshot.version
+
+    async def get_changes(
+            self,
+            since: int,
+            fields: Tuple[str, ...] | None = None
+    ) -> Tuple[int, list, List[int]]:
+        """ Catalog rows changed and ids deleted after version since, relationships are not loaded
+        :param since: catalog version
+        :param fields: columns of changed rows to load, all when None
+        :return: current version, changed rows, deleted ids
+        """
+        query = select(
+            models.CatalogChange.object_id, func.max(models.CatalogChange.id)
+        ).filter(
+            models.CatalogChange.catalog == self.model.__tablename__,
+            models.CatalogChange.id > since
+        ).group_by(models.CatalogChange.object_id)
+        result = await self.session.execute(query)
+        changes = result.all()
+
+        version = max([change_id for _, change_id in changes], default=since)
+        object_ids = [object_id for object_id, _ in changes]
+        items = []
+        if object_ids:
+            query = select(self.model).filter(
+                self.model.id.in_(object_ids)
+            ).options(*self._get_load_only(fields), raiseload("*"))
+            result = await self.session.execute(query)
+            items = self._all(result)
+
+        existing_ids = {item.id for item in items}
+        deleted_ids = [object_id for object_id in object_ids if object_id not in existing_ids]
+        return version, items, deleted_ids
+
+    async def _load_snapshot(self) -> CatalogSnapshot:
+        """ Load catalog version and rows in a separate session. Version is read first,
+        so rows are never older than it
+        :return:
+        """
+        version_query = select(
+            func.coalesce(func.max(models.CatalogChange.id), 0)
+        ).filter(models.CatalogChange.catalog == self.model.__tablename__)
+
+        async with async_session_maker() as session:
+            result = await session.execute(version_query)
+            version = result.scalar()
+            result = await session.execute(select(self.model))
+            return CatalogSnapshot(version=version, items=self._all(result))
+
+    @staticmethod
+    async def _load_detached(query, fetch):
+        """ Load cached rows in a separate session, so they are not expired by request session rollback
+        :param query:
+        :param fetch: result method (_all, _first)
+        :return:
+        """
+        async with async_session_maker() as session:
+            result = await session.execute(query)
+            return fetch(result)
+
+    def _invalidate(self) -> None:
+        """ Drop cached rows of the model and of cached models which load it by relationship
+        :return:
+        """
+        cached_models = [entity.model for entity in Base.__subclasses__() if entity.catalog]
+        changed_models = [self.model]
+
+        for changed_model in changed_models:
+            for cached_model in cached_models:
+                if cached_model in changed_models:
+                    continue
+                relationships = inspect(cached_model).relationships
+                if any(relation.mapper.class_ is changed_model for relation in relationships):
+                    changed_models.append(cached_model)
+
+        catalog_cache.invalidate(*changed_models)
+
+    async def _add_change(self, object_id: int, deleted: bool = False) -> None:
+        """ Record catalog change, its id is the new catalog version. Change ids come from a sequence at flush,
+        so writers of the same catalog hold a lock until commit and versions become visible in id order
+        :param object_id:
+        :param deleted:
+        :return:
+        """
+        if not self.catalog:
+            return
+        await self.session.execute(
+            select(func.pg_advisory_xact_lock(CATALOG_VERSION_LOCK, func.hashtext(self.model.__tablename__)))
+        )
+        self.session.add(
+            models.CatalogChange(
+                catalog=self.model.__tablename__,
+                object_id=object_id,
+                deleted=deleted,
+                created_at=datetime.now()
+            )
+        )
+
+    async def _commit(self, obj=None, deleted: bool = False) -> None:
+        """ Commit changes of obj with catalog version bump and cache invalidation
+        :param obj: changed db object
+        :param deleted:
+        :return:
+        """
+        if obj is not None and self.catalog:
+            await self.session.flush()
+            await self._add_change(object_id=obj.id, deleted=deleted)
+        await self.session.commit()
+        self._invalidate()
+
     @staticmethod
     def _all(result):
         row = result.all()
@@ -114,9 +366,10 @@ class Base:
     async def _add(self, obj, data):
         if not isinstance(data, dict):
             data = data.dict()
-        query = insert(obj).values(**data)
-        await self.session.execute(query)
-        await self.session.commit()
+        query = insert(obj).values(**data).returning(obj.id)
+        result = await self.session.execute(query)
+        await self._add_change(object_id=result.scalar())
+        await self._commit()
         return {
             "status": "success"
         }
@@ -124,27 +377,266 @@ class Base:
     async def _update(self, obj, data):
         for field, value in data.dict().items():
             setattr(obj, field, value)
-        await self.session.commit()
+        await self._commit(obj)
         return {
             "status": "success"
         }
 
     async def _delete(self, obj):
+        if self.owned_kind:
+            await self._remove_owned(object_id=obj.id)
         await self.session.delete(obj)
-        await self.session.commit()
+        await self._commit(obj, deleted=True)
         return {
             "status": "success"
         }
 
+    async def _remove_owned(self, object_id: int) -> None:
+        """ Remove deleted item from owned arrays of players. Player version is moved,
+        so requests with loaded owners are retried
+        :param object_id:
+        :return:
+        """
+        player_table = models.Player.__table__
+        owned_ids = player_table.c[f"owned_{self.owned_kind}_ids"]
+        query = update(player_table).filter(owned_ids.any(object_id)).values({
+            owned_ids: func.array_remove(owned_ids, object_id),
+            player_table.c.version: player_table.c.version + 1,
+        })
+        await self.session.execute(query)
+
 
 class PlayerEntity(Base):
     model = models.Player
+    balance_names = {
+        "bottle": "Бутылки",
+        "RUB": "Рубли",
+        "USD": "Баксы",
+        "BTC": "Биткоины"
+    }
+    info_loads = {
+        "home_list": selectinload(models.Player.home_list).raiseload("*"),
+        "skills": selectinload(models.Player.skills).raiseload("*"),
+        "transport_list": selectinload(models.Player.transport_list).raiseload("*"),
+        "business_list": selectinload(models.Player.business_list).raiseload("*"),
+    }
+    load_profiles = {
+        "base": (),
+        "info": tuple(info_loads.values()),
+        "service": (),
+        "action": (),
+        "home": (),
+        "skill": (),
+        "transport": (),
+        "business": (),
+        "plan": (),
+    }
+    owned_tables = {
+        "transport": models.transport_player,
+        "home": models.home_player,
+        "skill": models.skill_player,
+        "business": models.business_player,
+    }
+    balance_load = selectinload(models.Player.balances).raiseload("*")
+    info_balance_load = selectinload(models.Player.balances).selectinload(models.Balance.currency).raiseload("*")
+
+    def get_load_options(self, profile: str, storage: str = BALANCE_STORAGE) -> tuple:
+        """ Load options of profile. Balance rows are loaded by every profile except base in rows storage,
+        vector storage has balances in player row
+        :param profile: load_profiles key
+        :param storage: rows or vector
+        :return:
+        """
+        options = self.load_profiles[profile]
+        if storage == "rows" and profile != "base":
+            options += (self.info_balance_load if profile == "info" else self.balance_load,)
+        return options
+
+    def get_info_load_options(self, fields: Tuple[str, ...], storage: str = BALANCE_STORAGE) -> tuple:
+        """ Load options of info profile narrowed to fields: only their columns are selected
+        and only their relationships are loaded
+        :param fields: PlayerSchema fields
+        :param storage: rows or vector
+        :return:
+        """
+        columns = [
+            getattr(self.model, field) for field in fields
+            if field not in self.info_loads and field != "balances"
+        ]
+        options = [self.info_loads[field] for field in fields if field in self.info_loads]
+        if "balances" in fields:
+            if storage == "rows":
+                options.append(self.info_balance_load)
+            else:
+                columns.append(self.model.balance_vector)
+        return load_only(*columns), *options, raiseload("*")
+
+    async def get_dashboard_player(
+            self,
+            user_id: int,
+            with_balances: bool = True
+    ) -> Tuple[models.Player | None, Dict[int, int] | None]:
+        """ Last player of user without relationships and its balance amounts in one query.
+        In rows storage amounts are aggregated from balance rows by correlated subqueries
+        :param user_id:
+        :param with_balances:
+        :return: player and amount by currency id, amounts are None without balances
+        """
+        query = select(self.model).filter(
+            self.model.user_id == user_id
+        ).order_by(self.model.id.desc()).limit(1).options(raiseload("*"))
+        aggregate = with_balances and BALANCE_STORAGE == "rows"
+        if aggregate:
+            query = query.add_columns(*(
+                select(
+                    func.array_agg(aggregate_order_by(field, models.Balance.currency_id))
+                ).filter(models.Balance.player_id == self.model.id).scalar_subquery()
+                for field in (models.Balance.currency_id, models.Balance.amount)
+            ))
+        result = await self.session.execute(query)
+        row = result.first()
+        if row is None:
+            return None, None
+
+        player = row[0]
+        if not with_balances:
+            return player, None
+        if aggregate:
+            return player, dict(zip(row[1] or (), row[2] or ()))
+        return player, self.get_balance_amounts(player)
+
+    async def get_player_by_id(
+            self,
+            player_id: int,
+            profile: str = "base",
+            storage: str = BALANCE_STORAGE
+    ) -> models.Player:
+        query = select(self.model).filter(
+            self.model.id == player_id
+        ).options(*self.get_load_options(profile, storage=storage))
+        result = await self.session.execute(query)
+        return self._first(result)
 
-    async def get_player_by_id(self, player_id: int) -> models.Player:
-        query = select(self.model).filter(self.model.id == player_id)
+    async def get_active_player(
+            self,
+            user_id: int,
+            profile: str = "base",
+            fields: Tuple[str, ...] | None = None
+    ) -> models.Player | None:
+        """ Last player of user with relationships of the load profile only
+        :param user_id:
+        :param profile: load_profiles key
+        :param fields: PlayerSchema fields to load instead of the info profile
+        :return:
+        """
+        options = self.get_info_load_options(fields) if fields else self.get_load_options(profile)
+        query = select(self.model).filter(
+            self.model.user_id == user_id
+        ).order_by(self.model.id.desc()).limit(1).options(*options)
         result = await self.session.execute(query)
         return self._first(result)
 
+    @staticmethod
+    def get_owned_ids(player: models.Player) -> Dict[str, Set[int]]:
+        """ Ids of owned items by kind from player arrays
+        :param player:
+        :return:
+        """
+        return {kind: set(getattr(player, f"owned_{kind}_ids") or ()) for kind in domain.ITEM_KINDS}
+
+    def set_owned_ids(self, player: models.Player, owned: Dict[str, Set[int]]) -> None:
+        """ Write changed owned item ids to player arrays without commit
+        :param player:
+        :param owned: ids by kind
+        :return:
+        """
+        for kind, item_ids in owned.items():
+            column_name = f"owned_{kind}_ids"
+            if set(getattr(player, column_name) or ()) != item_ids:
+                setattr(player, column_name, sorted(item_ids))
+
+    async def add_owned_items(self, player_id: int, items: Dict[str, List[int]], day: int) -> None:
+        """ Add association rows of bought items without commit, player arrays are written with player.
+        Income of new business accrues from day
+        :param player_id:
+        :param items: new item ids by kind
+        :param day:
+        :return:
+        """
+        for kind, item_ids in items.items():
+            table = self.owned_tables[kind]
+            values = {"last_collected_day": day} if kind == "business" else {}
+            query = insert(table).values([
+                {f"{kind}_id": item_id, "player_id": player_id, **values} for item_id in item_ids
+            ])
+            await self.session.execute(query)
+
+    @staticmethod
+    def get_balance_amounts(player: models.Player) -> Dict[int, int] | None:
+        """ Balance amounts of player by currency id. Position of currency in balance vector is its id,
+        currencies without balance are NULL
+        :param player:
+        :return: None when balance rows are not loaded
+        """
+        if BALANCE_STORAGE == "vector":
+            return {
+                currency_id: amount
+                for currency_id, amount in enumerate(player.balance_vector or [], start=1) if amount is not None
+            }
+        if "balances" in inspect(player).unloaded:
+            return None
+        return {balance.currency_id: balance.amount for balance in player.balances}
+
+    def set_balance_amounts(self, player: models.Player, amounts: Dict[int, int]) -> None:
+        """ Write changed balance amounts to player storage without commit
+        :param player:
+        :param amounts: amount by currency id
+        :return:
+        """
+        if BALANCE_STORAGE == "vector":
+            vector = list(player.balance_vector or [])
+            for currency_id, amount in amounts.items():
+                if currency_id <= len(vector) and vector[currency_id - 1] is not None:
+                    vector[currency_id - 1] = amount
+            if vector != player.balance_vector:
+                player.balance_vector = vector
+            return
+
+        if "balances" in inspect(player).unloaded:
+            return
+        for balance in player.balances:
+            amount = amounts.get(balance.currency_id, balance.amount)
+            if balance.amount != amount:
+                balance.amount = amount
+                self.session.add(balance)
+
+    async def get_balance_list(
+            self,
+            player: models.Player,
+            amounts: Dict[int, int] | None = None
+    ) -> List[models.Balance]:
+        """ Balances of vector storage as not persisted Balance objects with currency of the registry
+        :param player:
+        :param amounts: amount by currency id, taken from player when not given
+        :return:
+        """
+        currencies = await CurrencyEntity(session=self.session).get_registry()
+        if amounts is None:
+            amounts = self.get_balance_amounts(player)
+        balances = []
+        for currency_id, amount in amounts.items():
+            currency = currencies.get(currency_id)
+            if currency is None:
+                continue
+            balances.append(models.Balance(
+                name=self.__map_balance_name(currency_name=currency.name),
+                currency_id=currency_id,
+                currency=currency,
+                player_id=player.id,
+                amount=amount
+            ))
+        return balances
+
     async def create(self, data: schemas.CreatePlayer | dict) -> int:
         query = select(models.Currency)
         result = await self.session.execute(query)
@@ -153,17 +645,25 @@ class PlayerEntity(Base):
         if not isinstance(data, dict):
             data = data.dict()
 
+        balance_currencies = [
+            item_currency for item_currency in all_currencies
+            if self.__map_balance_name(currency_name=item_currency.name)
+        ]
+        if BALANCE_STORAGE == "vector":
+            balance_ids = {item_currency.id for item_currency in balance_currencies}
+            data["balance_vector"] = [
+                0 if currency_id in balance_ids else None
+                for currency_id in range(1, max(balance_ids, default=0) + 1)
+            ]
+
         player = self.model(**data)
         self.session.add(player)
         await self.session.commit()
 
-        if all_currencies and isinstance(all_currencies, list):
-            for item_currency in all_currencies:
-                balance_name = self.__map_balance_name(currency_name=item_currency.name)
-                if not balance_name:
-                    continue
+        if BALANCE_STORAGE == "rows":
+            for item_currency in balance_currencies:
                 balance = models.Balance(
-                    name=balance_name,
+                    name=self.__map_balance_name(currency_name=item_currency.name),
                     currency_id=item_currency.id,
                     player_id=player.id,
                     amount=0,
@@ -174,15 +674,84 @@ class PlayerEntity(Base):
         await self.session.commit()
         return player.id
 
-    @staticmethod
-    def __map_balance_name(currency_name: str) -> str | None:
-        balance_mapping = {
-            "bottle": "Бутылки",
-            "RUB": "Рубли",
-            "USD": "Баксы",
-            "BTC": "Биткоины"
-        }
-        return balance_mapping.get(currency_name, None)
+    async def copy_balances_to_vector(self) -> None:
+        """ Fill balance vectors of all players from balance rows, run before switching BALANCE_STORAGE to vector
+        :return:
+        """
+        balance_table = models.Balance.__table__
+        player_table = self.model.__table__
+        max_currency_id = select(func.coalesce(func.max(models.Currency.id), 0)).scalar_subquery()
+        positions = func.generate_series(1, max_currency_id).table_valued("position").render_derived(name="positions")
+        players = player_table.alias("players")
+
+        vectors = select(
+            players.c.id.label("player_id"),
+            func.array_agg(aggregate_order_by(balance_table.c.amount, positions.c.position)).label("vector")
+        ).select_from(
+            players.join(positions, true()).outerjoin(
+                balance_table, and_(
+                    balance_table.c.player_id == players.c.id,
+                    balance_table.c.currency_id == positions.c.position
+                )
+            )
+        ).group_by(players.c.id).subquery("vectors")
+
+        query = update(player_table).filter(
+            player_table.c.id == vectors.c.player_id
+        ).values(balance_vector=vectors.c.vector)
+        await self.session.execute(query)
+        await self.session.commit()
+
+    async def copy_balances_to_rows(self) -> None:
+        """ Write balance vectors of all players to balance rows, missing rows are added.
+        Run before switching BALANCE_STORAGE back to rows
+        :return:
+        """
+        balance_table = models.Balance.__table__
+        player_table = self.model.__table__
+        currency_table = models.Currency.__table__
+        amount = player_table.c.balance_vector[balance_table.c.currency_id]
+
+        query = update(balance_table).filter(
+            player_table.c.id == balance_table.c.player_id,
+            amount.isnot(None),
+            amount != balance_table.c.amount
+        ).values(
+            amount=amount,
+            updated_at=datetime.now(),
+            version=balance_table.c.version + 1
+        )
+        await self.session.execute(query)
+
+        balance_names = values(
+            column("currency_name", String), column("balance_name", String), name="balance_names"
+        ).data(list(self.balance_names.items()))
+        amount = player_table.c.balance_vector[currency_table.c.id]
+        missing = select(
+            balance_names.c.balance_name,
+            currency_table.c.id,
+            player_table.c.id,
+            amount,
+            literal(datetime.now())
+        ).select_from(
+            player_table.join(currency_table, amount.isnot(None)).join(
+                balance_names, balance_names.c.currency_name == currency_table.c.name
+            )
+        ).filter(
+            ~exists().where(
+                balance_table.c.player_id == player_table.c.id,
+                balance_table.c.currency_id == currency_table.c.id
+            )
+        )
+        query = insert(balance_table).from_select(
+            ["name", "currency_id", "player_id", "amount", "updated_at"], missing
+        )
+        await self.session.execute(query)
+        await self.session.commit()
+
+    @classmethod
+    def __map_balance_name(cls, currency_name: str) -> str | None:
+        return cls.balance_names.get(currency_name, None)
 
 
 class CurrencyEntity(Base):
@@ -204,13 +773,59 @@ class CurrencyEntity(Base):
         """
         return await super(CurrencyEntity, self).get_by_id(object_id)
 
+    async def get_registry(self) -> Dict[int, models.Currency]:
+        """ Cached currencies by id, dropped on currency changes
+        :return:
+        """
+        query = select(self.model).order_by(self.model.id)
+        currencies = await catalog_cache.get_or_load(
+            self.model, "registry", lambda: self._load_detached(query, self._all)
+        )
+        return {currency.id: currency for currency in currencies}
+
+    async def get_exchange_rates(self) -> list:
+        """ Exchange prices of currencies with exchange currency
+        :return: rows of currency id, exchange currency id, exchange price
+        """
+        query = select(
+            self.model.id, self.model.exchange_currency_id, self.model.exchange_price
+        ).filter(self.model.exchange_currency_id.isnot(None))
+        result = await self.session.execute(query)
+        return result.all()
+
+    async def walk_exchange_rates(self) -> list:
+        """ Move exchange prices of all currencies by -step, 0 or +step within min/max in one statement.
+        Price without value starts from the middle of range
+        :return: rows of currency id, exchange currency id, exchange price
+        """
+        price_min = self.model.exchange_price_min
+        price_max = self.model.exchange_price_max
+        price = func.coalesce(self.model.exchange_price, (price_min + price_max) // 2)
+        direction = func.floor(func.random() * 3) - 1
+        new_price = func.least(price_max, func.greatest(price_min, price + self.model.exchange_change_step * direction))
+
+        query = update(self.model).filter(
+            self.model.exchange_currency_id.isnot(None),
+            price_min.isnot(None),
+            price_max.isnot(None),
+            self.model.exchange_change_step.isnot(None)
+        ).values(
+            exchange_price=cast(new_price, Integer)
+        ).returning(
+            self.model.id, self.model.exchange_currency_id, self.model.exchange_price
+        ).execution_options(synchronize_session=False)
+        result = await self.session.execute(query)
+        rows = result.all()
+        await self.session.commit()
+        return rows
+
     async def create(self, data: schemas.CreateCurrency | dict) -> int:
         if not isinstance(data, dict):
             data = data.dict()
 
         currency = self.model(**data)
         self.session.add(currency)
-        await self.session.commit()
+        await self._commit(currency)
         return currency.id
 
     async def update(self, currency_id: int, data: schemas.UpdateCurrency):
@@ -281,6 +896,8 @@ class BalanceEntity(Base):
 
 class HomeEntity(Base):
     model = models.Home
+    catalog = True
+    owned_kind = "home"
 
     async def get_objects_list(self) -> List[models.Home]:
         """ Get home list
@@ -304,7 +921,7 @@ class HomeEntity(Base):
 
         home = self.model(**data)
         self.session.add(home)
-        await self.session.commit()
+        await self._commit(home)
         return home.id
 
     async def update(self, home_id: int, data: schemas.UpdateHome):
@@ -328,6 +945,8 @@ class HomeEntity(Base):
 
 class SkillEntity(Base):
     model = models.Skill
+    catalog = True
+    owned_kind = "skill"
 
     async def get_objects_list(self) -> List[models.Skill]:
         """ Get skill list
@@ -351,7 +970,7 @@ class SkillEntity(Base):
 
         balance = self.model(**data)
         self.session.add(balance)
-        await self.session.commit()
+        await self._commit(balance)
         return balance.id
 
     async def update(self, skill_id: int, data: schemas.UpdateSkill):
@@ -375,6 +994,8 @@ class SkillEntity(Base):
 
 class TransportEntity(Base):
     model = models.Transport
+    catalog = True
+    owned_kind = "transport"
 
     async def get_objects_list(self) -> List[models.Transport]:
         """ Get transport list
@@ -398,7 +1019,7 @@ class TransportEntity(Base):
 
         transport = self.model(**data)
         self.session.add(transport)
-        await self.session.commit()
+        await self._commit(transport)
         return transport.id
 
     async def update(self, transport_id: int, data: schemas.UpdateTransport):
@@ -422,6 +1043,7 @@ class TransportEntity(Base):
 
 class StreetActionEntity(Base):
     model = models.StreetAction
+    catalog = True
 
     async def get_objects_list(self) -> List[models.StreetAction]:
         """ Get street action list
@@ -445,7 +1067,7 @@ class StreetActionEntity(Base):
 
         street_action = self.model(**data)
         self.session.add(street_action)
-        await self.session.commit()
+        await self._commit(street_action)
         return street_action.id
 
     async def update(self, street_action_id: int, data: schemas.UpdateStreetAction):
@@ -469,6 +1091,7 @@ class StreetActionEntity(Base):
 
 class WorkEntity(Base):
     model = models.Work
+    catalog = True
 
     async def get_objects_list(self) -> List[models.Work]:
         """ Get work list
@@ -492,7 +1115,7 @@ class WorkEntity(Base):
 
         work = self.model(**data)
         self.session.add(work)
-        await self.session.commit()
+        await self._commit(work)
         return work.id
 
     async def update(self, work_id: int, data: schemas.UpdateWork):
@@ -516,6 +1139,7 @@ class WorkEntity(Base):
 
 class FoodEntity(Base):
     model = models.Food
+    catalog = True
 
     async def get_objects_list(self) -> List[models.Food]:
         """ Get food list
@@ -539,7 +1163,7 @@ class FoodEntity(Base):
 
         food = self.model(**data)
         self.session.add(food)
-        await self.session.commit()
+        await self._commit(food)
         return food.id
 
     async def update(self, food_id: int, data: schemas.UpdateFood):
@@ -563,6 +1187,7 @@ class FoodEntity(Base):
 
 class HealthEntity(Base):
     model = models.Health
+    catalog = True
 
     async def get_objects_list(self) -> List[models.Health]:
         """ Get health list
@@ -586,7 +1211,7 @@ class HealthEntity(Base):
 
         health = self.model(**data)
         self.session.add(health)
-        await self.session.commit()
+        await self._commit(health)
         return health.id
 
     async def update(self, health_id: int, data: schemas.UpdateHealth):
@@ -610,6 +1235,7 @@ class HealthEntity(Base):
 
 class LeisureEntity(Base):
     model = models.Leisure
+    catalog = True
 
     async def get_objects_list(self) -> List[models.Leisure]:
         """ Get leisure list
@@ -633,7 +1259,7 @@ class LeisureEntity(Base):
 
         leisure = self.model(**data)
         self.session.add(leisure)
-        await self.session.commit()
+        await self._commit(leisure)
         return leisure.id
 
     async def update(self, leisure_id: int, data: schemas.UpdateLeisure):
@@ -657,6 +1283,8 @@ class LeisureEntity(Base):
 
 class BusinessEntity(Base):
     model = models.Business
+    catalog = True
+    owned_kind = "business"
 
     async def get_objects_list(self) -> List[models.Business]:
         """ Get business list
@@ -680,7 +1308,7 @@ class BusinessEntity(Base):
 
         business = self.model(**data)
         self.session.add(business)
-        await self.session.commit()
+        await self._commit(business)
         return business.id
 
     async def update(self, business_id: int, data: schemas.UpdateBusiness):
@@ -700,3 +1328,91 @@ class BusinessEntity(Base):
                 "message": "Business is not found"
             }
         return await self._delete(business)
+
+
+class OrderEntity(Base):
+    model = models.Order
+
+    async def get_open_orders(self) -> List[models.Order]:
+        """ Open orders in placing order
+        :return:
+        """
+        query = select(self.model).filter(self.model.status == "open").order_by(self.model.id)
+        result = await self.session.execute(query)
+        return result.scalars().all()
+
+    async def get_player_orders(self, player_id: int) -> List[models.Order]:
+        """ Open orders of player
+        :param player_id:
+        :return:
+        """
+        query = select(self.model).filter(
+            self.model.player_id == player_id,
+            self.model.status == "open"
+        ).order_by(self.model.id)
+        result = await self.session.execute(query)
+        return result.scalars().all()
+
+    def add(self, data: dict) -> models.Order:
+        """ Add order to session without commit, it is written with player balance changes
+        :param data:
+        :return:
+        """
+        order = self.model(**data, filled=0, status="open", created_at=datetime.now())
+        self.session.add(order)
+        return order
+
+    async def set_status(self, order_id: int, status: str) -> None:
+        """ Set order status without commit
+        :param order_id:
+        :param status:
+        :return:
+        """
+        query = update(self.model.__table__).filter(self.model.id == order_id).values(status=status)
+        await self.session.execute(query)
+
+    async def settle(self, order_fills: dict, balance_changes: dict) -> None:
+        """ Write matched amounts of orders and balance credits in one transaction with one
+        executemany statement for each table. Balances are updated in key order
+        :param order_fills: filled amount by order id
+        :param balance_changes: amount by (player id, currency id)
+        :return:
+        """
+        order_table = self.model.__table__
+        balance_table = models.Balance.__table__
+
+        filled = func.least(order_table.c.amount, order_table.c.filled + bindparam("fill_amount"))
+        order_query = update(order_table).filter(
+            order_table.c.id == bindparam("order_id")
+        ).values(
+            filled=filled,
+            status=case((filled >= order_table.c.amount, "filled"), else_=order_table.c.status)
+        )
+        await self.session.execute(order_query, [
+            {"order_id": order_id, "fill_amount": amount}
+            for order_id, amount in sorted(order_fills.items())
+        ])
+
+        if BALANCE_STORAGE == "vector":
+            player_table = models.Player.__table__
+            amount = player_table.c.balance_vector[bindparam("balance_currency_id", type_=Integer)]
+            balance_query = update(player_table).filter(
+                player_table.c.id == bindparam("balance_player_id")
+            ).values({
+                amount: amount + bindparam("balance_amount"),
+                player_table.c.version: player_table.c.version + 1,
+            })
+        else:
+            balance_query = update(balance_table).filter(
+                balance_table.c.player_id == bindparam("balance_player_id"),
+                balance_table.c.currency_id == bindparam("balance_currency_id")
+            ).values(
+                amount=balance_table.c.amount + bindparam("balance_amount"),
+                updated_at=datetime.now(),
+                version=balance_table.c.version + 1
+            )
+        await self.session.execute(balance_query, [
+            {"balance_player_id": player_id, "balance_currency_id": currency_id, "balance_amount": amount}
+            for (player_id, currency_id), amount in sorted(balance_changes.items())
+        ])
+        await self.session.commit()
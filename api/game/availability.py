@@ -0,0 +1,69 @@
+from bisect import bisect_right
+from core.cache import catalog_cache
+from game import domain
+from game.requirements import CATALOG_ENTITIES, Node, load_catalog_snapshots, get_catalog_plans
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List
+
+import operator
+
+
+class PriceIndex:
+    """ Catalog plans sorted by cost for every currency. Actions with income have zero cost,
+    so they are always at the start of their currency list
+    """
+    __slots__ = ("costs", "plans")
+
+    def __init__(self, plans: Dict[Node, domain.ActionPlan]):
+        by_currency = {}
+        for (catalog, _), plan in plans.items():
+            by_currency.setdefault(plan.currency_id, []).append((plan.cost, catalog, plan.id, plan))
+        self.costs: Dict[int | None, List[int]] = {}
+        self.plans: Dict[int | None, List[tuple]] = {}
+        for currency_id, items in by_currency.items():
+            items.sort(key=operator.itemgetter(0, 1, 2))
+            self.costs[currency_id] = [cost for cost, *_ in items]
+            self.plans[currency_id] = [(catalog, plan) for _, catalog, _, plan in items]
+
+    def get_affordable(self, balances: Dict[int, int]) -> List[tuple]:
+        """ Catalog and plan of every row with cost not greater than player balance of its currency
+        :param balances: amount by currency id
+        :return:
+        """
+        affordable = []
+        for currency_id, costs in self.costs.items():
+            end = bisect_right(costs, balances.get(currency_id, 0))
+            affordable.extend(self.plans[currency_id][:end])
+        return affordable
+
+
+def get_available(index: PriceIndex, state: domain.PlayerState) -> Dict[str, List[domain.ActionPlan]]:
+    """ Rows player can afford now, with owned requirements and enough authority. Owned items are skipped,
+    requirements are checked only for catalogs where the game checks them
+    :param index:
+    :param state:
+    :return: plans by catalog
+    """
+    available = {catalog: [] for catalog in CATALOG_ENTITIES}
+    for catalog, plan in index.get_affordable(state.balances):
+        if plan.min_authority > state.authority:
+            continue
+        if catalog in domain.ITEM_KINDS and domain.owns(state, plan):
+            continue
+        if plan.kind in domain.CHECKED_REQUIREMENT_KINDS and domain.get_missing_requirement(state, plan):
+            continue
+        available[catalog].append(plan)
+    return available
+
+
+async def get_price_index(session: AsyncSession) -> PriceIndex:
+    """ Price index of current catalogs, cached by catalog versions
+    :param session:
+    :return:
+    """
+    versions, snapshots = await load_catalog_snapshots(session=session)
+
+    async def build() -> PriceIndex:
+        return PriceIndex(get_catalog_plans(snapshots))
+
+    return await catalog_cache.get_or_load(PriceIndex, versions, build)
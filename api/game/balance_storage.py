@@ -0,0 +1,86 @@
+from config import logger
+from core.engine import async_session_maker, engine
+from core import repository_entity
+from game import models
+from sqlalchemy import event, select
+
+import argparse
+import asyncio
+import json
+import time
+
+
+STORAGES = ("rows", "vector")
+
+
+async def copy_balances(storage: str) -> None:
+    """ Copy balances of all players to storage, run before switching BALANCE_STORAGE
+    :param storage: rows or vector
+    :return:
+    """
+    async with async_session_maker() as session:
+        player_repository = repository_entity.PlayerEntity(session=session)
+        if storage == "vector":
+            await player_repository.copy_balances_to_vector()
+        else:
+            await player_repository.copy_balances_to_rows()
+
+
+async def benchmark(players: int = 1000, profile: str = "action") -> dict:
+    """ Statements, rows and time of player loads by profile for both balance storages.
+    Balance vectors should be filled by copy_balances first
+    :param players: number of players to load
+    :param profile: PlayerEntity load profile
+    :return:
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(select(models.Player.id).order_by(models.Player.id).limit(players))
+        player_ids = result.scalars().all()
+
+    report = {"players": len(player_ids), "profile": profile}
+    counters = {"statements": 0, "rows": 0}
+
+    def count_statement(*args) -> None:
+        counters["statements"] += 1
+
+    def count_row(session, instance) -> None:
+        counters["rows"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+    try:
+        for storage in STORAGES:
+            counters.update(statements=0, rows=0)
+            start = time.perf_counter()
+            for player_id in player_ids:
+                async with async_session_maker() as session:
+                    event.listen(session.sync_session, "loaded_as_persistent", count_row)
+                    await repository_entity.PlayerEntity(session=session).get_player_by_id(
+                        player_id, profile=profile, storage=storage
+                    )
+            seconds = time.perf_counter() - start
+            loads = len(player_ids) or 1
+            report[storage] = {
+                "statements_per_load": round(counters["statements"] / loads, 2),
+                "rows_per_load": round(counters["rows"] / loads, 2),
+                "ms_per_load": round(seconds / loads * 1000, 3),
+            }
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count_statement)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Player balance storage: copy balances or benchmark loads")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    copy_parser = subparsers.add_parser("copy")
+    copy_parser.add_argument("storage", choices=STORAGES)
+    benchmark_parser = subparsers.add_parser("benchmark")
+    benchmark_parser.add_argument("--players", type=int, default=1000)
+    benchmark_parser.add_argument("--profile", default="action")
+    args = parser.parse_args()
+
+    if args.command == "copy":
+        logger.debug(f"Copy player balances to {args.storage}")
+        asyncio.run(copy_balances(args.storage))
+    else:
+        print(json.dumps(asyncio.run(benchmark(players=args.players, profile=args.profile)), indent=2))
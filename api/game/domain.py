@@ -0,0 +1,227 @@
+from dataclasses import dataclass, field
+from game import exceptions
+from game.rng import PlayerRandom
+from typing import Dict, List, Set, Tuple
+
+
+STATS = ("hunger", "rest", "health")
+PLAYER_FIELDS = ("hunger", "rest", "health", "authority", "day", "age", "deadly_days", "alive")
+ITEM_KINDS = ("transport", "home", "skill", "business")
+REQUIREMENT_KINDS = ("transport", "home", "skill")
+# Catalogs whose requirements are checked by the game, transport and leisure rows only store skill_id
+CHECKED_REQUIREMENT_KINDS = ("work", "streetaction", "business")
+PLAN_FIELDS = (
+    "id", "name", "currency_id", "price", "income_min", "income_max", "min_authority",
+    "transport_id", "home_id", "skill_id", "authority_benefit_min", "authority_benefit_max",
+    *(f"{stat}_{effect}_{bound}" for stat in STATS for effect in ("benefit", "harm") for bound in ("min", "max")),
+)
+
+
+@dataclass(slots=True)
+class PlayerState:
+    """ Player values used by game rules, without db instrumentation
+    """
+    hunger: int
+    rest: int
+    health: int
+    authority: int
+    day: int
+    age: int
+    deadly_days: int
+    alive: bool
+    rng: PlayerRandom
+    balances: Dict[int, int] = field(default_factory=dict)
+    owned: Dict[str, Set[int]] = field(default_factory=lambda: {kind: set() for kind in ITEM_KINDS})
+
+
+@dataclass(slots=True, frozen=True)
+class ActionPlan:
+    """ Rules of one catalog row, compiled once: required items, stat and income rolls, currency and cost
+    """
+    id: int
+    name: str
+    kind: str
+    currency_id: int | None
+    requirements: Tuple[Tuple[str, int], ...]
+    stat_rolls: Tuple[Tuple[str, int, int, int], ...]
+    authority_roll: Tuple[int, int] | None
+    cost: int
+    income_roll: Tuple[int, int] | None
+    min_authority: int
+
+    def __str__(self):
+        return self.name
+
+
+def compile_plan(kind: str, row) -> ActionPlan:
+    """ Compile catalog row into action plan. Benefit ranges of services are added to stats,
+    harm ranges of actions are subtracted. Row fields missing in catalog are skipped
+    :param kind: transport, home, skill, business, work, streetaction, food, health, leisure
+    :param row: catalog row
+    :return:
+    """
+    values = {name: getattr(row, name, None) for name in PLAN_FIELDS}
+
+    requirements = tuple(
+        (requirement, values[f"{requirement}_id"])
+        for requirement in REQUIREMENT_KINDS if values[f"{requirement}_id"]
+    )
+
+    stat_rolls = ()
+    for effect, sign in (("benefit", 1), ("harm", -1)):
+        if values[f"hunger_{effect}_min"] is not None:
+            stat_rolls = tuple(
+                (stat, values[f"{stat}_{effect}_min"], values[f"{stat}_{effect}_max"], sign)
+                for stat in STATS
+                if values[f"{stat}_{effect}_min"] is not None and values[f"{stat}_{effect}_max"] is not None
+            )
+            break
+
+    authority_roll = None
+    if values["authority_benefit_min"] and values["authority_benefit_max"]:
+        authority_roll = (values["authority_benefit_min"], values["authority_benefit_max"])
+
+    income_roll = None
+    if not values["price"] and values["income_min"] is not None and values["income_max"] is not None:
+        income_roll = (values["income_min"], values["income_max"])
+
+    return ActionPlan(
+        id=values["id"],
+        name=values["name"],
+        kind=kind,
+        currency_id=values["currency_id"],
+        requirements=requirements,
+        stat_rolls=stat_rolls,
+        authority_roll=authority_roll,
+        cost=values["price"] or 0,
+        income_roll=income_roll,
+        min_authority=values["min_authority"] or 0,
+    )
+
+
+def roll_stats(plan: ActionPlan, rng: PlayerRandom) -> Dict[str, int | None]:
+    """ Random stat changes of plan, authority is None when plan has no authority roll
+    :param plan:
+    :param rng: player random stream
+    :return:
+    """
+    changes = {
+        stat: sign * rng.randint(min_value, max_value)
+        for stat, min_value, max_value, sign in plan.stat_rolls
+    }
+    changes["authority"] = rng.randint(*plan.authority_roll) if plan.authority_roll else None
+    return changes
+
+
+def roll_balance_change(plan: ActionPlan, rng: PlayerRandom) -> int:
+    """ Cost of purchase as negative amount or random income of action
+    :param plan:
+    :param rng: player random stream
+    :return:
+    """
+    if plan.cost:
+        return -plan.cost
+    if plan.income_roll:
+        return rng.randint(*plan.income_roll)
+    return 0
+
+
+def count_rolls(plan: ActionPlan) -> int:
+    """ Number of random draws of one plan execution (stats and balance change)
+    :param plan:
+    :return:
+    """
+    return len(plan.stat_rolls) + bool(plan.authority_roll) + bool(not plan.cost and plan.income_roll)
+
+
+def change_stats(state: PlayerState, changes: Dict[str, int | None]) -> None:
+    for attr, value in changes.items():
+        if value:
+            setattr(state, attr, getattr(state, attr) + value)
+
+
+def change_balance(state: PlayerState, currency_id: int, amount: int) -> None:
+    if currency_id in state.balances:
+        state.balances[currency_id] += amount
+
+
+def get_net_balance_changes(state: PlayerState, changes: List[Tuple[int, int]]) -> Dict[int, int]:
+    """ Net amount by currency of balance changes collected for one statement. Credits to currencies
+    without player balance are dropped as change_balance does, debits stay and fail the money guard
+    :param state:
+    :param changes: currency id and amount
+    :return:
+    """
+    amounts = {}
+    for currency_id, amount in changes:
+        amounts[currency_id] = amounts.get(currency_id, 0) + amount
+    return {
+        currency_id: amount for currency_id, amount in amounts.items()
+        if currency_id in state.balances or amount < 0
+    }
+
+
+def check_money(state: PlayerState, currency_id: int, amount: int, message: str) -> None:
+    """ Raise NoMoneyError if balance of currency is less than amount
+    :param state:
+    :param currency_id:
+    :param amount:
+    :param message:
+    :return:
+    """
+    if state.balances.get(currency_id, 0) < amount:
+        raise exceptions.NoMoneyError(message)
+
+
+def get_missing_requirement(state: PlayerState, plan: ActionPlan) -> str | None:
+    """ First of transport, home or skill required by plan and not owned by player
+    :param state:
+    :param plan:
+    :return: kind of item or None
+    """
+    for kind, item_id in plan.requirements:
+        if item_id not in state.owned[kind]:
+            return kind
+    return None
+
+
+def get_checked_requirements(plan: ActionPlan) -> Tuple[Tuple[str, int], ...]:
+    """ Requirements of plan which the game checks before the action
+    :param plan:
+    :return:
+    """
+    return plan.requirements if plan.kind in CHECKED_REQUIREMENT_KINDS else ()
+
+
+def owns(state: PlayerState, plan: ActionPlan) -> bool:
+    return plan.id in state.owned[plan.kind]
+
+
+def check_dead(state: PlayerState) -> None:
+    """ Clamp stats, count days with empty stat, player dies after 7 such days in a row
+    :param state:
+    :return:
+    """
+    dead_mode = False
+
+    for attr in STATS:
+        if getattr(state, attr) <= 0:
+            setattr(state, attr, 0)
+            dead_mode = True
+        elif getattr(state, attr) >= 100:
+            setattr(state, attr, 100)
+
+    if dead_mode:
+        state.deadly_days += 1
+    elif state.deadly_days:
+        state.deadly_days = 0
+
+    if state.deadly_days > 7:
+        state.alive = False
+
+
+def next_day(state: PlayerState) -> None:
+    state.day += 1
+    if 365 % state.day == 0:
+        state.age += 1
+    check_dead(state)
@@ -20,3 +20,14 @@ class AlreadyExistError(Exception):
 
 class NoPossibilityError(Exception):
     ...
+
+
+class ConflictError(Exception):
+    ...
+
+
+class PlanStepError(Exception):
+    def __init__(self, step: int, error: Exception):
+        super(PlanStepError, self).__init__(str(error))
+        self.step = step
+        self.error = error
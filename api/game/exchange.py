@@ -0,0 +1,104 @@
+from config import logger, EXCHANGE_TICKER, EXCHANGE_TICK_SECONDS
+from core.engine import async_session_maker
+from core.repository_entity import CurrencyEntity
+from typing import List, Tuple
+
+import asyncio
+
+
+class ExchangeRates:
+    """ In-memory exchange rate table filled by the ticker, requests read it without db.
+    Every rate keeps the table version of its last change, so streams send only newer rates
+    """
+
+    def __init__(self):
+        self.rates = {}
+        self.version = 0
+        self._changed = asyncio.Event()
+
+    def update(self, rows: List[Tuple[int, int, int | None]]) -> None:
+        """ Apply currency id, exchange currency id, exchange price rows
+        :param rows:
+        :return:
+        """
+        changed = False
+        for currency_id, exchange_currency_id, price in rows:
+            if price is None:
+                continue
+            rate = self.rates.get(currency_id)
+            if rate and rate["price"] == price and rate["exchange_currency_id"] == exchange_currency_id:
+                continue
+            if not changed:
+                self.version += 1
+                changed = True
+            self.rates[currency_id] = {
+                "currency_id": currency_id,
+                "exchange_currency_id": exchange_currency_id,
+                "price": price,
+                "version": self.version,
+            }
+
+        if changed:
+            event, self._changed = self._changed, asyncio.Event()
+            event.set()
+
+    def get_changes(self, since: int = 0) -> List[dict]:
+        """ Rates changed after table version since
+        :param since:
+        :return:
+        """
+        return [rate for rate in self.rates.values() if rate["version"] > since]
+
+    def convert(self, from_currency_id: int, to_currency_id: int, amount: int) -> Tuple[int, int, int] | None:
+        """ Exchange amount of from currency by the current price. Buying currency with the price
+        spends whole units only
+        :param from_currency_id:
+        :param to_currency_id:
+        :param amount: amount of from currency
+        :return: debit, credit and price or None if currencies are not exchanged
+        """
+        rate = self.rates.get(from_currency_id)
+        if rate and rate["exchange_currency_id"] == to_currency_id:
+            return amount, amount * rate["price"], rate["price"]
+
+        rate = self.rates.get(to_currency_id)
+        if rate and rate["exchange_currency_id"] == from_currency_id:
+            credit = amount // rate["price"]
+            return credit * rate["price"], credit, rate["price"]
+        return None
+
+    async def wait_changes(self, since: int, timeout: float) -> bool:
+        """ Wait for table version newer than since
+        :param since:
+        :param timeout: seconds
+        :return: False on timeout
+        """
+        if self.version > since:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+exchange_rates = ExchangeRates()
+
+
+async def run_exchange_ticker() -> None:
+    """ Move exchange rates every EXCHANGE_TICK_SECONDS. With EXCHANGE_TICKER off the process
+    only reloads rates moved by another one
+    :return:
+    """
+    while True:
+        try:
+            async with async_session_maker() as session:
+                repository = CurrencyEntity(session=session)
+                if EXCHANGE_TICKER:
+                    rows = await repository.walk_exchange_rates()
+                else:
+                    rows = await repository.get_exchange_rates()
+            exchange_rates.update(rows)
+        except Exception as e:
+            logger.error(f"Exchange ticker error: {e}")
+        await asyncio.sleep(EXCHANGE_TICK_SECONDS)
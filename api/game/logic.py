@@ -1,14 +1,36 @@
 from abc import abstractmethod
 from core import repository_entity
-from config import logger
-from game import models, exceptions
+from config import (
+    logger,
+    BALANCE_STORAGE,
+    GAME_EXECUTION_MODE,
+    GAME_CONFLICT_RETRIES,
+    GAME_CONFLICT_BACKOFF_MS,
+    GAME_CONFLICT_BACKOFF_MAX_MS,
+)
+from datetime import datetime
+from game import availability, domain, models, exceptions, requirements, search
+from game.exchange import exchange_rates
+from game.market import market_engine, settle_pending, BookOrder
+from game.rng import PlayerRandom
+from sqlalchemy import update, select, exists, case, or_, literal, func, ARRAY, Integer
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Union
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+from typing import Dict, List, Set, Tuple, Union
 from users.models import User
 
+import asyncio
 import random
 
 
+conflict_stats = {
+    "conflicts": 0,
+    "retries": 0,
+    "failures": 0,
+}
+
+
 class BaseGame:
     @abstractmethod
     def next_day(self):
@@ -24,14 +46,20 @@ class BaseGame:
 
 
 class UserMixin:
+    player_profile = "base"
+    collect_income = False
 
     @staticmethod
     def get_current_player(func):
-        def wrapper(self, *args, **kwargs):
-            self.player = self.get_player()
+        async def wrapper(self, *args, **kwargs):
+            self.player = await self.get_player()
             if not self.player:
                 raise exceptions.PlayerException(f"Player is not found")
-            result = func(self, *args, **kwargs)
+            self.state = self.map_player(self.player)
+            logger.debug(f"{self.user.email} day {self.state.day} random counter {self.state.rng.counter}")
+            if self.collect_income:
+                await self.collect_business_income()
+            result = await func(self, *args, **kwargs)
             return result
 
         return wrapper
@@ -39,171 +67,426 @@ class UserMixin:
     def __init__(self, user: User):
         self.user = user
         self.player = None
+        self.state = None
 
-    def get_player(self) -> models.Player | None:
-        """ Get item player by current user
+    async def get_player(self, fields: Tuple[str, ...] | None = None) -> models.Player | None:
+        """ Get active player by current user with relationships of player_profile
+        :param fields: PlayerSchema fields to load instead of player_profile
         :return: item player
         """
-        try:
-            return self.user.players[-1]
-        except IndexError:
+        player_repository = repository_entity.PlayerEntity(session=self.session)
+        player = await player_repository.get_active_player(
+            user_id=self.user.id, profile=self.player_profile, fields=fields
+        )
+        if not player:
             logger.error(f"Player is not exist for user - {self.user.email}")
+        return player
 
-    def get_player_items_list(
-            self,
-            items_name: str
-    ) -> List[Union[models.Transport, models.Skill, models.Home]]:
-        if hasattr(self.player, f"{items_name}_list"):
-            return getattr(self.player, f"{items_name}_list")
-        else:
-            return getattr(self.player, f"{items_name}s")
-        
-    def _check_dead(self) -> None:
-        """ Check if player is dead
+    def map_player(self, player: models.Player) -> domain.PlayerState:
+        """ Player state for game rules, balances which are not loaded by profile stay empty
+        :param player:
         :return:
         """
-        dead_mode = False
+        state = domain.PlayerState(
+            hunger=player.hunger,
+            rest=player.rest,
+            health=player.health,
+            authority=player.authority,
+            day=player.day,
+            age=player.age,
+            deadly_days=player.deadly_days,
+            alive=player.alive,
+            rng=PlayerRandom(seed=player.rng_seed, counter=player.rng_counter),
+            owned=repository_entity.PlayerEntity.get_owned_ids(player)
+        )
+        balances = repository_entity.PlayerEntity.get_balance_amounts(player)
+        if balances is not None:
+            state.balances = balances
+        return state
 
-        for attr in ("hunger", "rest", "health"):
-            if getattr(self.player, attr) <= 0:
-                setattr(self.player, attr, 0)
-                dead_mode = True
-            elif getattr(self.player, attr) >= 100:
-                setattr(self.player, attr, 100)
+    def map_out_player(self) -> None:
+        """ Write changed player state values to player, its balances and owned items
+        :return:
+        """
+        for attr in domain.PLAYER_FIELDS:
+            value = getattr(self.state, attr)
+            if getattr(self.player, attr) != value:
+                setattr(self.player, attr, value)
+        if self.player.rng_counter != self.state.rng.counter:
+            self.player.rng_counter = self.state.rng.counter
+
+        player_repository = repository_entity.PlayerEntity(session=self.session)
+        player_repository.set_balance_amounts(self.player, self.state.balances)
+        player_repository.set_owned_ids(self.player, self.state.owned)
+        self.session.add(self.player)
 
-        if dead_mode:
-            self.player.deadly_days += 1
-        else:
-            if self.player.deadly_days:
-                self.player.deadly_days = 0
 
-        if self.player.deadly_days > 7:
-            self.player.alive = False
+class Game(BaseGame, UserMixin):
+    # Business income is collected when player is loaded by actions, read only requests show saved balances
+    collect_income = True
+
+    @staticmethod
+    def retry_on_conflict(func):
+        """ Re-run game action when player or balance version check failed on commit,
+        with jittered exponential backoff between attempts
+        """
+        async def wrapper(self, *args, **kwargs):
+            for attempt in range(1, GAME_CONFLICT_RETRIES + 1):
+                try:
+                    return await func(self, *args, **kwargs)
+                except StaleDataError as e:
+                    conflict_stats["conflicts"] += 1
+                    await self.session.rollback()
+                    await self.session.refresh(self.user)
+                    self.reset_changes()
+                    if attempt == GAME_CONFLICT_RETRIES:
+                        conflict_stats["failures"] += 1
+                        logger.warning(f"{self.user.email} action conflict, retries exceeded: {e}")
+                        raise exceptions.ConflictError("Player was changed by another request, try again")
+                    conflict_stats["retries"] += 1
+                    backoff_ms = min(GAME_CONFLICT_BACKOFF_MS * 2 ** attempt, GAME_CONFLICT_BACKOFF_MAX_MS)
+                    await asyncio.sleep(random.uniform(0, backoff_ms) / 1000)
 
+        return wrapper
 
-class Game(BaseGame, UserMixin):
     def __init__(self, session: AsyncSession, user: User):
         super(Game, self).__init__(user=user)
         self.session = session
         self.user = user
         self.repository = None
         self.object_model = None
+        self.atomic = GAME_EXECUTION_MODE == "atomic"
+        self.reset_changes()
+
+    @property
+    def object_model(self):
+        return self._object_model
+
+    @object_model.setter
+    def object_model(self, value) -> None:
+        """ Catalog row of action, action plan is its compiled rules
+        :param value:
+        :return:
+        """
+        self._object_model = value
+        self.action_plan = self.repository.get_action_plan(value) if value is not None else None
+
+    def use_orm_mode(self) -> None:
+        """ Continue loaded request in orm mode, balance changes collected for atomic statement
+        (business income of load) are applied to player state
+        :return:
+        """
+        if not self.atomic:
+            return
+        self.atomic = False
+        for currency_id, amount in self.balance_changes:
+            domain.change_balance(self.state, currency_id=currency_id, amount=amount)
+        self.reset_changes()
+
+    def reset_changes(self) -> None:
+        """ Drop collected atomic mode changes
+        :return:
+        """
+        self.stat_changes = {"hunger": 0, "rest": 0, "health": 0, "authority": 0}
+        self.balance_changes = []
+        self.next_day_pending = False
+
+    async def save(self) -> None:
+        """ Commit player changes. In atomic mode they are written by one guarded statement first
+        :return:
+        """
+        new_items = self.get_new_items()
+        if new_items:
+            await repository_entity.PlayerEntity(session=self.session).add_owned_items(
+                self.player.id, new_items, day=self.state.day + int(self.next_day_pending)
+            )
+        if self.atomic:
+            await self._execute_atomic(new_items=new_items)
+        else:
+            self.map_out_player()
+        await self.session.commit()
+
+    def get_new_items(self) -> Dict[str, List[int]]:
+        """ Items bought by this request, owned by state but not by player arrays
+        :return: ids by kind
+        """
+        new_items = {}
+        owned = repository_entity.PlayerEntity.get_owned_ids(self.player)
+        for kind, item_ids in self.state.owned.items():
+            if item_ids - owned[kind]:
+                new_items[kind] = sorted(item_ids - owned[kind])
+        return new_items
 
     def next_day(self) -> None:
         """ Set next day
         :return:
         """
         logger.debug(f"{self.user.email} Set next day")
-        self.player.day += 1
-        if 365 % self.player.day == 0:
-            self.player.age += 1
-        self._check_dead()
-        self.session.add(self.player)
+        if self.atomic:
+            self.next_day_pending = True
+            return
+        domain.next_day(self.state)
 
-    def update_balance(self) -> None:
+    def update_balance(self) -> int:
         """ Updated player balance after work or street action
+        :return: balance change amount
+        """
+        amount = domain.roll_balance_change(self.action_plan, self.state.rng)
+        if amount < 0 and not self.atomic:
+            self._check_balance(purchased_object=self.action_plan)
+        self.change_balance(currency_id=self.action_plan.currency_id, amount=amount)
+        return amount
+
+    def change_balance(self, currency_id: int, amount: int) -> None:
+        """ Add amount to player balance of currency, in atomic mode collect it for the guarded statement
+        :param currency_id:
+        :param amount:
         :return:
         """
-        mode = "increment"
-        if hasattr(self.object_model, "price") and self.object_model.price:
-            amount = -self.object_model.price
-            mode = "decrement"
-        else:
-            amount: int = self._get_random_value(
-                min_value=self.object_model.income_min,
-                max_value=self.object_model.income_max
+        if self.atomic:
+            self.balance_changes.append((currency_id, amount))
+            return
+        domain.change_balance(self.state, currency_id=currency_id, amount=amount)
+
+    async def collect_business_income(self) -> None:
+        """ Pay business income accrued since last collection: floor((day - last) / income_period) * income.
+        Runs when player is loaded, so the income is on balance before the action checks money.
+        Last collected day is moved by whole periods only, business without it starts accrual from current day.
+        One statement for all player businesses, nothing is stored per day
+        :return:
+        """
+        day = self.state.day
+        business_table = models.Business.__table__
+        owned = models.business_player.alias("owned")
+        accrued = select(
+            owned.c.business_id,
+            owned.c.last_collected_day,
+            business_table.c.income,
+            business_table.c.income_period,
+            business_table.c.currency_id,
+        ).join(
+            business_table, business_table.c.id == owned.c.business_id
+        ).filter(
+            owned.c.player_id == self.player.id,
+            business_table.c.income_period > 0,
+            or_(
+                owned.c.last_collected_day.is_(None),
+                day - owned.c.last_collected_day >= business_table.c.income_period
             )
-        for balance in self.player.balances:
-            if balance.currency.id == self.object_model.currency_id:
-                if mode == "decrement":
-                    self._check_balance(balance=balance, purchased_object=self.object_model)
-                balance.amount += amount
-                self.session.add(balance)
+        ).subquery("accrued")
+
+        periods = (day - accrued.c.last_collected_day) // accrued.c.income_period
+        query = update(models.business_player).filter(
+            models.business_player.c.player_id == self.player.id,
+            models.business_player.c.business_id == accrued.c.business_id
+        ).values(
+            last_collected_day=case(
+                (accrued.c.last_collected_day.is_(None), day),
+                else_=accrued.c.last_collected_day + periods * accrued.c.income_period
+            )
+        ).returning(
+            accrued.c.currency_id,
+            func.coalesce(periods * accrued.c.income, 0)
+        )
+        result = await self.session.execute(query)
+
+        currency_amounts = {}
+        for currency_id, amount in result:
+            if amount:
+                currency_amounts[currency_id] = currency_amounts.get(currency_id, 0) + amount
+        for currency_id, amount in currency_amounts.items():
+            logger.debug(f"{self.user.email} Business income {amount} of currency id {currency_id}")
+            self.change_balance(currency_id=currency_id, amount=amount)
 
     def check_availability(self) -> None:
         """ Checking the player's transport, home or skill availability
         :return:
         """
-        possibility_list = ("transport", "home", "skill")
-
-        for possibility in possibility_list:
-            if not self._check_availability(possibility_str=possibility):
-                raise exceptions.NoPossibilityError(
-                    f"You do not have suitable {possibility} - {getattr(self.object_model, possibility)}"
-                )
-
-    def get_player_items_list(self, items_name):
-        return super(Game, self).get_player_items_list(items_name=items_name)
+        possibility = domain.get_missing_requirement(self.state, self.action_plan)
+        if possibility:
+            raise exceptions.NoPossibilityError(
+                f"You do not have suitable {possibility} - {getattr(self.object_model, possibility)}"
+            )
 
-    def _check_dead(self):
-        super(Game, self)._check_dead()
-    
-    def _check_availability(self, possibility_str: str) -> bool:
-        """ Checking item availability
-        :param possibility_str:
+    def change_player_stats(self, **changes: int | None) -> None:
+        """ Add changes to player stats, in atomic mode collect them for the guarded statement
+        :param changes: hunger, rest, health, authority values
         :return:
         """
-        if not hasattr(self.object_model, possibility_str):
-            return True
-
-        possibility = getattr(self.object_model, possibility_str)
-        player_possibility_list = self.get_player_items_list(items_name=possibility_str)
+        if not self.atomic:
+            domain.change_stats(self.state, changes)
+            return
+        for attr, value in changes.items():
+            if value:
+                self.stat_changes[attr] += value
+
+    async def _execute_atomic(self, new_items: Dict[str, List[int]]) -> None:
+        """ Update balances and player in one statement: balance updates are CTEs,
+        debits are guarded by amount and player is updated only if all of them updated a row.
+        Credits to currencies without player balance are dropped as in orm mode.
+        Random draws are guarded by the loaded counter, the action is re-run if another request moved it.
+        With vector balance storage balances are elements of the same player update with the same guards.
+        Player stats, next day and dead checks are computed in SQL from the current row
+        :param new_items: bought item ids by kind, appended to player arrays
+        :return:
+        """
+        balance_table = models.Balance.__table__
+        player_table = models.Player.__table__
+        player_columns = player_table.c
+
+        currency_amounts = domain.get_net_balance_changes(self.state, self.balance_changes)
+
+        query = update(player_table).filter(player_columns.id == self.player.id)
+        vector_values = {}
+        for index, (currency_id, amount) in enumerate(currency_amounts.items()):
+            if BALANCE_STORAGE == "vector":
+                balance_amount = player_columns.balance_vector[currency_id]
+                if amount < 0:
+                    query = query.filter(balance_amount.isnot(None), balance_amount >= -amount)
+                vector_values[balance_amount] = balance_amount + amount
+                continue
+            balance_query = update(balance_table).filter(
+                balance_table.c.player_id == self.player.id,
+                balance_table.c.currency_id == currency_id
+            ).values(
+                amount=balance_table.c.amount + amount,
+                updated_at=datetime.now(),
+                version=balance_table.c.version + 1
+            )
+            if amount < 0:
+                balance_query = balance_query.filter(balance_table.c.amount >= -amount)
+            balance_cte = balance_query.returning(balance_table.c.id).cte(f"balance_{index}")
+            query = query.add_cte(balance_cte)
+            if amount < 0:
+                query = query.filter(exists(select(balance_cte.c.id)))
+
+        values = {
+            attr: getattr(player_columns, attr) + self.stat_changes[attr]
+            for attr in ("hunger", "rest", "health", "authority")
+        }
+        values["version"] = player_columns.version + 1
+        for kind, item_ids in new_items.items():
+            owned_ids = getattr(player_columns, f"owned_{kind}_ids")
+            values[f"owned_{kind}_ids"] = func.array_cat(owned_ids, literal(item_ids, ARRAY(Integer)))
+        rng_used = self.state.rng.counter != self.player.rng_counter
+        if rng_used:
+            # Draws were taken from the loaded counter, a concurrent request must not take them again
+            query = query.filter(player_columns.rng_counter == self.player.rng_counter)
+            values["rng_counter"] = self.state.rng.counter
+        if self.next_day_pending:
+            dead_mode = or_(*[values[attr] <= 0 for attr in ("hunger", "rest", "health")])
+            deadly_days = case((dead_mode, player_columns.deadly_days + 1), else_=0)
+            for attr in ("hunger", "rest", "health"):
+                values[attr] = case((values[attr] <= 0, 0), (values[attr] >= 100, 100), else_=values[attr])
+            values.update(
+                day=player_columns.day + 1,
+                age=player_columns.age + case((literal(365) % (player_columns.day + 1) == 0, 1), else_=0),
+                deadly_days=deadly_days,
+                alive=case((deadly_days > 7, False), else_=player_columns.alive),
+            )
 
-        if possibility and possibility in player_possibility_list:
-            return True
-        elif not possibility:
-            return True
+        returning = [getattr(player_columns, attr) for attr in values]
+        query = query.values(**values)
+        if vector_values:
+            query = query.values(vector_values)
+        if BALANCE_STORAGE == "vector":
+            returning.append(player_columns.balance_vector)
+        query = query.returning(*returning)
+        result = await self.session.execute(query)
+        row = result.first()
+
+        if row is None:
+            if rng_used:
+                rng_counter = await self.session.scalar(
+                    select(player_columns.rng_counter).filter(player_columns.id == self.player.id)
+                )
+                if rng_counter != self.player.rng_counter:
+                    message = f"Player {self.player.id} random counter was changed by another request"
+                    await self.session.rollback()
+                    raise StaleDataError(message)
+            logger.warning(
+                f"{self.user.email} does not have enough money "
+                f"for balance changes {currency_amounts} ({self.object_model})"
+            )
+            await self.session.rollback()
+            raise exceptions.NoMoneyError("You do not have enough money to make this purchase")
 
-        return False
+        for attr, value in row._mapping.items():
+            set_committed_value(self.player, attr, value)
+            if attr in domain.PLAYER_FIELDS:
+                setattr(self.state, attr, value)
+        if BALANCE_STORAGE == "vector":
+            self.state.balances = repository_entity.PlayerEntity.get_balance_amounts(self.player)
+        self.reset_changes()
 
-    def _check_balance(
-            self,
-            balance: models.Balance,
-            purchased_object: Union[
-                models.Food,
-                models.Home,
-                models.Skill,
-                models.Leisure,
-                models.Business,
-                models.Transport,
-                models.Health
-            ]
-    ) -> None:
+    def _check_balance(self, purchased_object: domain.ActionPlan) -> None:
         """ Check balance before purchasing
-        :param balance:
         :param purchased_object:
         :return:
         """
-        if balance.amount < purchased_object.price:
+        try:
+            domain.check_money(
+                self.state,
+                currency_id=purchased_object.currency_id,
+                amount=purchased_object.cost,
+                message="You do not have enough money to make this purchase"
+            )
+        except exceptions.NoMoneyError:
             logger.warning(
                 f"{self.user.email} does not have enough money "
                 f"to purchase {purchased_object} (id - {purchased_object.id})"
             )
-            raise exceptions.NoMoneyError("You do not have enough money to make this purchase")
+            raise
 
-    def _get_authority_benefit(self) -> int | None:
-        """ Check authority_benefit fields and get random value
+    def _check_currency_amount(self, currency_id: int, amount: int) -> None:
+        """ Check player balance of currency before exchange or order
+        :param currency_id:
+        :param amount:
         :return:
         """
-        authority_benefit = None
-        if hasattr(self.object_model, "authority_benefit_min") \
-                and hasattr(self.object_model, "authority_benefit_max"):
-            if not self.object_model.authority_benefit_min or not self.object_model.authority_benefit_max:
-                return
-            authority_benefit = self._get_random_value(
-                min_value=self.object_model.authority_benefit_min,
-                max_value=self.object_model.authority_benefit_max
+        if currency_id not in self.state.balances:
+            raise exceptions.NotFoundException(f"Balance is not found")
+        try:
+            domain.check_money(
+                self.state,
+                currency_id=currency_id,
+                amount=amount,
+                message="You do not have enough money to make this exchange"
             )
-        return authority_benefit
+        except exceptions.NoMoneyError:
+            logger.warning(f"{self.user.email} does not have enough money to exchange {amount}")
+            raise
 
-    @staticmethod
-    def _get_random_value(min_value: int, max_value: int) -> int:
-        """ Random(min, max)
-        :param min_value:
-        :param max_value:
+    async def get_catalog_list(self) -> list:
+        """ Catalog list of the game repository
+        :return:
+        """
+        return await self.repository.get_objects_list()
+
+    async def get_catalog_page(self, **params) -> list:
+        """ Keyset page of catalog filtered in db, params of repository get_objects_page
+        :param params:
         :return:
         """
-        return random.randint(min_value, max_value)
+        return await self.repository.get_objects_page(**params)
+
+    async def get_catalog_version(self) -> int:
+        """ Catalog version of the game repository
+        :return:
+        """
+        return await self.repository.get_version()
+
+    async def get_catalog_changes(
+            self,
+            since: int,
+            fields: Tuple[str, ...] | None = None
+    ) -> Tuple[int, list, List[int]]:
+        """ Catalog rows changed and ids deleted after version since
+        :param since: catalog version
+        :param fields: columns of changed rows to load, all when None
+        :return: current version, changed rows, deleted ids
+        """
+        return await self.repository.get_changes(since=since, fields=fields)
 
     async def _get_by_id(
             self,
@@ -239,27 +522,15 @@ class ItemGame(Game):
         self._check_object_in_player()
         self.update_balance()
 
-        object_name = str(self.object_model.__class__.__name__).lower()
-        item_list = self.get_player_items_list(items_name=object_name)
-
-        item_list.append(self.object_model)
+        self.state.owned[self.action_plan.kind].add(self.action_plan.id)
         self.next_day()
-        await self.session.commit()
 
     def _check_object_in_player(self) -> None:
         """ Checks if the player has an object
         :return:
         """
-        player_list_map = {
-            "Transport": self.player.transport_list,
-            "Home": self.player.home_list,
-            "Skill": self.player.skills,
-            "Business": self.player.business_list,
-        }
-
         object_name = self.object_model.__class__.__name__
-        player_list = player_list_map.get(object_name, None)
-        if self.object_model in player_list:
+        if domain.owns(self.state, self.action_plan):
             logger.warning(
                 f"{self.user.email} {object_name} {self.object_model} already exists"
             )
@@ -267,6 +538,8 @@ class ItemGame(Game):
 
 
 class ServicesGame(Game):
+    player_profile = "service"
+
     async def buy_service(self) -> None:
         """ Buy service (Health, Food, Leisure)
         :return:
@@ -278,87 +551,238 @@ class ServicesGame(Game):
         self._set_player_benefit()
         self.update_balance()
         self.next_day()
-        await self.session.commit()
 
     def _set_player_benefit(self) -> None:
         """ Set benefit for player
         :return:
         """
-        hunger_benefit: int = self._get_random_value(
-            min_value=self.object_model.hunger_benefit_min,
-            max_value=self.object_model.hunger_benefit_max
-        )
-        rest_benefit: int = self._get_random_value(
-            min_value=self.object_model.rest_benefit_min,
-            max_value=self.object_model.rest_benefit_max
-        )
-        health_benefit: int = self._get_random_value(
-            min_value=self.object_model.health_benefit_min,
-            max_value=self.object_model.health_benefit_max
-        )
-
-        authority_benefit: int = self._get_authority_benefit()
-
-        if hunger_benefit:
-            self.player.hunger += hunger_benefit
-        if rest_benefit:
-            self.player.rest += rest_benefit
-        if health_benefit:
-            self.player.health += health_benefit
-        if authority_benefit:
-            self.player.authority += authority_benefit
-
-        self.session.add(self.player)
+        self.change_player_stats(**domain.roll_stats(self.action_plan, self.state.rng))
 
 
 class ActionGame(Game):
-    async def perform_action(self) -> None:
-        """ Perform action (Work, Street action)
-        :return:
+    player_profile = "action"
+
+    async def perform_action(self, times: int = 1) -> List[dict]:
+        """ Perform action (Work, Street action) times days in a row without commit.
+        Stops early when player dies or action becomes unavailable.
+        Batch is applied to loaded player, so atomic mode is used for single actions only.
+        Rolls of all days are drawn from player random stream in one call
+        :param times: number of days
+        :return: player state after every day
         """
         if not self.object_model:
             raise exceptions.NotFoundException(
                 f"{self.object_model.__class__.__name__} is not found"
             )
 
-        self.check_availability()
-        self.set_player_harm()
-        self.update_balance()
-        self.next_day()
-        await self.session.commit()
+        if times > 1:
+            self.use_orm_mode()
+            self.state.rng.prefetch(times * domain.count_rolls(self.action_plan))
+
+        steps = []
+        for step in range(times):
+            try:
+                self.check_availability()
+            except exceptions.NoPossibilityError:
+                if not steps:
+                    raise
+                break
+
+            self.set_player_harm()
+            income = self.update_balance()
+            self.next_day()
+            steps.append(self._get_step_summary(income=income))
+
+            if not self.state.alive:
+                break
+
+        return steps
+
+    async def save_steps(self, steps: List[dict]) -> List[dict]:
+        """ Commit performed action days. In atomic mode player state is known after commit only,
+        so the last day summary is taken again
+        :param steps:
+        :return:
+        """
+        await self.save()
+        if self.atomic and steps:
+            steps[-1] = self._get_step_summary(income=steps[-1]["income"])
+        return steps
+
+    def _get_step_summary(self, income: int) -> dict:
+        """ Player state after action day
+        :param income:
+        :return:
+        """
+        return {
+            "day": self.state.day,
+            "income": income,
+            "hunger": self.state.hunger,
+            "rest": self.state.rest,
+            "health": self.state.health,
+            "authority": self.state.authority,
+            "alive": self.state.alive,
+        }
 
     def set_player_harm(self) -> None:
         """ Set harm for player
         :return:
         """
-        hunger_harm: int = self._get_random_value(
-            min_value=self.object_model.hunger_harm_min,
-            max_value=self.object_model.hunger_harm_max
-        )
-        rest_harm: int = self._get_random_value(
-            min_value=self.object_model.rest_harm_min,
-            max_value=self.object_model.rest_harm_max
+        self.change_player_stats(**domain.roll_stats(self.action_plan, self.state.rng))
+
+
+class Exchange(Game):
+    player_profile = "service"
+
+    @Game.retry_on_conflict
+    @Game.get_current_player
+    async def exchange(self, from_currency_id: int, to_currency_id: int, amount: int) -> dict:
+        """ Exchange player balances by the current exchange rate
+        :param from_currency_id:
+        :param to_currency_id:
+        :param amount: amount of from currency
+        :return: debit, credit and price of exchange
+        """
+        logger.debug(f"{self.user.email} Exchange {amount} of currency id {from_currency_id} to {to_currency_id}")
+        if from_currency_id not in self.state.balances or to_currency_id not in self.state.balances:
+            raise exceptions.NotFoundException(f"Balance is not found")
+        conversion = exchange_rates.convert(
+            from_currency_id=from_currency_id, to_currency_id=to_currency_id, amount=amount
         )
-        health_harm: int = self._get_random_value(
-            min_value=self.object_model.health_harm_min,
-            max_value=self.object_model.health_harm_max
+        if not conversion:
+            raise exceptions.NoPossibilityError(f"Currencies can not be exchanged")
+        debit, credit, price = conversion
+        if not credit:
+            raise exceptions.NoPossibilityError(f"Amount is too small for exchange")
+
+        if not self.atomic:
+            self._check_currency_amount(currency_id=from_currency_id, amount=debit)
+        self.change_balance(currency_id=from_currency_id, amount=-debit)
+        self.change_balance(currency_id=to_currency_id, amount=credit)
+        await self.save()
+        return {"debit": debit, "credit": credit, "price": price}
+
+    def get_rates(self) -> List[dict]:
+        """ Current exchange rates
+        :return:
+        """
+        return exchange_rates.get_changes()
+
+
+class Market(Game):
+    player_profile = "service"
+
+    def __init__(self, session: AsyncSession, user: User):
+        super(Market, self).__init__(session, user)
+        self.repository = repository_entity.OrderEntity(session=session)
+
+    @Game.retry_on_conflict
+    @Game.get_current_player
+    async def place_order(
+            self,
+            currency_id: int,
+            price_currency_id: int,
+            side: str,
+            price: int,
+            amount: int
+    ) -> dict:
+        """ Place limit order: reserve is taken from balance with order saving, then order is matched in book
+        :param currency_id: currency to buy or sell
+        :param price_currency_id: currency of price
+        :param side: bid or ask
+        :param price: price of one unit
+        :param amount:
+        :return: order id, filled amount and fills of order
+        """
+        logger.debug(f"{self.user.email} Place {side} {amount} of currency id {currency_id} by {price}")
+        if not market_engine.ready:
+            raise exceptions.NoPossibilityError(f"Market is not ready")
+        if currency_id == price_currency_id:
+            raise exceptions.NoPossibilityError(f"Currencies can not be exchanged")
+        if currency_id not in self.state.balances or price_currency_id not in self.state.balances:
+            raise exceptions.NotFoundException(f"Balance is not found")
+
+        book_order = BookOrder(
+            order_id=None,
+            player_id=self.player.id,
+            currency_id=currency_id,
+            price_currency_id=price_currency_id,
+            side=side,
+            price=price,
+            amount=amount
         )
+        reserve_currency_id, reserve = book_order.reserve
+        if not self.atomic:
+            self._check_currency_amount(currency_id=reserve_currency_id, amount=reserve)
+        self.change_balance(currency_id=reserve_currency_id, amount=-reserve)
+
+        order = self.repository.add(data={
+            "player_id": self.player.id,
+            "currency_id": currency_id,
+            "price_currency_id": price_currency_id,
+            "side": side,
+            "price": price,
+            "amount": amount,
+        })
+        await self.save()
+
+        book_order.id = order.id
+        fills = market_engine.submit(book_order)
+        return {
+            "order_id": order.id,
+            "filled": book_order.filled,
+            "fills": [{"price": fill_price, "amount": fill_amount} for _, _, fill_price, fill_amount in fills],
+        }
+
+    @Game.retry_on_conflict
+    @Game.get_current_player
+    async def cancel_order(self, order_id: int) -> None:
+        """ Cancel open order and return the reserve of its rest. Pending fills are settled before
+        :param order_id:
+        :return:
+        """
+        logger.debug(f"{self.user.email} Cancel order id {order_id}")
+        await settle_pending()
 
-        authority_benefit: int = self._get_authority_benefit()
+        book_order = market_engine.cancel(order_id=order_id, player_id=self.player.id)
+        if not book_order:
+            raise exceptions.NotFoundException(f"Order is not found")
 
-        if hunger_harm:
-            self.player.hunger -= hunger_harm
-        if rest_harm:
-            self.player.rest -= rest_harm
-        if health_harm:
-            self.player.health -= health_harm
-        if authority_benefit:
-            self.player.authority += authority_benefit
+        try:
+            reserve_currency_id, reserve = book_order.reserve
+            self.change_balance(currency_id=reserve_currency_id, amount=reserve)
+            await self.repository.set_status(order_id=order_id, status="cancelled")
+            await self.save()
+        except BaseException:
+            await self.session.rollback()
+            market_engine.restore(book_order)
+            raise
 
-        self.session.add(self.player)
+    @Game.get_current_player
+    async def get_orders(self) -> List[models.Order]:
+        """ Open orders of player
+        :return:
+        """
+        return await self.repository.get_player_orders(player_id=self.player.id)
+
+    @staticmethod
+    def get_depth(currency_id: int, price_currency_id: int, levels: int) -> dict:
+        """ Best price levels of currency pair book
+        :param currency_id:
+        :param price_currency_id:
+        :param levels:
+        :return:
+        """
+        book = market_engine.books.get((currency_id, price_currency_id))
+        if not book:
+            return {"bids": [], "asks": []}
+        return {"bids": book.get_depth("bid", levels), "asks": book.get_depth("ask", levels)}
 
 
 class Player(Game):
+    player_profile = "info"
+    collect_income = False
+
     def __init__(self, session: AsyncSession, user: User):
         self.default_player_data = {
             "hunger": 100,
@@ -385,24 +809,47 @@ class Player(Game):
             f"[Logic.Player] Add new player (id - {player_id}) by user id - {self.user.id}"
         )
 
-    async def get_info(self) -> models.Player | None:
-        """ Get player info
+    async def get_info(self, fields: Tuple[str, ...] | None = None) -> models.Player | None:
+        """ Get player info. With vector balance storage balances are built from player row
+        :param fields: PlayerSchema fields to load, all when None
+        :return:
+        """
+        player = await self.get_player(fields=fields)
+        if player and BALANCE_STORAGE == "vector" and (not fields or "balances" in fields):
+            balances = await repository_entity.PlayerEntity(session=self.session).get_balance_list(player)
+            set_committed_value(player, "balances", balances)
+        return player
+
+    async def has_player(self) -> bool:
+        """ Check if user already has a player
         :return:
         """
-        return self.get_player()
+        player = await self.repository.get_active_player(user_id=self.user.id)
+        return player is not None
 
 
 class Home(ItemGame):
+    player_profile = "home"
+
     def __init__(self, session: AsyncSession, user: User):
         super(Home, self).__init__(session, user)
         self.repository = repository_entity.HomeEntity(session=session)
 
+    @Game.retry_on_conflict
     @Game.get_current_player
     async def buy(self, home_id: int) -> None:
         """ Buy home
         :param home_id:
         :return:
         """
+        await self.apply(home_id=home_id)
+        await self.save()
+
+    async def apply(self, home_id: int) -> None:
+        """ Buy home for loaded player without commit
+        :param home_id:
+        :return:
+        """
         logger.debug(f"{self.user.email} Buy home id {home_id}")
         self.object_model: models.Home | None = await self._get_by_id(object_id=home_id)
         await self.buy_item()
@@ -415,16 +862,27 @@ class Home(ItemGame):
 
 
 class Skill(ItemGame):
+    player_profile = "skill"
+
     def __init__(self, session: AsyncSession, user: User):
         super(Skill, self).__init__(session, user)
         self.repository = repository_entity.SkillEntity(session=session)
 
+    @Game.retry_on_conflict
     @Game.get_current_player
     async def buy(self, skill_id: int) -> None:
         """ Buy skill
         :param skill_id:
         :return:
         """
+        await self.apply(skill_id=skill_id)
+        await self.save()
+
+    async def apply(self, skill_id: int) -> None:
+        """ Buy skill for loaded player without commit
+        :param skill_id:
+        :return:
+        """
         logger.debug(f"{self.user.email} Buy skill id {skill_id}")
         self.object_model: models.Skill | None = await self._get_by_id(object_id=skill_id)
         await self.buy_item()
@@ -437,16 +895,27 @@ class Skill(ItemGame):
 
 
 class Transport(ItemGame):
+    player_profile = "transport"
+
     def __init__(self, session: AsyncSession, user: User):
         super(Transport, self).__init__(session, user)
         self.repository = repository_entity.TransportEntity(session=session)
 
+    @Game.retry_on_conflict
     @Game.get_current_player
     async def buy(self, transport_id: int) -> None:
         """ Buy transport
         :param transport_id:
         :return:
         """
+        await self.apply(transport_id=transport_id)
+        await self.save()
+
+    async def apply(self, transport_id: int) -> None:
+        """ Buy transport for loaded player without commit
+        :param transport_id:
+        :return:
+        """
         logger.debug(f"{self.user.email} Buy transport id {transport_id}")
         self.object_model: models.Transport | None = await self._get_by_id(object_id=transport_id)
         await self.buy_item()
@@ -463,15 +932,26 @@ class StreetAction(ActionGame):
         super(StreetAction, self).__init__(session, user)
         self.repository = repository_entity.StreetActionEntity(session=session)
 
+    @Game.retry_on_conflict
     @Game.get_current_player
-    async def run(self, action_id: int) -> None:
+    async def run(self, action_id: int, times: int = 1) -> List[dict]:
         """ Perform street action
         :param action_id:
-        :return:
+        :param times: number of days in a row
+        :return: player state after every day
         """
-        logger.debug(f"{self.user.email} Perform street action id {action_id}")
+        steps = await self.apply(action_id=action_id, times=times)
+        return await self.save_steps(steps=steps)
+
+    async def apply(self, action_id: int, times: int = 1) -> List[dict]:
+        """ Perform street action for loaded player without commit
+        :param action_id:
+        :param times: number of days in a row
+        :return: player state after every day
+        """
+        logger.debug(f"{self.user.email} Perform street action id {action_id} {times} times")
         self.object_model: models.StreetAction | None = await self._get_by_id(object_id=action_id)
-        await self.perform_action()
+        return await self.perform_action(times=times)
 
     async def get_street_action_list(self) -> List[models.StreetAction]:
         """ StreetAction list
@@ -485,15 +965,26 @@ class Work(ActionGame):
         super(Work, self).__init__(session, user)
         self.repository = repository_entity.WorkEntity(session=session)
 
+    @Game.retry_on_conflict
     @Game.get_current_player
-    async def run(self, work_id: int) -> None:
+    async def run(self, work_id: int, times: int = 1) -> List[dict]:
         """ Perform work action
         :param work_id:
-        :return:
+        :param times: number of days in a row
+        :return: player state after every day
         """
-        logger.debug(f"{self.user.email} Perform work id {work_id}")
+        steps = await self.apply(work_id=work_id, times=times)
+        return await self.save_steps(steps=steps)
+
+    async def apply(self, work_id: int, times: int = 1) -> List[dict]:
+        """ Perform work action for loaded player without commit
+        :param work_id:
+        :param times: number of days in a row
+        :return: player state after every day
+        """
+        logger.debug(f"{self.user.email} Perform work id {work_id} {times} times")
         self.object_model: models.Work | None = await self._get_by_id(object_id=work_id)
-        await self.perform_action()
+        return await self.perform_action(times=times)
 
     async def get_work_list(self) -> List[models.Work]:
         """ Work list
@@ -507,15 +998,23 @@ class Food(ServicesGame):
         super(Food, self).__init__(session, user)
         self.repository = repository_entity.FoodEntity(session=session)
 
+    @Game.retry_on_conflict
     @Game.get_current_player
     async def buy(self, food_id: int) -> None:
         """ Buy food
         :param food_id:
         :return:
         """
+        await self.apply(food_id=food_id)
+        await self.save()
+
+    async def apply(self, food_id: int) -> None:
+        """ Buy food for loaded player without commit
+        :param food_id:
+        :return:
+        """
         logger.debug(f"{self.user.email} Buy food id {food_id}")
         self.object_model: models.Food | None = await self._get_by_id(object_id=food_id)
-
         await self.buy_service()
 
     async def get_food_list(self) -> List[models.Food]:
@@ -530,12 +1029,21 @@ class Health(ServicesGame):
         super(Health, self).__init__(session, user)
         self.repository = repository_entity.HealthEntity(session=session)
 
+    @Game.retry_on_conflict
     @Game.get_current_player
     async def buy(self, health_id: int) -> None:
         """ Buy health
         :param health_id:
         :return:
         """
+        await self.apply(health_id=health_id)
+        await self.save()
+
+    async def apply(self, health_id: int) -> None:
+        """ Buy health for loaded player without commit
+        :param health_id:
+        :return:
+        """
         logger.debug(f"{self.user.email} Buy health id {health_id}")
         self.object_model: models.Health | None = await self._get_by_id(object_id=health_id)
         await self.buy_service()
@@ -552,12 +1060,21 @@ class Leisure(ServicesGame):
         super(Leisure, self).__init__(session, user)
         self.repository = repository_entity.LeisureEntity(session=session)
 
+    @Game.retry_on_conflict
     @Game.get_current_player
     async def buy(self, leisure_id) -> None:
         """ Buy leisure
         :param leisure_id:
         :return:
         """
+        await self.apply(leisure_id=leisure_id)
+        await self.save()
+
+    async def apply(self, leisure_id: int) -> None:
+        """ Buy leisure for loaded player without commit
+        :param leisure_id:
+        :return:
+        """
         logger.debug(f"{self.user.email} Buy leisure id {leisure_id}")
         self.object_model: models.Leisure | None = await self._get_by_id(object_id=leisure_id)
         await self.buy_service()
@@ -570,20 +1087,31 @@ class Leisure(ServicesGame):
 
 
 class Business(ItemGame):
+    player_profile = "business"
+
     def __init__(self, session: AsyncSession, user: User):
         super(Business, self).__init__(session, user)
         self.repository = repository_entity.BusinessEntity(session=session)
 
+    @Game.retry_on_conflict
     @Game.get_current_player
     async def buy(self, business_id) -> None:
         """ Buy business
         :param business_id:
         :return:
         """
+        await self.apply(business_id=business_id)
+        await self.save()
+
+    async def apply(self, business_id: int) -> None:
+        """ Buy business for loaded player without commit
+        :param business_id:
+        :return:
+        """
         logger.debug(f"{self.user.email} Buy business id {business_id}")
         self.object_model: models.Business | None = await self._get_by_id(object_id=business_id)
         self.check_availability()
-        if self.object_model.min_authority > self.player.authority:
+        if self.action_plan.min_authority > self.state.authority:
             raise exceptions.NoPossibilityError(f"You do not have suitable authority")
         await self.buy_item()
 
@@ -592,3 +1120,173 @@ class Business(ItemGame):
         :return:
         """
         return await self.repository.get_objects_list()
+
+
+class Plan(Game):
+    player_profile = "plan"
+    action_classes = {
+        "food": Food,
+        "health": Health,
+        "leisure": Leisure,
+        "work": Work,
+        "street": StreetAction,
+        "home": Home,
+        "skill": Skill,
+        "transport": Transport,
+        "business": Business,
+    }
+    step_exceptions = (
+        exceptions.NotFoundException,
+        exceptions.AlreadyExistError,
+        exceptions.NoMoneyError,
+        exceptions.NoPossibilityError,
+    )
+
+    def __init__(self, session: AsyncSession, user: User):
+        super(Plan, self).__init__(session, user)
+        # Steps change the loaded state, so the plan and business income collected on load use orm mode
+        self.atomic = False
+
+    @Game.retry_on_conflict
+    @Game.get_current_player
+    async def run(self, actions: list) -> List[dict]:
+        """ Perform ordered actions of different kinds against one loaded player with one commit.
+        The first failed action rolls back the whole plan
+        :param actions: items with action, id and times (for work and street actions)
+        :return: result of every action
+        """
+        logger.debug(f"{self.user.email} Perform plan of {len(actions)} actions")
+        results = []
+
+        for step, action in enumerate(actions):
+            step_logic = self.action_classes[action.action](session=self.session, user=self.user)
+            step_logic.player = self.player
+            step_logic.state = self.state
+            step_logic.atomic = False
+
+            kwargs = {"times": action.times} if isinstance(step_logic, ActionGame) else {}
+            try:
+                days = await step_logic.apply(action.id, **kwargs)
+            except self.step_exceptions as e:
+                logger.warning(f"{self.user.email} plan failed on action {step} ({action.action}): {e}")
+                await self.session.rollback()
+                raise exceptions.PlanStepError(step=step, error=e)
+            results.append({"action": action.action, "id": action.id, "days": days})
+
+        await self.save()
+        return results
+
+
+class Unlock(Game):
+    player_profile = "base"
+    collect_income = False
+
+    @Game.get_current_player
+    async def get_unlock_path(self, kind: str, item_id: int) -> dict:
+        """ Cheapest full unlock path of catalog item for current player: not owned transitive requirements
+        in buying order with their total cost by currency
+        :param kind: catalog of item (plan action names)
+        :param item_id:
+        :return:
+        """
+        graph = await requirements.get_requirement_graph(session=self.session)
+        target = graph.plans.get((kind, item_id))
+        if target is None:
+            raise exceptions.NotFoundException(f"{kind.capitalize()} is not found")
+
+        path = graph.get_unlock_path((kind, item_id), owned=self.state.owned)
+        total = {}
+        for plan in path:
+            total[plan.currency_id] = total.get(plan.currency_id, 0) + plan.cost
+
+        return {
+            "kind": kind,
+            "id": target.id,
+            "name": target.name,
+            "min_authority": target.min_authority,
+            "authority": self.state.authority,
+            "steps": [
+                {
+                    "kind": plan.kind,
+                    "id": plan.id,
+                    "name": plan.name,
+                    "price": plan.cost,
+                    "currency_id": plan.currency_id,
+                }
+                for plan in path
+            ],
+            "total": [{"currency_id": currency_id, "amount": amount} for currency_id, amount in total.items()],
+        }
+
+
+class Available(Game):
+    player_profile = "service"
+    collect_income = False
+
+    @Game.get_current_player
+    async def get_available(self) -> dict:
+        """ Catalog rows current player can afford now, with owned requirements and enough authority.
+        Affordable rows are taken from per currency price indexes by bisect against player balances
+        :return: rows by catalog
+        """
+        index = await availability.get_price_index(session=self.session)
+        available = availability.get_available(index, self.state)
+        return {
+            catalog: [
+                {"id": plan.id, "name": plan.name, "price": plan.cost, "currency_id": plan.currency_id}
+                for plan in plans
+            ]
+            for catalog, plans in available.items()
+        }
+
+
+class CatalogSearch(Game):
+    async def search(self, **params) -> List[search.CatalogEntry]:
+        """ Catalog rows of all kinds from in-memory search index, params of CatalogIndex search
+        :param params:
+        :return:
+        """
+        index = await search.get_catalog_index(session=self.session)
+        return index.search(**params)
+
+
+class Dashboard(Game):
+    async def get_dashboard(self, sections: Set[str]) -> dict:
+        """ Home screen data in one request. Player, its balances and owned item ids are loaded by one query,
+        owned items and catalog versions are taken from cached catalogs. Sections not asked are not loaded
+        :param sections: player, balances, owned, catalogs
+        :return:
+        """
+        dashboard = {}
+        if sections & {"player", "balances", "owned"}:
+            player_repository = repository_entity.PlayerEntity(session=self.session)
+            player, amounts = await player_repository.get_dashboard_player(
+                user_id=self.user.id, with_balances="balances" in sections
+            )
+            if not player:
+                raise exceptions.PlayerException(f"Player is not found")
+            if "player" in sections:
+                dashboard["player"] = player
+            if "balances" in sections:
+                dashboard["balances"] = await player_repository.get_balance_list(player, amounts=amounts)
+            if "owned" in sections:
+                dashboard["owned"] = await self.get_owned_items(player)
+
+        if "catalogs" in sections:
+            dashboard["catalog_versions"] = {
+                catalog: await entity_class(session=self.session).get_version()
+                for catalog, entity_class in requirements.CATALOG_ENTITIES.items()
+            }
+        return dashboard
+
+    async def get_owned_items(self, player: models.Player) -> Dict[str, list]:
+        """ Owned items by kind from player id arrays and cached catalog rows
+        :param player:
+        :return:
+        """
+        owned = {}
+        for kind, item_ids in repository_entity.PlayerEntity.get_owned_ids(player).items():
+            snapshot = await requirements.CATALOG_ENTITIES[kind](session=self.session).get_snapshot()
+            items = {item.id: item for item in snapshot.items}
+            owned[kind] = [items[item_id] for item_id in sorted(item_ids) if item_id in items]
+        return owned
@@ -0,0 +1,373 @@
+from collections import defaultdict
+from config import (
+    logger,
+    MARKET_COMPACT_MIN,
+    MARKET_RUNNER_RETRY,
+    MARKET_SETTLE_ALERT_FAILURES,
+    MARKET_SETTLE_BACKOFF_MAX,
+    MARKET_SETTLE_INTERVAL,
+)
+from core.engine import async_session_maker, engine
+from core.repository_entity import OrderEntity
+from game import models
+from sqlalchemy import select, func
+from typing import Dict, List, Tuple
+
+import asyncio
+import heapq
+import random
+import time
+
+
+# Session advisory lock key of the process running the market, books of other processes stay not ready
+MARKET_RUNNER_LOCK = 7_253_001
+
+class BookOrder:
+    """ Open order of the in-memory book
+    """
+    __slots__ = (
+        "id", "player_id", "currency_id", "price_currency_id", "side", "price", "amount", "filled", "cancelled"
+    )
+
+    def __init__(
+            self,
+            order_id: int,
+            player_id: int,
+            currency_id: int,
+            price_currency_id: int,
+            side: str,
+            price: int,
+            amount: int,
+            filled: int = 0
+    ):
+        self.id = order_id
+        self.player_id = player_id
+        self.currency_id = currency_id
+        self.price_currency_id = price_currency_id
+        self.side = side
+        self.price = price
+        self.amount = amount
+        self.filled = filled
+        self.cancelled = False
+
+    @classmethod
+    def from_model(cls, order: models.Order) -> "BookOrder":
+        return cls(
+            order_id=order.id,
+            player_id=order.player_id,
+            currency_id=order.currency_id,
+            price_currency_id=order.price_currency_id,
+            side=order.side,
+            price=order.price,
+            amount=order.amount,
+            filled=order.filled
+        )
+
+    @property
+    def remaining(self) -> int:
+        return self.amount - self.filled
+
+    @property
+    def reserve(self) -> Tuple[int, int]:
+        """ Currency and amount held for the rest of order: price currency for bids, currency for asks
+        :return:
+        """
+        if self.side == "bid":
+            return self.price_currency_id, self.remaining * self.price
+        return self.currency_id, self.remaining
+
+
+Fill = Tuple[BookOrder, BookOrder, int, int]
+
+
+class OrderBook:
+    """ Bids and asks of one currency pair in binary heaps by price and order id.
+    Cancelled and filled orders are dropped when they reach the top, heaps are compacted
+    when dead entries are more than a half of them
+    """
+
+    def __init__(self):
+        self.bids = []
+        self.asks = []
+        self.dead = 0
+
+    def push(self, order: BookOrder) -> None:
+        if order.side == "bid":
+            heapq.heappush(self.bids, (-order.price, order.id, order))
+        else:
+            heapq.heappush(self.asks, (order.price, order.id, order))
+
+    def match(self, order: BookOrder) -> List[Fill]:
+        """ Match order with the best opposite orders by their price, the rest of order stays in book
+        :param order:
+        :return: fills of bid, ask, price and amount
+        """
+        fills = []
+        opposite = self.asks if order.side == "bid" else self.bids
+
+        while order.remaining and opposite:
+            best = opposite[0][2]
+            if best.cancelled or not best.remaining:
+                heapq.heappop(opposite)
+                self.dead = max(self.dead - 1, 0)
+                continue
+            if order.side == "bid" and best.price > order.price:
+                break
+            if order.side == "ask" and best.price < order.price:
+                break
+
+            amount = min(order.remaining, best.remaining)
+            order.filled += amount
+            best.filled += amount
+            if order.side == "bid":
+                fills.append((order, best, best.price, amount))
+            else:
+                fills.append((best, order, best.price, amount))
+            if not best.remaining:
+                heapq.heappop(opposite)
+
+        if order.remaining:
+            self.push(order)
+        return fills
+
+    def discard(self) -> None:
+        """ Count entry of cancelled order, compact heaps when dead entries are more than a half of them
+        :return:
+        """
+        self.dead += 1
+        if self.dead >= MARKET_COMPACT_MIN and self.dead * 2 > len(self.bids) + len(self.asks):
+            self.compact()
+
+    def compact(self) -> None:
+        """ Rebuild heaps without cancelled and filled entries
+        :return:
+        """
+        for heap in (self.bids, self.asks):
+            live = [key for key in heap if not key[2].cancelled and key[2].remaining]
+            heapq.heapify(live)
+            heap[:] = live
+        self.dead = 0
+
+    def get_depth(self, side: str, levels: int) -> List[dict]:
+        """ Best price levels of side with open amounts. Heap is walked from the top in order
+        until levels are collected, without sorting the whole side
+        :param side: bid or ask
+        :param levels:
+        :return:
+        """
+        heap = self.bids if side == "bid" else self.asks
+        depth = {}
+        frontier = [(heap[0][:2], 0)] if heap else []
+        while frontier:
+            _, position = heapq.heappop(frontier)
+            order = heap[position][2]
+            if not order.cancelled and order.remaining:
+                if order.price not in depth and len(depth) == levels:
+                    break
+                depth[order.price] = depth.get(order.price, 0) + order.remaining
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child][:2], child))
+        return [{"price": price, "amount": amount} for price, amount in depth.items()]
+
+
+class MarketEngine:
+    """ In-process matching engine. Fills are kept until settle_pending() writes them to db
+    """
+
+    def __init__(self):
+        self.books: Dict[Tuple[int, int], OrderBook] = {}
+        self.orders: Dict[int, BookOrder] = {}
+        self.pending_fills: List[Fill] = []
+        self.ready = False
+        self.matches = 0
+
+    def get_book(self, currency_id: int, price_currency_id: int) -> OrderBook:
+        key = (currency_id, price_currency_id)
+        book = self.books.get(key)
+        if book is None:
+            book = self.books[key] = OrderBook()
+        return book
+
+    def submit(self, order: BookOrder) -> List[Fill]:
+        """ Match order and keep its rest in book
+        :param order:
+        :return: fills of order
+        """
+        fills = self.get_book(order.currency_id, order.price_currency_id).match(order)
+        for bid, ask, price, amount in fills:
+            for filled_order in (bid, ask):
+                if not filled_order.remaining:
+                    self.orders.pop(filled_order.id, None)
+        if order.remaining:
+            self.orders[order.id] = order
+
+        self.matches += len(fills)
+        self.pending_fills.extend(fills)
+        return fills
+
+    def cancel(self, order_id: int, player_id: int) -> BookOrder | None:
+        """ Remove open order of player from book
+        :param order_id:
+        :param player_id:
+        :return: cancelled order or None
+        """
+        order = self.orders.get(order_id)
+        if not order or order.player_id != player_id:
+            return None
+        order.cancelled = True
+        del self.orders[order_id]
+        self.get_book(order.currency_id, order.price_currency_id).discard()
+        return order
+
+    def restore(self, order: BookOrder) -> None:
+        """ Return order which cancel was not saved
+        :param order:
+        :return:
+        """
+        order.cancelled = False
+        self.orders[order.id] = order
+        book = self.get_book(order.currency_id, order.price_currency_id)
+        heap = book.bids if order.side == "bid" else book.asks
+        if any(key[2] is order for key in heap):
+            book.dead = max(book.dead - 1, 0)
+        else:
+            book.push(order)
+
+    def take_fills(self) -> List[Fill]:
+        fills, self.pending_fills = self.pending_fills, []
+        return fills
+
+
+market_engine = MarketEngine()
+
+
+def get_settlement(fills: List[Fill]) -> Tuple[dict, dict]:
+    """ Aggregate fills: buyer gets currency and the rest of bid reserve over the fill price,
+    seller gets price currency
+    :param fills:
+    :return: filled amount by order id, balance credit by (player id, currency id)
+    """
+    order_fills = defaultdict(int)
+    balance_changes = defaultdict(int)
+    for bid, ask, price, amount in fills:
+        order_fills[bid.id] += amount
+        order_fills[ask.id] += amount
+        balance_changes[(bid.player_id, bid.currency_id)] += amount
+        if bid.price != price:
+            balance_changes[(bid.player_id, bid.price_currency_id)] += (bid.price - price) * amount
+        balance_changes[(ask.player_id, ask.price_currency_id)] += price * amount
+    return order_fills, balance_changes
+
+
+async def settle_pending() -> None:
+    """ Write pending fills in one transaction, on error they are kept for the next attempt
+    :return:
+    """
+    fills = market_engine.take_fills()
+    if not fills:
+        return
+    order_fills, balance_changes = get_settlement(fills)
+    try:
+        async with async_session_maker() as session:
+            await OrderEntity(session=session).settle(order_fills=order_fills, balance_changes=balance_changes)
+    except Exception:
+        market_engine.pending_fills[:0] = fills
+        raise
+
+
+async def run_market() -> None:
+    """ Run the market in one process: wait for MARKET_RUNNER_LOCK, held by its connection until the process exits,
+    so another process takes over only after the runner is gone
+    :return:
+    """
+    async with engine.connect() as connection:
+        try:
+            while True:
+                try:
+                    locked = await connection.scalar(select(func.pg_try_advisory_lock(MARKET_RUNNER_LOCK)))
+                    await connection.commit()
+                except Exception as e:
+                    logger.error(f"Market runner lock error: {e!r}")
+                    locked = False
+                if locked:
+                    break
+                await asyncio.sleep(MARKET_RUNNER_RETRY)
+            logger.info("Market runner lock acquired")
+            await run_market_book()
+        finally:
+            # the lock belongs to the db session, so the connection is closed instead of returned to the pool
+            await connection.invalidate()
+
+
+async def run_market_book() -> None:
+    """ Recover book from open orders and settle fills every MARKET_SETTLE_INTERVAL.
+    Orders crossed by fills lost before restart are matched again. After failed settlement
+    the interval is doubled up to MARKET_SETTLE_BACKOFF_MAX, long failure series are logged as critical
+    :return:
+    """
+    async with async_session_maker() as session:
+        orders = await OrderEntity(session=session).get_open_orders()
+    for order in orders:
+        market_engine.submit(BookOrder.from_model(order))
+    market_engine.ready = True
+    logger.info(f"Market recovered {len(orders)} open orders")
+
+    failures = 0
+    while True:
+        await asyncio.sleep(min(MARKET_SETTLE_INTERVAL * 2 ** min(failures, 32), MARKET_SETTLE_BACKOFF_MAX))
+        try:
+            await settle_pending()
+        except Exception as e:
+            failures += 1
+            log = logger.critical if failures >= MARKET_SETTLE_ALERT_FAILURES else logger.error
+            log(
+                f"Market settlement failed {failures} times in a row, "
+                f"{len(market_engine.pending_fills)} fills pending: {e!r}"
+            )
+            continue
+        if failures:
+            logger.warning(f"Market settlement recovered after {failures} failures")
+            failures = 0
+
+
+def benchmark(orders_count: int = 200000, seed: int = 1) -> dict:
+    """ Matching throughput of the in-memory engine on random orders around one price, without db
+    :param orders_count:
+    :param seed:
+    :return:
+    """
+    generator = random.Random(seed)
+    engine = MarketEngine()
+    orders = [
+        BookOrder(
+            order_id=order_id,
+            player_id=generator.randint(1, 1000),
+            currency_id=1,
+            price_currency_id=2,
+            side=generator.choice(("bid", "ask")),
+            price=generator.randint(95, 105),
+            amount=generator.randint(1, 50)
+        )
+        for order_id in range(1, orders_count + 1)
+    ]
+
+    start = time.perf_counter()
+    for order in orders:
+        engine.submit(order)
+        if len(engine.pending_fills) >= 1000:
+            get_settlement(engine.take_fills())
+    seconds = time.perf_counter() - start
+
+    return {
+        "orders": orders_count,
+        "matches": engine.matches,
+        "open_orders": len(engine.orders),
+        "seconds": round(seconds, 3),
+        "orders_per_second": round(orders_count / seconds),
+        "matches_per_second": round(engine.matches / seconds),
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -1,5 +1,6 @@
 from core.engine import Base
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Table, Boolean
+from game.rng import new_seed
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, ForeignKey, Table, Boolean, Index, ARRAY
 from sqlalchemy.orm import relationship
 
 
@@ -27,7 +28,8 @@ transport_player = Table(
 business_player = Table(
     "business_player", Base.metadata,
     Column("business_id", ForeignKey("business.id", ondelete="CASCADE"), primary_key=True, index=True),
-    Column("player_id", ForeignKey("player.id", ondelete="CASCADE"), primary_key=True)
+    Column("player_id", ForeignKey("player.id", ondelete="CASCADE"), primary_key=True),
+    Column("last_collected_day", Integer)
 )
 
 
@@ -35,7 +37,7 @@ class Player(Base):
     __tablename__ = "player"
 
     id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey('user.id'))
+    user_id = Column(Integer, ForeignKey('user.id'), index=True)
     hunger = Column(Integer, nullable=False)
     rest = Column(Integer, nullable=False)
     health = Column(Integer, nullable=False)
@@ -43,33 +45,39 @@ class Player(Base):
     age = Column(Integer, nullable=False)
     authority = Column(Integer, nullable=False)
     day = Column(Integer, nullable=False)
-    balances = relationship("Balance", lazy="selectin", join_depth=2)
+    balances = relationship("Balance", lazy="raise")
     home_list = relationship(
         "Home",
         secondary=home_player,
-        lazy="selectin",
-        join_depth=2
+        lazy="raise"
     )
     skills = relationship(
         "Skill",
         secondary=skill_player,
-        lazy="selectin",
-        join_depth=2
+        lazy="raise"
     )
     transport_list = relationship(
         "Transport",
         secondary=transport_player,
-        lazy="selectin",
-        join_depth=2
+        lazy="raise"
     )
     business_list = relationship(
         "Business",
         secondary=business_player,
-        lazy="selectin",
-        join_depth=2
+        lazy="raise"
     )
     alive = Column(Boolean, default=True, nullable=False)
     deadly_days = Column(Integer, default=0, nullable=False)
+    version = Column(Integer, nullable=False, server_default="1")
+    rng_seed = Column(BigInteger, nullable=False, default=new_seed)
+    rng_counter = Column(BigInteger, nullable=False, server_default="0", default=0)
+    balance_vector = Column(ARRAY(Integer))
+    owned_home_ids = Column(ARRAY(Integer), nullable=False, server_default="{}", default=list)
+    owned_skill_ids = Column(ARRAY(Integer), nullable=False, server_default="{}", default=list)
+    owned_transport_ids = Column(ARRAY(Integer), nullable=False, server_default="{}", default=list)
+    owned_business_ids = Column(ARRAY(Integer), nullable=False, server_default="{}", default=list)
+
+    __mapper_args__ = {"version_id_col": version}
 
     def __str__(self):
         return "Mike"
@@ -83,6 +91,7 @@ class Currency(Base):
     exchange_price_min = Column(Integer)
     exchange_price_max = Column(Integer)
     exchange_change_step = Column(Integer)
+    exchange_price = Column(Integer)
     exchange_currency_id = Column(Integer, ForeignKey('currency.id'))
     exchange_currency = relationship("Currency", lazy="selectin", join_depth=2)
 
@@ -98,10 +107,13 @@ class Balance(Base):
     currency_id = Column(Integer, ForeignKey('currency.id'), nullable=False)
     currency = relationship("Currency", lazy="selectin")
     player_id = Column(Integer, ForeignKey('player.id'), nullable=False)
-    player = relationship("Player", lazy="selectin")
+    player = relationship("Player", lazy="raise")
     amount = Column(Integer, nullable=False)
     updated_at = Column(DateTime)
     exchange_price = Column(Integer)
+    version = Column(Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
     def __str__(self):
         return self.name
@@ -296,3 +308,40 @@ class Business(Base):
 
     def __str__(self):
         return self.name
+
+
+class CatalogChange(Base):
+    __tablename__ = "catalog_change"
+    __table_args__ = (
+        Index("ix_catalog_change_catalog_id", "catalog", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
+    catalog = Column(String, nullable=False)
+    object_id = Column(Integer, nullable=False)
+    deleted = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime)
+
+    def __str__(self):
+        return f"{self.catalog} {self.object_id}"
+
+
+class Order(Base):
+    __tablename__ = "exchange_order"
+    __table_args__ = (
+        Index("ix_exchange_order_status_id", "status", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
+    player_id = Column(Integer, ForeignKey('player.id', ondelete="CASCADE"), nullable=False, index=True)
+    currency_id = Column(Integer, ForeignKey('currency.id'), nullable=False)
+    price_currency_id = Column(Integer, ForeignKey('currency.id'), nullable=False)
+    side = Column(String, nullable=False)
+    price = Column(Integer, nullable=False)
+    amount = Column(Integer, nullable=False)
+    filled = Column(Integer, default=0, nullable=False)
+    status = Column(String, default="open", nullable=False)
+    created_at = Column(DateTime)
+
+    def __str__(self):
+        return f"{self.side} {self.amount} of {self.currency_id} by {self.price}"
@@ -0,0 +1,125 @@
+from core.cache import catalog_cache
+from core import repository_entity
+from game import domain
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+import heapq
+
+
+CATALOG_ENTITIES = {
+    "skill": repository_entity.SkillEntity,
+    "home": repository_entity.HomeEntity,
+    "transport": repository_entity.TransportEntity,
+    "business": repository_entity.BusinessEntity,
+    "work": repository_entity.WorkEntity,
+    "street": repository_entity.StreetActionEntity,
+    "food": repository_entity.FoodEntity,
+    "health": repository_entity.HealthEntity,
+    "leisure": repository_entity.LeisureEntity,
+}
+
+Node = Tuple[str, int]
+
+
+class RequirementGraph:
+    """ Requirement DAG of all catalog rows: node is (catalog, id), edges go to required transport, home
+    or skill of catalogs where the game checks them. Transitive closure of every node is computed once on build
+    """
+    __slots__ = ("plans", "closure")
+
+    def __init__(self, plans: Dict[Node, domain.ActionPlan]):
+        self.plans = plans
+        self.closure: Dict[Node, FrozenSet[Node]] = {}
+        for node in plans:
+            self._close(node, visiting=set())
+
+    def _close(self, node: Node, visiting: Set[Node]) -> FrozenSet[Node]:
+        """ All direct and transitive requirements of node
+        :param node:
+        :param visiting: nodes of the current walk, to detect cycles
+        :return:
+        """
+        closure = self.closure.get(node)
+        if closure is not None:
+            return closure
+        if node in visiting:
+            raise ValueError(f"Requirement cycle at {node}")
+        visiting.add(node)
+
+        required = set()
+        plan = self.plans.get(node)
+        for requirement in domain.get_checked_requirements(plan) if plan else ():
+            if requirement in self.plans:
+                required.add(requirement)
+                required.update(self._close(requirement, visiting))
+
+        visiting.discard(node)
+        closure = self.closure[node] = frozenset(required)
+        return closure
+
+    def get_unlock_path(self, node: Node, owned: Dict[str, Set[int]]) -> List[domain.ActionPlan]:
+        """ Requirements of node which are not owned, in buying order. Every requirement is bought
+        after its own requirements, the cheapest available one first
+        :param node:
+        :param owned: owned item ids by kind
+        :return:
+        """
+        needed = {required for required in self.closure[node] if required[1] not in owned[required[0]]}
+        waiting = {
+            required: sum(
+                requirement in needed for requirement in domain.get_checked_requirements(self.plans[required])
+            )
+            for required in needed
+        }
+        available = [(self.plans[required].cost, required) for required, count in waiting.items() if not count]
+        heapq.heapify(available)
+
+        path = []
+        while available:
+            _, required = heapq.heappop(available)
+            path.append(self.plans[required])
+            for dependent, count in waiting.items():
+                if count and required in domain.get_checked_requirements(self.plans[dependent]):
+                    waiting[dependent] = count - 1
+                    if count == 1:
+                        heapq.heappush(available, (self.plans[dependent].cost, dependent))
+        return path
+
+
+async def load_catalog_snapshots(session: AsyncSession) -> Tuple[tuple, dict]:
+    """ Cached snapshots of all catalogs with their versions
+    :param session:
+    :return: catalog versions, entity and snapshot by catalog
+    """
+    snapshots = {}
+    for catalog, entity_class in CATALOG_ENTITIES.items():
+        entity = entity_class(session=session)
+        snapshots[catalog] = (entity, await entity.get_snapshot())
+    versions = tuple(snapshot.version for _, snapshot in snapshots.values())
+    return versions, snapshots
+
+
+def get_catalog_plans(snapshots: dict) -> Dict[Node, domain.ActionPlan]:
+    """ Action plans of all catalog rows
+    :param snapshots: entity and snapshot by catalog
+    :return: plans by node
+    """
+    return {
+        (catalog, item.id): entity.get_action_plan(item)
+        for catalog, (entity, snapshot) in snapshots.items() for item in snapshot.items
+    }
+
+
+async def get_requirement_graph(session: AsyncSession) -> RequirementGraph:
+    """ Requirement graph of current catalogs. Graph is cached by catalog versions,
+    so any catalog change builds a new one
+    :param session:
+    :return:
+    """
+    versions, snapshots = await load_catalog_snapshots(session=session)
+
+    async def build() -> RequirementGraph:
+        return RequirementGraph(get_catalog_plans(snapshots))
+
+    return await catalog_cache.get_or_load(RequirementGraph, versions, build)
@@ -0,0 +1,201 @@
+from typing import List, Tuple
+
+import argparse
+import json
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+PHILOX_M0 = 0xD2511F53
+PHILOX_M1 = 0xCD9E8D57
+PHILOX_W0 = 0x9E3779B9
+PHILOX_W1 = 0xBB67AE85
+PHILOX_ROUNDS = 10
+MASK_32 = 0xFFFFFFFF
+WORDS_PER_BLOCK = 4
+SEED_BITS = 63
+VECTORIZED_MIN_BLOCKS = 16
+
+
+def new_seed() -> int:
+    """ Seed of a new player stream, fits signed bigint column
+    :return:
+    """
+    return random.getrandbits(SEED_BITS)
+
+
+def philox_block(seed: int, block: int) -> Tuple[int, int, int, int]:
+    """ Philox4x32-10 block: 64 bit block number is the counter, 64 bit seed is the key
+    :param seed:
+    :param block:
+    :return: four 32 bit words
+    """
+    c0, c1, c2, c3 = block & MASK_32, (block >> 32) & MASK_32, 0, 0
+    k0, k1 = seed & MASK_32, (seed >> 32) & MASK_32
+
+    for round_number in range(PHILOX_ROUNDS):
+        product0 = PHILOX_M0 * c0
+        product1 = PHILOX_M1 * c2
+        c0, c1, c2, c3 = (
+            (product1 >> 32) ^ c1 ^ k0,
+            product1 & MASK_32,
+            (product0 >> 32) ^ c3 ^ k1,
+            product0 & MASK_32,
+        )
+        k0 = (k0 + PHILOX_W0) & MASK_32
+        k1 = (k1 + PHILOX_W1) & MASK_32
+    return c0, c1, c2, c3
+
+
+def philox_words(seed: int, start: int, count: int) -> List[int]:
+    """ Words start..start + count of seed stream, word n is word n % 4 of block n // 4
+    :param seed:
+    :param start:
+    :param count:
+    :return:
+    """
+    if count <= 0:
+        return []
+    first_block = start // WORDS_PER_BLOCK
+    last_block = (start + count - 1) // WORDS_PER_BLOCK
+    if np is not None and last_block - first_block >= VECTORIZED_MIN_BLOCKS:
+        return philox_words_vectorized(seed, start, count).tolist()
+
+    words = []
+    for block in range(first_block, last_block + 1):
+        words.extend(philox_block(seed, block))
+    offset = start - first_block * WORDS_PER_BLOCK
+    return words[offset:offset + count]
+
+
+def philox_words_vectorized(seed: int, start: int, count: int):
+    """ Same words as philox_words, all blocks are computed at once by numpy
+    :param seed:
+    :param start:
+    :param count:
+    :return: uint64 array of 32 bit words
+    """
+    if np is None:
+        raise RuntimeError("numpy is required for vectorized rolls, install simulation extra")
+
+    first_block = start // WORDS_PER_BLOCK
+    last_block = (start + count - 1) // WORDS_PER_BLOCK
+    blocks = np.arange(first_block, last_block + 1, dtype=np.uint64)
+    mask = np.uint64(MASK_32)
+    shift = np.uint64(32)
+
+    c0 = blocks & mask
+    c1 = (blocks >> shift) & mask
+    c2 = np.zeros_like(blocks)
+    c3 = np.zeros_like(blocks)
+    k0, k1 = seed & MASK_32, (seed >> 32) & MASK_32
+
+    for round_number in range(PHILOX_ROUNDS):
+        product0 = np.uint64(PHILOX_M0) * c0
+        product1 = np.uint64(PHILOX_M1) * c2
+        c0, c1, c2, c3 = (
+            (product1 >> shift) ^ c1 ^ np.uint64(k0),
+            product1 & mask,
+            (product0 >> shift) ^ c3 ^ np.uint64(k1),
+            product0 & mask,
+        )
+        k0 = (k0 + PHILOX_W0) & MASK_32
+        k1 = (k1 + PHILOX_W1) & MASK_32
+
+    words = np.stack((c0, c1, c2, c3), axis=1).reshape(-1)
+    offset = start - first_block * WORDS_PER_BLOCK
+    return words[offset:offset + count]
+
+
+def to_range(word: int, min_value: int, max_value: int) -> int:
+    """ Map 32 bit word to min_value..max_value by multiply and shift
+    :param word:
+    :param min_value:
+    :param max_value:
+    :return:
+    """
+    return min_value + ((word * (max_value - min_value + 1)) >> 32)
+
+
+class PlayerRandom:
+    """ Counter-based random stream of player. Draw n depends on seed and n only,
+    so a day can be replayed from the counter stored before it
+    """
+    __slots__ = ("seed", "counter", "_buffer", "_buffer_start")
+
+    def __init__(self, seed: int, counter: int = 0):
+        self.seed = seed
+        self.counter = counter
+        self._buffer = []
+        self._buffer_start = counter
+
+    def randint(self, min_value: int, max_value: int) -> int:
+        """ Random(min, max) of the next draw
+        :param min_value:
+        :param max_value:
+        :return:
+        """
+        offset = self.counter - self._buffer_start
+        if not 0 <= offset < len(self._buffer):
+            self.prefetch(WORDS_PER_BLOCK - self.counter % WORDS_PER_BLOCK)
+            offset = 0
+        self.counter += 1
+        return to_range(self._buffer[offset], min_value, max_value)
+
+    def prefetch(self, count: int) -> None:
+        """ Compute next count draws in one call, batch actions prefetch all their rolls.
+        Counter is moved by used draws only
+        :param count:
+        :return:
+        """
+        self._buffer = philox_words(self.seed, self.counter, count)
+        self._buffer_start = self.counter
+
+
+def benchmark(draws: int = 1_000_000, seed: int = 1) -> dict:
+    """ Draws per second of single draws and of prefetched draws, checks both give the same values
+    :param draws:
+    :param seed:
+    :return:
+    """
+    single = PlayerRandom(seed)
+    start = time.perf_counter()
+    single_values = [single.randint(1, 100) for _ in range(draws)]
+    single_seconds = time.perf_counter() - start
+
+    prefetched = PlayerRandom(seed)
+    start = time.perf_counter()
+    prefetched.prefetch(draws)
+    prefetched_values = [prefetched.randint(1, 100) for _ in range(draws)]
+    prefetched_seconds = time.perf_counter() - start
+
+    return {
+        "draws": draws,
+        "vectorized": np is not None,
+        "same_values": single_values == prefetched_values,
+        "single_per_second": round(draws / single_seconds),
+        "prefetched_per_second": round(draws / prefetched_seconds),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Player random stream: replay draws or benchmark")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--counter", type=int, default=0)
+    parser.add_argument("--count", type=int, default=8)
+    parser.add_argument("--min", type=int, default=None)
+    parser.add_argument("--max", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is None:
+        print(json.dumps(benchmark(), indent=2))
+    else:
+        words = philox_words(args.seed, args.counter, args.count)
+        if args.min is not None and args.max is not None:
+            words = [to_range(word, args.min, args.max) for word in words]
+        print(json.dumps(words))
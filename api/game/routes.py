@@ -1,12 +1,12 @@
-from config import logger
-from core.engine import get_async_session
-from fastapi import APIRouter, Depends, status
+from config import logger, MARKET_DEPTH
+from core.engine import get_async_session, get_pool_stats
+from fastapi import APIRouter, Depends, Query, Request, Response, status
 from fastapi.responses import JSONResponse
-from game import logic, schemas, services
+from game import exceptions, logic, schemas, services
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from users.models import User
-from users.utils import current_user
+from users.utils import current_user, current_superuser
 
 
 router = APIRouter()
@@ -19,21 +19,30 @@ async def test() -> dict:
     return {"test": "ok"}
 
 
+@router.get("/stats/pool")
+async def get_db_pool_stats(user: User = Depends(current_superuser)) -> dict:
+    """ DB connection pool stats endpoint
+    """
+    return get_pool_stats()
+
+
+@router.get("/stats/conflicts")
+async def get_conflict_stats(user: User = Depends(current_superuser)) -> dict:
+    """ Game action version conflict stats endpoint
+    """
+    return logic.conflict_stats
+
+
 @router.get("/info", response_model=schemas.PlayerSchema)
 async def get_play_info(
+        fields: str | None = None,
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
 ) -> schemas.PlayerSchema | JSONResponse:
-    """ Info endpoint
+    """ Info endpoint. Supports fields to narrow response and loaded relationships
     """
     player = logic.Player(user=user, session=session)
-    player_info = await player.get_info()
-    if not player_info:
-        return JSONResponse(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            content={"message": f"Player is not exist for user - {user.email}"}
-        )
-    return schemas.PlayerSchema.from_orm(player_info)
+    return await services.processing_info_request(game_logic=player, fields=fields)
 
 
 @router.post("/player")
@@ -43,7 +52,8 @@ async def add_player(
 ) -> JSONResponse:
     """ Add player
     """
-    if len(user.players):
+    player = logic.Player(user=user, session=session)
+    if await player.has_player():
         error_message = f"Player already exists for user - {user.email}"
         logger.error(error_message)
         return JSONResponse(
@@ -51,7 +61,6 @@ async def add_player(
             content={"message": error_message}
         )
 
-    player = logic.Player(user=user, session=session)
     await player.add_player()
 
     return JSONResponse(
@@ -62,16 +71,17 @@ async def add_player(
 
 @router.get("/skills", response_model=List[schemas.SkillSchema])
 async def get_skills_list(
+        request: Request,
+        query: schemas.CatalogQuerySchema = Depends(),
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
-) -> List[schemas.SkillSchema]:
-    """ Skills endpoint
+) -> Response:
+    """ Skills endpoint. Supports If-None-Match, changes since catalog version, keyset pages and fields
     """
     skill_logic = logic.Skill(session=session, user=user)
-    skills = await skill_logic.get_skill_list()
-    return [
-        schemas.SkillSchema.from_orm(item_skill) for item_skill in skills
-    ]
+    return await services.processing_catalog_request(
+        game_logic=skill_logic, schema=schemas.SkillSchema, request=request, query=query
+    )
 
 
 @router.post("/skills")
@@ -88,16 +98,17 @@ async def learn_skill(
 
 @router.get("/homes", response_model=List[schemas.HomeSchema])
 async def get_homes_list(
+        request: Request,
+        query: schemas.CatalogQuerySchema = Depends(),
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
-) -> List[schemas.HomeSchema]:
-    """ Homes endpoint
+) -> Response:
+    """ Homes endpoint. Supports If-None-Match, changes since catalog version, keyset pages and fields
     """
     home_logic = logic.Home(session=session, user=user)
-    home_list = await home_logic.get_home_list()
-    return [
-        schemas.HomeSchema.from_orm(home) for home in home_list
-    ]
+    return await services.processing_catalog_request(
+        game_logic=home_logic, schema=schemas.HomeSchema, request=request, query=query
+    )
 
 
 @router.post("/homes")
@@ -114,16 +125,17 @@ async def buy_home(
 
 @router.get("/transport", response_model=List[schemas.TransportSchema])
 async def get_transport_list(
+        request: Request,
+        query: schemas.CatalogQuerySchema = Depends(),
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
-) -> List[schemas.TransportSchema]:
-    """ Transport endpoint
+) -> Response:
+    """ Transport endpoint. Supports If-None-Match, changes since catalog version, keyset pages and fields
     """
     transport_logic = logic.Transport(session=session, user=user)
-    transport_list = await transport_logic.get_transport_list()
-    return [
-        schemas.TransportSchema.from_orm(transport) for transport in transport_list
-    ]
+    return await services.processing_catalog_request(
+        game_logic=transport_logic, schema=schemas.TransportSchema, request=request, query=query
+    )
 
 
 @router.post("/transport")
@@ -140,25 +152,26 @@ async def buy_transport(
 
 @router.get("/street", response_model=List[schemas.StreetActionSchema])
 async def get_street_actions_list(
+        request: Request,
+        query: schemas.CatalogQuerySchema = Depends(),
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
-) -> List[schemas.StreetActionSchema]:
-    """ Street actions endpoint
+) -> Response:
+    """ Street actions endpoint. Supports If-None-Match, changes since catalog version, keyset pages and fields
     """
     street_logic = logic.StreetAction(session=session, user=user)
-    street_action_list = await street_logic.get_street_action_list()
-    return [
-        schemas.StreetActionSchema.from_orm(action) for action in street_action_list
-    ]
+    return await services.processing_catalog_request(
+        game_logic=street_logic, schema=schemas.StreetActionSchema, request=request, query=query
+    )
 
 
 @router.post("/street")
 async def perform_street_action(
-        data: schemas.PerformActionSchema,
+        data: schemas.PerformBatchActionSchema,
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session),
 ) -> JSONResponse:
-    """ Perform street action by player id endpoint
+    """ Perform street action by player id endpoint, times days in a row
     """
     street_logic = logic.StreetAction(session=session, user=user)
     return await services.processing_action_request(game_logic=street_logic, data=data)
@@ -166,42 +179,193 @@ async def perform_street_action(
 
 @router.get("/work", response_model=List[schemas.WorkSchema])
 async def get_work_action_list(
+        request: Request,
+        query: schemas.CatalogQuerySchema = Depends(),
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
-) -> List[schemas.WorkSchema]:
-    """ Work actions endpoint
+) -> Response:
+    """ Work actions endpoint. Supports If-None-Match, changes since catalog version, keyset pages and fields
     """
     work_logic = logic.Work(session=session, user=user)
-    work_list = await work_logic.get_work_list()
-    return [
-        schemas.WorkSchema.from_orm(work) for work in work_list
-    ]
+    return await services.processing_catalog_request(
+        game_logic=work_logic, schema=schemas.WorkSchema, request=request, query=query
+    )
 
 
 @router.post("/work")
 async def perform_work_action(
-        data: schemas.PerformActionSchema,
+        data: schemas.PerformBatchActionSchema,
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
 ) -> JSONResponse:
-    """ Perform work action by player id endpoint
+    """ Perform work action by player id endpoint, times days in a row
     """
     work_logic = logic.Work(session=session, user=user)
     return await services.processing_action_request(game_logic=work_logic, data=data)
 
 
+@router.post("/plan")
+async def perform_plan(
+        data: schemas.PerformPlanSchema,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> JSONResponse:
+    """ Perform ordered actions of different kinds in one transaction endpoint
+    """
+    plan_logic = logic.Plan(session=session, user=user)
+    return await services.processing_plan_request(game_logic=plan_logic, data=data)
+
+
+@router.get("/exchange", response_model=List[schemas.ExchangeRateSchema])
+async def get_exchange_rates(
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> List[dict]:
+    """ Current exchange rates endpoint
+    """
+    exchange_logic = logic.Exchange(session=session, user=user)
+    return exchange_logic.get_rates()
+
+
+@router.get("/exchange/stream")
+async def stream_exchange_rates(
+        request: Request,
+        user: User = Depends(current_user)
+) -> Response:
+    """ Exchange rate changes stream endpoint (Server-Sent Events)
+    """
+    return services.processing_exchange_stream(request=request)
+
+
+@router.post("/exchange")
+async def exchange(
+        data: schemas.ExchangeSchema,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> JSONResponse:
+    """ Exchange player balances endpoint
+    """
+    exchange_logic = logic.Exchange(session=session, user=user)
+    return await services.processing_exchange_request(game_logic=exchange_logic, data=data)
+
+
+@router.get("/dashboard", response_model=schemas.DashboardSchema)
+async def get_dashboard(
+        sections: List[schemas.DashboardSection] = Query(default=["player", "balances", "owned", "catalogs"]),
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> schemas.DashboardSchema | JSONResponse:
+    """ Player, balances, owned items and catalog versions endpoint, sections select parts of response
+    """
+    dashboard_logic = logic.Dashboard(session=session, user=user)
+    return await services.processing_dashboard_request(game_logic=dashboard_logic, sections=sections)
+
+
+@router.get("/catalog/search", response_model=List[schemas.CatalogSearchItemSchema])
+async def search_catalog(
+        query: schemas.CatalogSearchSchema = Depends(),
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> List[schemas.CatalogSearchItemSchema]:
+    """ Search of all catalogs by name, currency, price and income range and requirement endpoint
+    """
+    search_logic = logic.CatalogSearch(session=session, user=user)
+    entries = await search_logic.search(**query.search_params())
+    return [schemas.CatalogSearchItemSchema.from_orm(entry) for entry in entries]
+
+
+@router.get("/available", response_model=schemas.AvailableSchema)
+async def get_available(
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> schemas.AvailableSchema | JSONResponse:
+    """ Actions and items current player can afford and meet requirements for endpoint
+    """
+    available_logic = logic.Available(session=session, user=user)
+    return await services.processing_available_request(game_logic=available_logic)
+
+
+@router.get("/unlock/{kind}/{item_id}", response_model=schemas.UnlockPathSchema)
+async def get_unlock_path(
+        kind: schemas.CatalogKind,
+        item_id: int,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> schemas.UnlockPathSchema | JSONResponse:
+    """ Cheapest full unlock path of catalog item endpoint
+    """
+    unlock_logic = logic.Unlock(session=session, user=user)
+    return await services.processing_unlock_request(game_logic=unlock_logic, kind=kind, item_id=item_id)
+
+
+@router.get("/market/orders", response_model=List[schemas.OrderSchema])
+async def get_market_orders(
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> List[schemas.OrderSchema] | JSONResponse:
+    """ Open market orders of player endpoint
+    """
+    market_logic = logic.Market(session=session, user=user)
+    try:
+        orders = await market_logic.get_orders()
+    except exceptions.PlayerException:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"message": "Player not found"}
+        )
+    return [schemas.OrderSchema.from_orm(order) for order in orders]
+
+
+@router.post("/market/orders")
+async def place_market_order(
+        data: schemas.PlaceOrderSchema,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> JSONResponse:
+    """ Place market limit order endpoint
+    """
+    market_logic = logic.Market(session=session, user=user)
+    return await services.processing_order_request(game_logic=market_logic, data=data)
+
+
+@router.delete("/market/orders/{order_id}")
+async def cancel_market_order(
+        order_id: int,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> JSONResponse:
+    """ Cancel market order endpoint
+    """
+    market_logic = logic.Market(session=session, user=user)
+    return await services.processing_cancel_order_request(game_logic=market_logic, order_id=order_id)
+
+
+@router.get("/market/{currency_id}/{price_currency_id}")
+async def get_market_depth(
+        currency_id: int,
+        price_currency_id: int,
+        user: User = Depends(current_user)
+) -> dict:
+    """ Market book best price levels endpoint
+    """
+    return logic.Market.get_depth(
+        currency_id=currency_id, price_currency_id=price_currency_id, levels=MARKET_DEPTH
+    )
+
+
 @router.get("/food", response_model=List[schemas.FoodSchema])
 async def get_food_list(
+        request: Request,
+        query: schemas.CatalogQuerySchema = Depends(),
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
-) -> List[schemas.FoodSchema]:
-    """ Food endpoint
+) -> Response:
+    """ Food endpoint. Supports If-None-Match, changes since catalog version, keyset pages and fields
     """
     food_logic = logic.Food(session=session, user=user)
-    food_list = await food_logic.get_food_list()
-    return [
-        schemas.FoodSchema.from_orm(food) for food in food_list
-    ]
+    return await services.processing_catalog_request(
+        game_logic=food_logic, schema=schemas.FoodSchema, request=request, query=query
+    )
 
 
 @router.post("/food")
@@ -218,16 +382,17 @@ async def buy_food(
 
 @router.get("/health", response_model=List[schemas.HealthSchema])
 async def get_health_list(
+        request: Request,
+        query: schemas.CatalogQuerySchema = Depends(),
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
-) -> List[schemas.HealthSchema]:
-    """ Health endpoint
+) -> Response:
+    """ Health endpoint. Supports If-None-Match, changes since catalog version, keyset pages and fields
     """
     health_logic = logic.Health(session=session, user=user)
-    health_list = await health_logic.get_health_list()
-    return [
-        schemas.HealthSchema.from_orm(health) for health in health_list
-    ]
+    return await services.processing_catalog_request(
+        game_logic=health_logic, schema=schemas.HealthSchema, request=request, query=query
+    )
 
 
 @router.post("/health")
@@ -244,16 +409,17 @@ async def buy_health(
 
 @router.get("/leisure", response_model=List[schemas.LeisureSchema])
 async def get_leisure_list(
+        request: Request,
+        query: schemas.CatalogQuerySchema = Depends(),
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
-) -> List[schemas.LeisureSchema]:
-    """ Leisure endpoint
+) -> Response:
+    """ Leisure endpoint. Supports If-None-Match, changes since catalog version, keyset pages and fields
     """
     leisure_logic = logic.Leisure(session=session, user=user)
-    leisure_list = await leisure_logic.get_leisure_list()
-    return [
-        schemas.LeisureSchema.from_orm(leisure) for leisure in leisure_list
-    ]
+    return await services.processing_catalog_request(
+        game_logic=leisure_logic, schema=schemas.LeisureSchema, request=request, query=query
+    )
 
 
 @router.post("/leisure")
@@ -270,16 +436,17 @@ async def buy_leisure(
 
 @router.get("/business", response_model=List[schemas.BusinessSchema])
 async def get_business_list(
+        request: Request,
+        query: schemas.CatalogQuerySchema = Depends(),
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session)
-) -> List[schemas.BusinessSchema]:
-    """ Business endpoint
+) -> Response:
+    """ Business endpoint. Supports If-None-Match, changes since catalog version, keyset pages and fields
     """
     business_logic = logic.Business(session=session, user=user)
-    business_list = await business_logic.get_business_list()
-    return [
-        schemas.BusinessSchema.from_orm(business) for business in business_list
-    ]
+    return await services.processing_catalog_request(
+        game_logic=business_logic, schema=schemas.BusinessSchema, request=request, query=query
+    )
 
 
 @router.post("/business")
@@ -1,6 +1,50 @@
+from config import (
+    CATALOG_PAGE_SIZE,
+    CATALOG_PAGE_MAX_SIZE,
+    CATALOG_SEARCH_SIZE,
+    CATALOG_SEARCH_MAX_SIZE,
+    GAME_BATCH_MAX_TIMES,
+    GAME_PLAN_MAX_ACTIONS,
+)
 from datetime import datetime
-from typing import List
-from pydantic import BaseModel
+from functools import lru_cache
+from typing import Dict, List, Literal, Tuple, Type
+from pydantic import BaseModel, ConfigDict, Field, create_model
+
+
+CatalogKind = Literal["food", "health", "leisure", "work", "street", "home", "skill", "transport", "business"]
+DashboardSection = Literal["player", "balances", "owned", "catalogs"]
+
+
+def parse_fields(schema: Type[BaseModel], fields: str | None) -> Tuple[str, ...] | None:
+    """ Fields of schema from comma separated fields param, in schema order. Id is always included
+    :param schema:
+    :param fields:
+    :return: None when fields param is empty
+    """
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(schema.model_fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    if "id" in schema.model_fields:
+        requested.add("id")
+    return tuple(field for field in schema.model_fields if field in requested)
+
+
+@lru_cache(maxsize=256)
+def get_fields_schema(schema: Type[BaseModel], fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """ Schema with only fields of schema, built once for every fieldset
+    :param schema:
+    :param fields: result of parse_fields
+    :return:
+    """
+    return create_model(
+        f"{schema.__name__}[{'+'.join(fields)}]",
+        __config__=ConfigDict(from_attributes=True),
+        **{field: (schema.model_fields[field].annotation, schema.model_fields[field]) for field in fields}
+    )
 
 
 class BenefitSchemaMixin:
@@ -56,8 +100,8 @@ class BalanceBase(BaseModel):
 
 
 class BalanceSchema(BalanceBase):
-    id: int
-    updated_at: datetime
+    id: int | None
+    updated_at: datetime | None
     currency: CurrencySchema
 
 
@@ -178,6 +222,167 @@ class PerformActionSchema(BaseModel):
     id: int
 
 
+class PerformBatchActionSchema(PerformActionSchema):
+    times: int = Field(1, ge=1, le=GAME_BATCH_MAX_TIMES)
+
+
+class PlanActionSchema(PerformBatchActionSchema):
+    action: CatalogKind
+
+
+class PerformPlanSchema(BaseModel):
+    actions: List[PlanActionSchema] = Field(..., min_length=1, max_length=GAME_PLAN_MAX_ACTIONS)
+
+
+class ExchangeSchema(BaseModel):
+    from_currency_id: int
+    to_currency_id: int
+    amount: int = Field(..., gt=0)
+
+
+class PlaceOrderSchema(BaseModel):
+    currency_id: int
+    price_currency_id: int
+    side: Literal["bid", "ask"]
+    price: int = Field(..., gt=0)
+    amount: int = Field(..., gt=0)
+
+
+class UnlockStepSchema(BaseModel):
+    kind: str
+    id: int
+    name: str
+    price: int
+    currency_id: int | None
+
+
+class CurrencyAmountSchema(BaseModel):
+    currency_id: int | None
+    amount: int
+
+
+class UnlockPathSchema(BaseModel):
+    kind: CatalogKind
+    id: int
+    name: str
+    min_authority: int
+    authority: int
+    steps: List[UnlockStepSchema]
+    total: List[CurrencyAmountSchema]
+
+
+class AvailableItemSchema(BaseModel):
+    id: int
+    name: str
+    price: int
+    currency_id: int | None
+
+
+class AvailableSchema(BaseModel):
+    food: List[AvailableItemSchema]
+    health: List[AvailableItemSchema]
+    leisure: List[AvailableItemSchema]
+    work: List[AvailableItemSchema]
+    street: List[AvailableItemSchema]
+    home: List[AvailableItemSchema]
+    skill: List[AvailableItemSchema]
+    transport: List[AvailableItemSchema]
+    business: List[AvailableItemSchema]
+
+
+class OrderSchema(BaseModel):
+    id: int
+    currency_id: int
+    price_currency_id: int
+    side: str
+    price: int
+    amount: int
+    filled: int
+    status: str
+    created_at: datetime | None
+
+    class Config:
+        from_attributes = True
+
+
+class ExchangeRateSchema(BaseModel):
+    currency_id: int
+    exchange_currency_id: int
+    price: int
+    version: int
+
+
+class CatalogQuerySchema(BaseModel):
+    since: int | None = None
+    limit: int | None = None
+    after_id: int | None = None
+    order_by: Literal["id", "price", "income"] = "id"
+    currency_id: int | None = None
+    price_min: int | None = None
+    price_max: int | None = None
+    skill_id: int | None = None
+    home_id: int | None = None
+    transport_id: int | None = None
+    fields: str | None = None
+
+    def is_page(self) -> bool:
+        """ Page or filter is requested, otherwise full catalog list
+        :return:
+        """
+        if self.order_by != "id":
+            return True
+        return any(
+            value is not None
+            for field, value in self.dict(exclude={"since", "order_by", "fields"}).items()
+        )
+
+    def page_params(self) -> dict:
+        """ Params of repository get_objects_page, limit is clamped to 1..CATALOG_PAGE_MAX_SIZE
+        :return:
+        """
+        params = self.dict(exclude={"since", "fields"})
+        params["limit"] = min(max(self.limit or CATALOG_PAGE_SIZE, 1), CATALOG_PAGE_MAX_SIZE)
+        return params
+
+
+class CatalogSearchSchema(BaseModel):
+    q: str | None = None
+    kind: CatalogKind | None = None
+    currency_id: int | None = None
+    price_min: int | None = None
+    price_max: int | None = None
+    income_min: int | None = None
+    income_max: int | None = None
+    skill_id: int | None = None
+    home_id: int | None = None
+    transport_id: int | None = None
+    order_by: Literal["name", "price", "income"] = "name"
+    desc: bool = False
+    limit: int | None = None
+
+    def search_params(self) -> dict:
+        """ Params of catalog index search, limit is clamped to 1..CATALOG_SEARCH_MAX_SIZE
+        :return:
+        """
+        params = self.dict(exclude={"q", "desc"})
+        params["text"] = self.q
+        params["descending"] = self.desc
+        params["limit"] = min(max(self.limit or CATALOG_SEARCH_SIZE, 1), CATALOG_SEARCH_MAX_SIZE)
+        return params
+
+
+class CatalogSearchItemSchema(BaseModel):
+    kind: CatalogKind
+    id: int
+    name: str
+    currency_id: int | None
+    price: int | None
+    income: int | None
+
+    class Config:
+        from_attributes = True
+
+
 class WorkBase(BaseModel, ActionBaseSchema, HarmSchemaMixin):
     pass
 
@@ -309,6 +514,25 @@ class PlayerSchema(PlayerBase):
     business_list: List[BusinessSchema]
 
 
+class DashboardPlayerSchema(PlayerBase):
+    user_id: int
+    id: int
+
+
+class OwnedItemsSchema(BaseModel):
+    home: List[HomeSchema]
+    skill: List[SkillSchema]
+    transport: List[TransportSchema]
+    business: List[BusinessSchema]
+
+
+class DashboardSchema(BaseModel):
+    player: DashboardPlayerSchema | None = None
+    balances: List[BalanceSchema] | None = None
+    owned: OwnedItemsSchema | None = None
+    catalog_versions: Dict[str, int] | None = None
+
+
 class CreatePlayer(PlayerBase):
     user_id: int
 
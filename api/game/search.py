@@ -0,0 +1,216 @@
+from bisect import bisect_left, bisect_right
+from core.cache import catalog_cache
+from dataclasses import dataclass
+from game.requirements import load_catalog_snapshots
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Iterator, List, Set, Tuple
+
+
+NAME_GRAM_SIZE = 3
+
+
+@dataclass(slots=True, frozen=True)
+class CatalogEntry:
+    """ Searchable fields of one catalog row. Price is None for actions, income is None for purchases
+    """
+    kind: str
+    id: int
+    name: str
+    currency_id: int | None
+    price: int | None
+    income: int | None
+    requirements: Tuple[Tuple[str, int], ...]
+
+
+class SortedColumn:
+    """ Entry positions sorted by value, entries without value are kept after sorted ones.
+    Text values are sorted case insensitive
+    """
+    __slots__ = ("values", "order")
+
+    def __init__(self, entries: List[CatalogEntry], field: str):
+        keys = []
+        for position, entry in enumerate(entries):
+            value = getattr(entry, field)
+            keys.append((value.lower() if isinstance(value, str) else value, entry.kind, entry.id, position))
+        with_value = sorted(key for key in keys if key[0] is not None)
+        without_value = sorted(key for key in keys if key[0] is None)
+        self.values = [key[0] for key in with_value]
+        self.order = [key[-1] for key in with_value + without_value]
+
+    def get_range(self, min_value: int | None, max_value: int | None) -> Set[int]:
+        """ Positions of entries with value in min_value..max_value
+        :param min_value:
+        :param max_value:
+        :return:
+        """
+        start = 0 if min_value is None else bisect_left(self.values, min_value)
+        end = len(self.values) if max_value is None else bisect_right(self.values, max_value)
+        return set(self.order[start:end])
+
+    def iterate(self, descending: bool = False) -> Iterator[int]:
+        """ Positions in value order, entries without value are last in both directions
+        :param descending:
+        :return:
+        """
+        sorted_count = len(self.values)
+        if descending:
+            yield from reversed(self.order[:sorted_count])
+        else:
+            yield from self.order[:sorted_count]
+        yield from self.order[sorted_count:]
+
+
+class CatalogIndex:
+    """ In-memory search index of all catalogs: inverted index of name grams,
+    price and income columns sorted for range filters, positions by kind, currency and requirement
+    """
+    __slots__ = ("entries", "grams", "by_kind", "by_currency", "by_requirement", "columns")
+
+    def __init__(self, entries: List[CatalogEntry]):
+        self.entries = entries
+        self.grams: Dict[str, Set[int]] = {}
+        self.by_kind: Dict[str, Set[int]] = {}
+        self.by_currency: Dict[int | None, Set[int]] = {}
+        self.by_requirement: Dict[Tuple[str, int], Set[int]] = {}
+
+        for position, entry in enumerate(entries):
+            for gram in get_name_grams(entry.name.lower()):
+                self.grams.setdefault(gram, set()).add(position)
+            self.by_kind.setdefault(entry.kind, set()).add(position)
+            self.by_currency.setdefault(entry.currency_id, set()).add(position)
+            for requirement in entry.requirements:
+                self.by_requirement.setdefault(requirement, set()).add(position)
+
+        self.columns = {
+            "name": SortedColumn(entries, "name"),
+            "price": SortedColumn(entries, "price"),
+            "income": SortedColumn(entries, "income"),
+        }
+
+    def match_name(self, text: str) -> Set[int]:
+        """ Positions of entries with text in name, case insensitive.
+        Short text is a gram itself, longer text is checked against entries having all its grams
+        :param text:
+        :return:
+        """
+        text = text.lower()
+        if len(text) <= NAME_GRAM_SIZE:
+            return self.grams.get(text, set())
+
+        grams = sorted(
+            (self.grams.get(text[start:start + NAME_GRAM_SIZE], set())
+             for start in range(len(text) - NAME_GRAM_SIZE + 1)),
+            key=len
+        )
+        positions = set.intersection(*grams)
+        return {position for position in positions if text in self.entries[position].name.lower()}
+
+    def search(
+            self,
+            limit: int,
+            text: str | None = None,
+            kind: str | None = None,
+            currency_id: int | None = None,
+            price_min: int | None = None,
+            price_max: int | None = None,
+            income_min: int | None = None,
+            income_max: int | None = None,
+            skill_id: int | None = None,
+            home_id: int | None = None,
+            transport_id: int | None = None,
+            order_by: str = "name",
+            descending: bool = False
+    ) -> List[CatalogEntry]:
+        """ Entries matching all given filters, sorted by order_by
+        :param limit:
+        :param text: name substring
+        :param kind: catalog
+        :param currency_id:
+        :param price_min:
+        :param price_max:
+        :param income_min:
+        :param income_max:
+        :param skill_id: required skill
+        :param home_id: required home
+        :param transport_id: required transport
+        :param order_by: name, price or income
+        :param descending:
+        :return:
+        """
+        filters = []
+        if text:
+            filters.append(self.match_name(text))
+        if kind is not None:
+            filters.append(self.by_kind.get(kind, set()))
+        if currency_id is not None:
+            filters.append(self.by_currency.get(currency_id, set()))
+        for requirement in (("skill", skill_id), ("home", home_id), ("transport", transport_id)):
+            if requirement[1] is not None:
+                filters.append(self.by_requirement.get(requirement, set()))
+        if price_min is not None or price_max is not None:
+            filters.append(self.columns["price"].get_range(price_min, price_max))
+        if income_min is not None or income_max is not None:
+            filters.append(self.columns["income"].get_range(income_min, income_max))
+
+        matched = set.intersection(*sorted(filters, key=len)) if filters else None
+        if matched is not None and not matched:
+            return []
+
+        found = []
+        for position in self.columns[order_by].iterate(descending=descending):
+            if matched is None or position in matched:
+                found.append(self.entries[position])
+                if len(found) == limit:
+                    break
+        return found
+
+
+def get_name_grams(name: str) -> Set[str]:
+    """ All substrings of name up to NAME_GRAM_SIZE characters
+    :param name:
+    :return:
+    """
+    return {
+        name[start:start + size]
+        for size in range(1, NAME_GRAM_SIZE + 1)
+        for start in range(len(name) - size + 1)
+    }
+
+
+def get_entry(kind: str, entity, row) -> CatalogEntry:
+    """ Search entry of catalog row. Income of actions is the lower bound of their income range
+    :param kind: catalog
+    :param entity: catalog repository
+    :param row: catalog row
+    :return:
+    """
+    income = getattr(row, "income_min", None)
+    if income is None:
+        income = getattr(row, "income", None)
+    return CatalogEntry(
+        kind=kind,
+        id=row.id,
+        name=row.name,
+        currency_id=row.currency_id,
+        price=getattr(row, "price", None),
+        income=income,
+        requirements=entity.get_action_plan(row).requirements,
+    )
+
+
+async def get_catalog_index(session: AsyncSession) -> CatalogIndex:
+    """ Search index of current catalogs. Index is cached by catalog versions,
+    so any catalog change builds a new one
+    :param session:
+    :return:
+    """
+    versions, snapshots = await load_catalog_snapshots(session=session)
+
+    async def build() -> CatalogIndex:
+        return CatalogIndex([
+            get_entry(kind, entity, row)
+            for kind, (entity, snapshot) in snapshots.items() for row in snapshot.items
+        ])
+
+    return await catalog_cache.get_or_load(CatalogIndex, versions, build)
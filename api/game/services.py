@@ -1,7 +1,192 @@
-from fastapi import status
-from fastapi.responses import JSONResponse
+from config import EXCHANGE_STREAM_HEARTBEAT
+from core.cache import catalog_cache
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from game import exceptions, schemas, logic
-from typing import Union
+from game.exchange import exchange_rates
+from pydantic import BaseModel
+from typing import AsyncGenerator, Dict, List, Type, Union
+
+import gzip
+import json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+CatalogGameLogic = Union[
+    logic.Business, logic.Home, logic.Skill, logic.Transport, logic.StreetAction,
+    logic.Work, logic.Food, logic.Health, logic.Leisure
+]
+
+
+async def processing_catalog_request(
+        game_logic: CatalogGameLogic,
+        schema: Type[BaseModel],
+        request: Request,
+        query: schemas.CatalogQuerySchema
+) -> Response:
+    """ Catalog list requests. Catalog version is returned as ETag, matching If-None-Match gets 304.
+    With since returns only rows changed and ids deleted after that version,
+    with page or filter params returns keyset page filtered in db.
+    With fields only these fields are serialized and selected from db
+    :param game_logic:
+    :param schema:
+    :param request:
+    :param query:
+    :return:
+    """
+    try:
+        fields = schemas.parse_fields(schema, query.fields)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": str(e)}
+        )
+
+    version = await game_logic.get_catalog_version()
+    etag = f'W/"{version}"'
+    if fields:
+        schema = schemas.get_fields_schema(schema, fields)
+        etag = f'W/"{version}:{"+".join(fields)}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag}
+        )
+
+    if query.since is None and query.is_page():
+        params = query.page_params()
+        try:
+            items = await game_logic.get_catalog_page(fields=fields, **params)
+        except ValueError as e:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"message": str(e)}
+            )
+        headers = {"ETag": etag}
+        if len(items) == params["limit"]:
+            headers["X-Next-After-Id"] = str(items[-1].id)
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content=jsonable_encoder([schema.from_orm(item) for item in items]),
+            headers=headers
+        )
+
+    if query.since is None:
+        payload = await get_catalog_payload(game_logic=game_logic, schema=schema, version=version)
+        encoding = choose_encoding(request.headers.get("accept-encoding"), payload.bodies)
+        headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(
+            status_code=status.HTTP_200_OK,
+            content=payload.bodies[encoding],
+            media_type="application/json",
+            headers=headers
+        )
+
+    version, items, deleted_ids = await game_logic.get_catalog_changes(since=query.since, fields=fields)
+    etag = f'W/"{version}"'
+    if fields:
+        etag = f'W/"{version}:{"+".join(fields)}"'
+    content = {
+        "version": version,
+        "items": [schema.from_orm(item) for item in items],
+        "deleted": deleted_ids
+    }
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=jsonable_encoder(content),
+        headers={"ETag": etag}
+    )
+
+
+class CatalogPayload:
+    """ Encoded catalog list response body with its compressed variants.
+    br variant is built only with brotli extra installed (poetry install -E brotli)
+    """
+
+    def __init__(self, body: bytes):
+        self.bodies: Dict[str, bytes] = {
+            "identity": body,
+            "gzip": gzip.compress(body, compresslevel=6),
+        }
+        if brotli:
+            self.bodies["br"] = brotli.compress(body)
+
+
+async def get_catalog_payload(
+        game_logic: CatalogGameLogic,
+        schema: Type[BaseModel],
+        version: int
+) -> CatalogPayload:
+    """ Catalog list body serialized once per catalog version and cached next to the catalog rows
+    :param game_logic:
+    :param schema:
+    :param version: catalog version
+    :return:
+    """
+    async def build() -> CatalogPayload:
+        items = await game_logic.get_catalog_list()
+        content = jsonable_encoder([schema.from_orm(item) for item in items])
+        return CatalogPayload(body=json.dumps(content, separators=(",", ":")).encode())
+
+    return await catalog_cache.get_or_load(
+        game_logic.repository.model, ("payload", schema.__name__, version), build
+    )
+
+
+def choose_encoding(accept_encoding: str | None, available: Dict[str, bytes]) -> str:
+    """ Pick content encoding by Accept-Encoding header q-values, brotli is preferred over gzip
+    :param accept_encoding:
+    :param available: encoded bodies by encoding name
+    :return:
+    """
+    if not accept_encoding:
+        return "identity"
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    default_weight = weights.get("*", 0.0)
+    preference = ("br", "gzip")
+    candidates = [
+        (weights.get(encoding, default_weight), -preference.index(encoding), encoding)
+        for encoding in preference if encoding in available
+    ]
+    candidates = [candidate for candidate in candidates if candidate[0] > 0]
+    if not candidates:
+        return "identity"
+    return max(candidates)[2]
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """ Check If-None-Match header value against etag with weak comparison
+    :param if_none_match:
+    :param etag:
+    :return:
+    """
+    if not if_none_match:
+        return False
+    etag = etag.removeprefix("W/")
+    for value in if_none_match.split(","):
+        value = value.strip()
+        if value == "*" or value.removeprefix("W/") == etag:
+            return True
+    return False
 
 
 async def processing_buy_item_request(
@@ -32,6 +217,11 @@ async def processing_buy_item_request(
             status_code=status.HTTP_403_FORBIDDEN,
             content={"message": "Player not found"}
         )
+    except exceptions.ConflictError as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"message": str(e)}
+        )
     except (exceptions.NoMoneyError, exceptions.NoPossibilityError) as e:
         return JSONResponse(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -66,6 +256,11 @@ async def processing_buy_services_request(
             status_code=status.HTTP_403_FORBIDDEN,
             content={"message": "Player not found"}
         )
+    except exceptions.ConflictError as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"message": str(e)}
+        )
     except exceptions.NoMoneyError as e:
         return JSONResponse(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -81,15 +276,15 @@ async def processing_action_request(
         game_logic: Union[
             logic.StreetAction, logic.Work
         ],
-        data: schemas.PerformActionSchema
+        data: schemas.PerformBatchActionSchema
 ) -> JSONResponse:
-    """ Action requests
+    """ Action requests, data.times days in a row
     :param game_logic:
     :param data:
     :return:
     """
     try:
-        await game_logic.run(data.id)
+        steps = await game_logic.run(data.id, times=data.times)
     except exceptions.NotFoundException as e:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -100,6 +295,11 @@ async def processing_action_request(
             status_code=status.HTTP_403_FORBIDDEN,
             content={"message": "Player not found"}
         )
+    except exceptions.ConflictError as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"message": str(e)}
+        )
     except exceptions.NoPossibilityError as e:
         return JSONResponse(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -107,5 +307,284 @@ async def processing_action_request(
         )
     return JSONResponse(
             status_code=status.HTTP_200_OK,
-            content={"message": "Ok"}
+            content={"message": "Ok", "steps": steps}
+        )
+
+
+plan_error_statuses = (
+    (exceptions.NotFoundException, status.HTTP_404_NOT_FOUND),
+    (exceptions.AlreadyExistError, status.HTTP_409_CONFLICT),
+    (exceptions.NoMoneyError, status.HTTP_403_FORBIDDEN),
+    (exceptions.NoPossibilityError, status.HTTP_403_FORBIDDEN),
+)
+
+
+async def processing_plan_request(
+        game_logic: logic.Plan,
+        data: schemas.PerformPlanSchema
+) -> JSONResponse:
+    """ Plan requests. Failed action is answered with the status of its single request
+    and the index of the action in plan
+    :param game_logic:
+    :param data:
+    :return:
+    """
+    try:
+        results = await game_logic.run(data.actions)
+    except exceptions.PlanStepError as e:
+        status_code = next(
+            code for error_class, code in plan_error_statuses if isinstance(e.error, error_class)
+        )
+        return JSONResponse(
+            status_code=status_code,
+            content={"message": str(e), "step": e.step}
+        )
+    except exceptions.PlayerException:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"message": "Player not found"}
+        )
+    except exceptions.ConflictError as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"message": str(e)}
+        )
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"message": "Ok", "results": results}
+    )
+
+
+async def processing_exchange_request(
+        game_logic: logic.Exchange,
+        data: schemas.ExchangeSchema
+) -> JSONResponse:
+    """ Exchange requests
+    :param game_logic:
+    :param data:
+    :return:
+    """
+    try:
+        result = await game_logic.exchange(
+            from_currency_id=data.from_currency_id,
+            to_currency_id=data.to_currency_id,
+            amount=data.amount
         )
+    except exceptions.NotFoundException as e:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": str(e)}
+        )
+    except exceptions.PlayerException:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"message": "Player not found"}
+        )
+    except exceptions.ConflictError as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"message": str(e)}
+        )
+    except (exceptions.NoMoneyError, exceptions.NoPossibilityError) as e:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"message": str(e)}
+        )
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"message": "Ok", **result}
+    )
+
+
+def processing_exchange_stream(request: Request) -> StreamingResponse:
+    """ Server-Sent Events stream of exchange rates. Each event has rates changed after the previous one,
+    reconnect with Last-Event-ID gets only rates changed after that version
+    :param request:
+    :return:
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    since = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def events() -> AsyncGenerator[str, None]:
+        version = since if since <= exchange_rates.version else 0
+        while not await request.is_disconnected():
+            if not await exchange_rates.wait_changes(since=version, timeout=EXCHANGE_STREAM_HEARTBEAT):
+                yield ": heartbeat\n\n"
+                continue
+            rates = exchange_rates.get_changes(since=version)
+            version = exchange_rates.version
+            if not rates:
+                continue
+            yield f"id: {version}\nevent: rates\ndata: {json.dumps(rates, separators=(',', ':'))}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def processing_order_request(
+        game_logic: logic.Market,
+        data: schemas.PlaceOrderSchema
+) -> JSONResponse:
+    """ Place order requests
+    :param game_logic:
+    :param data:
+    :return:
+    """
+    try:
+        result = await game_logic.place_order(**data.dict())
+    except exceptions.NotFoundException as e:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": str(e)}
+        )
+    except exceptions.PlayerException:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"message": "Player not found"}
+        )
+    except exceptions.ConflictError as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"message": str(e)}
+        )
+    except (exceptions.NoMoneyError, exceptions.NoPossibilityError) as e:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"message": str(e)}
+        )
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"message": "Ok", **result}
+    )
+
+
+async def processing_cancel_order_request(game_logic: logic.Market, order_id: int) -> JSONResponse:
+    """ Cancel order requests
+    :param game_logic:
+    :param order_id:
+    :return:
+    """
+    try:
+        await game_logic.cancel_order(order_id)
+    except exceptions.NotFoundException as e:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": str(e)}
+        )
+    except exceptions.PlayerException:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"message": "Player not found"}
+        )
+    except exceptions.ConflictError as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"message": str(e)}
+        )
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"message": "Ok"}
+    )
+
+
+async def processing_unlock_request(
+        game_logic: logic.Unlock,
+        kind: str,
+        item_id: int
+) -> schemas.UnlockPathSchema | JSONResponse:
+    """ Unlock path requests
+    :param game_logic:
+    :param kind: catalog of item
+    :param item_id:
+    :return:
+    """
+    try:
+        result = await game_logic.get_unlock_path(kind=kind, item_id=item_id)
+    except exceptions.NotFoundException as e:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": str(e)}
+        )
+    except exceptions.PlayerException:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"message": "Player not found"}
+        )
+    return schemas.UnlockPathSchema(**result)
+
+
+async def processing_available_request(game_logic: logic.Available) -> schemas.AvailableSchema | JSONResponse:
+    """ Available now requests
+    :param game_logic:
+    :return:
+    """
+    try:
+        available = await game_logic.get_available()
+    except exceptions.PlayerException:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"message": "Player not found"}
+        )
+    return schemas.AvailableSchema(**available)
+
+
+async def processing_info_request(
+        game_logic: logic.Player,
+        fields: str | None
+) -> schemas.PlayerSchema | JSONResponse:
+    """ Player info requests. With fields only these fields are serialized,
+    selected from db and only their relationships are loaded
+    :param game_logic:
+    :param fields: comma separated PlayerSchema fields
+    :return:
+    """
+    try:
+        player_fields = schemas.parse_fields(schemas.PlayerSchema, fields)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": str(e)}
+        )
+
+    player_info = await game_logic.get_info(fields=player_fields)
+    if not player_info:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": f"Player is not exist for user - {game_logic.user.email}"}
+        )
+    if player_fields:
+        schema = schemas.get_fields_schema(schemas.PlayerSchema, player_fields)
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content=jsonable_encoder(schema.from_orm(player_info))
+        )
+    return schemas.PlayerSchema.from_orm(player_info)
+
+
+async def processing_dashboard_request(
+        game_logic: logic.Dashboard,
+        sections: List[str]
+) -> schemas.DashboardSchema | JSONResponse:
+    """ Dashboard requests
+    :param game_logic:
+    :param sections: player, balances, owned, catalogs
+    :return:
+    """
+    try:
+        dashboard = await game_logic.get_dashboard(sections=set(sections))
+    except exceptions.PlayerException:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"message": "Player not found"}
+        )
+    return schemas.DashboardSchema(
+        player=schemas.DashboardPlayerSchema.from_orm(dashboard["player"]) if "player" in dashboard else None,
+        balances=[
+            schemas.BalanceSchema.from_orm(balance) for balance in dashboard["balances"]
+        ] if "balances" in dashboard else None,
+        owned=schemas.OwnedItemsSchema(**dashboard["owned"]) if "owned" in dashboard else None,
+        catalog_versions=dashboard.get("catalog_versions"),
+    )
@@ -0,0 +1,375 @@
+from config import logger
+from core.engine import async_session_maker
+from core import repository_entity
+from typing import Dict, List
+
+import argparse
+import asyncio
+import json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+STATS = ("hunger", "rest", "health")
+ITEM_KINDS = ("skill", "transport", "home", "business")
+
+
+class SimulationCatalog:
+    """ Catalog rows as plain dicts, loaded once for all simulations
+    """
+
+    def __init__(self, currency_ids: List[int], **rows: List[dict]):
+        self.currency_ids = currency_ids
+        self.currency_index = {currency_id: index for index, currency_id in enumerate(currency_ids)}
+        self.works = rows.get("works", [])
+        self.street_actions = rows.get("street_actions", [])
+        self.foods = rows.get("foods", [])
+        self.healths = rows.get("healths", [])
+        self.leisures = rows.get("leisures", [])
+        self.items = {
+            "skill": rows.get("skills", []),
+            "transport": rows.get("transports", []),
+            "home": rows.get("homes", []),
+            "business": rows.get("businesses", []),
+        }
+        self.item_index = {
+            kind: {row["id"]: index for index, row in enumerate(self.items[kind])} for kind in ITEM_KINDS
+        }
+
+        without_currency = [
+            f"{name} {row['id']}" for name, name_rows in rows.items() for row in name_rows if not self.has_currency(row)
+        ]
+        if without_currency:
+            logger.warning(f"Rows without currency are not simulated: {', '.join(without_currency)}")
+
+    def has_currency(self, row: dict) -> bool:
+        """ Row currency is known. Rows without currency can not be paid in the game:
+        money check fails without balance and income is not credited
+        :param row:
+        :return:
+        """
+        return row["currency_id"] in self.currency_index
+
+    @property
+    def services(self) -> List[dict]:
+        return self.foods + self.healths + self.leisures
+
+
+async def load_catalog() -> SimulationCatalog:
+    """ Load simulated catalogs through the cached repositories
+    :return:
+    """
+    entities = {
+        "works": repository_entity.WorkEntity,
+        "street_actions": repository_entity.StreetActionEntity,
+        "foods": repository_entity.FoodEntity,
+        "healths": repository_entity.HealthEntity,
+        "leisures": repository_entity.LeisureEntity,
+        "homes": repository_entity.HomeEntity,
+        "skills": repository_entity.SkillEntity,
+        "transports": repository_entity.TransportEntity,
+        "businesses": repository_entity.BusinessEntity,
+    }
+    rows = {}
+    async with async_session_maker() as session:
+        for name, entity in entities.items():
+            items = await entity(session=session).get_objects_list()
+            rows[name] = [
+                {column: getattr(item, column) for column in item.__table__.columns.keys()} for item in items
+            ]
+        currencies = await repository_entity.CurrencyEntity(session=session).get_objects_list()
+    return SimulationCatalog(currency_ids=[currency.id for currency in currencies], **rows)
+
+
+class SimulationPolicy:
+    """ Daily choice of a simulated player: restore a stat below its threshold (hunger, health, rest),
+    else buy the cheapest available item keeping reserve, else work or street action with the best mean income
+    """
+
+    def __init__(
+            self,
+            hunger_threshold: int = 40,
+            rest_threshold: int = 40,
+            health_threshold: int = 40,
+            reserve: int = 0
+    ):
+        self.thresholds = {"hunger": hunger_threshold, "rest": rest_threshold, "health": health_threshold}
+        self.reserve = reserve
+
+    def to_dict(self) -> dict:
+        return {**{f"{stat}_threshold": value for stat, value in self.thresholds.items()}, "reserve": self.reserve}
+
+
+class Simulation:
+    """ Players of one simulation as arrays, every game rule is applied to all players of a catalog row at once.
+    Rolls are inclusive like Game._get_random_value, day end is Game._check_dead
+    """
+
+    def __init__(self, catalog: SimulationCatalog, players: int, policy: SimulationPolicy, seed: int | None = None):
+        if np is None:
+            raise RuntimeError("numpy is required for the simulator, install simulation extra")
+        self.catalog = catalog
+        self.policy = policy
+        self.size = players
+        self.rng = np.random.default_rng(seed)
+
+        self.stats = {stat: np.full(players, 100, dtype=np.int64) for stat in STATS}
+        self.authority = np.zeros(players, dtype=np.int64)
+        self.deadly_days = np.zeros(players, dtype=np.int64)
+        self.alive = np.ones(players, dtype=bool)
+        self.death_day = np.full(players, -1, dtype=np.int64)
+        self.balances = np.zeros((players, len(catalog.currency_ids)), dtype=np.int64)
+        self.owned = {
+            kind: np.zeros((players, len(catalog.items[kind])), dtype=bool) for kind in ITEM_KINDS
+        }
+        self.business_start = np.full((players, len(catalog.items["business"])), -1, dtype=np.int64)
+        self.first_business_day = np.full(players, -1, dtype=np.int64)
+        self.day = 1
+
+        self.restore_services = {
+            stat: sorted(
+                (row for row in catalog.services
+                 if catalog.has_currency(row) and (row[f"{stat}_benefit_max"] or 0) > 0),
+                key=lambda row: -((row[f"{stat}_benefit_min"] or 0) + row[f"{stat}_benefit_max"])
+            )
+            for stat in STATS
+        }
+        self.purchases = sorted(
+            ((kind, index, row) for kind in ITEM_KINDS for index, row in enumerate(catalog.items[kind])
+             if catalog.has_currency(row)),
+            key=lambda purchase: purchase[2]["price"]
+        )
+        self.actions = [
+            sorted(
+                (row for row in rows if catalog.has_currency(row)),
+                key=lambda row: -(row["income_min"] + row["income_max"])
+            )
+            for rows in (catalog.works, catalog.street_actions)
+        ]
+
+    def roll(self, low: int | None, high: int | None, size: int):
+        return self.rng.integers(low or 0, (high or 0) + 1, size=size)
+
+    def run(self, days: int, report_step: int = 1) -> dict:
+        """ Simulate days, one action per player and day like the game
+        :param days:
+        :param report_step: days between samples of by day series
+        :return: report
+        """
+        samples = {"day": [], "alive": [], "money": []}
+        for _ in range(days):
+            self.step()
+            if self.day % report_step == 0:
+                samples["day"].append(self.day)
+                samples["alive"].append(round(float(self.alive.mean()), 4))
+                samples["money"].append(self.balances.sum(axis=0).tolist())
+        return self.report(samples)
+
+    def step(self) -> None:
+        pending = self.alive.copy()
+        pending = self._restore_stats(pending)
+        pending = self._buy_items(pending)
+        self._perform_actions(pending)
+        self._next_day()
+
+    def _restore_stats(self, pending):
+        for stat in ("hunger", "health", "rest"):
+            need = pending & (self.stats[stat] < self.policy.thresholds[stat])
+            if not need.any():
+                continue
+            for row in self.restore_services[stat]:
+                mask = need & self._affordable(row, reserve=0)
+                if mask.any():
+                    self._apply_service(row, mask)
+                    need &= ~mask
+                    pending &= ~mask
+        return pending
+
+    def _buy_items(self, pending):
+        for kind, index, row in self.purchases:
+            mask = pending & ~self.owned[kind][:, index] & self._affordable(row, reserve=self.policy.reserve)
+            if kind == "business":
+                mask &= self._available(row)
+                if row.get("min_authority"):
+                    mask &= self.authority >= row["min_authority"]
+            if not mask.any():
+                continue
+            self.balances[mask, self._currency(row)] -= row["price"]
+            self.owned[kind][mask, index] = True
+            if kind == "business":
+                self.business_start[mask, index] = self.day + 1
+                self.first_business_day[mask & (self.first_business_day < 0)] = self.day
+            pending &= ~mask
+        return pending
+
+    def _perform_actions(self, pending) -> None:
+        for rows in self.actions:
+            for row in rows:
+                mask = pending & self._available(row)
+                if mask.any():
+                    self._apply_action(row, mask)
+                    pending &= ~mask
+
+    def _apply_service(self, row: dict, mask) -> None:
+        """ ServicesGame.buy_service: benefits, authority benefit and price
+        """
+        size = int(mask.sum())
+        for stat in STATS:
+            self.stats[stat][mask] += self.roll(row[f"{stat}_benefit_min"], row[f"{stat}_benefit_max"], size)
+        self._add_authority(row, mask, size)
+        self.balances[mask, self._currency(row)] -= row["price"]
+
+    def _apply_action(self, row: dict, mask) -> None:
+        """ ActionGame.perform_action: harm, authority benefit and income
+        """
+        size = int(mask.sum())
+        for stat in STATS:
+            self.stats[stat][mask] -= self.roll(row[f"{stat}_harm_min"], row[f"{stat}_harm_max"], size)
+        self._add_authority(row, mask, size)
+        self.balances[mask, self._currency(row)] += self.roll(row["income_min"], row["income_max"], size)
+
+    def _add_authority(self, row: dict, mask, size: int) -> None:
+        """ Game._get_authority_benefit: no benefit when min or max is empty or zero
+        """
+        if row.get("authority_benefit_min") and row.get("authority_benefit_max"):
+            self.authority[mask] += self.roll(row["authority_benefit_min"], row["authority_benefit_max"], size)
+
+    def _next_day(self) -> None:
+        """ Game.next_day and Game._check_dead for alive players, then business income of the new day
+        """
+        alive = self.alive
+        dead_mode = np.zeros(self.size, dtype=bool)
+        for stat in STATS:
+            values = self.stats[stat]
+            dead_mode |= values <= 0
+            np.clip(values, 0, 100, out=values, where=alive)
+
+        self.deadly_days[alive & dead_mode] += 1
+        self.deadly_days[alive & ~dead_mode] = 0
+        died = alive & (self.deadly_days > 7)
+        self.alive[died] = False
+        self.death_day[died] = self.day
+        self.day += 1
+
+        for index, row in enumerate(self.catalog.items["business"]):
+            if not row["income_period"] or not self.catalog.has_currency(row):
+                continue
+            passed = self.day - self.business_start[:, index]
+            paid = self.alive & self.owned["business"][:, index] & (passed > 0) & (passed % row["income_period"] == 0)
+            self.balances[paid, self._currency(row)] += row["income"]
+
+    def _affordable(self, row: dict, reserve: int):
+        return self.balances[:, self._currency(row)] - row["price"] >= reserve
+
+    def _available(self, row: dict):
+        """ Game.check_availability: transport, home and skill of row are owned
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for kind in ("transport", "home", "skill"):
+            item_id = row.get(f"{kind}_id")
+            if item_id:
+                index = self.catalog.item_index[kind].get(item_id)
+                if index is None:
+                    return np.zeros(self.size, dtype=bool)
+                mask &= self.owned[kind][:, index]
+        return mask
+
+    def _currency(self, row: dict) -> int:
+        return self.catalog.currency_index[row["currency_id"]]
+
+    def report(self, samples: Dict[str, list]) -> dict:
+        """ Money supply, survival and time to first business distributions
+        :param samples:
+        :return:
+        """
+        percentiles = (10, 50, 90)
+
+        def distribution(values) -> dict:
+            if not len(values):
+                return {f"p{percentile}": None for percentile in percentiles}
+            return {
+                f"p{percentile}": float(value)
+                for percentile, value in zip(percentiles, np.percentile(values, percentiles))
+            }
+
+        money_supply = {}
+        for index, currency_id in enumerate(self.catalog.currency_ids):
+            balances = self.balances[:, index]
+            money_supply[currency_id] = {
+                "total": int(balances.sum()),
+                "mean": round(float(balances.mean()), 2),
+                **distribution(balances),
+                "by_day": [money[index] for money in samples["money"]],
+            }
+
+        dead = self.death_day[self.death_day >= 0]
+        business = self.first_business_day[self.first_business_day >= 0]
+        return {
+            "players": self.size,
+            "days": self.day - 1,
+            "policy": self.policy.to_dict(),
+            "money_supply": money_supply,
+            "survival": {
+                "alive": round(float(self.alive.mean()), 4),
+                "death_day": distribution(dead),
+                "by_day": dict(zip(samples["day"], samples["alive"])),
+            },
+            "time_to_business": {
+                "share": round(len(business) / self.size, 4),
+                **distribution(business),
+            },
+        }
+
+
+def simulate(
+        catalog: SimulationCatalog,
+        players: int = 100000,
+        days: int = 365,
+        policy: SimulationPolicy | None = None,
+        seed: int | None = None,
+        report_step: int = 1
+) -> dict:
+    """ Run vectorized simulation of players for days
+    :param catalog:
+    :param players:
+    :param days:
+    :param policy:
+    :param seed:
+    :param report_step: days between samples of by day series
+    :return: report
+    """
+    simulation = Simulation(catalog=catalog, players=players, policy=policy or SimulationPolicy(), seed=seed)
+    return simulation.run(days=days, report_step=report_step)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of game economy on catalog tables")
+    parser.add_argument("--players", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report-step", type=int, default=30)
+    parser.add_argument("--hunger-threshold", type=int, default=40)
+    parser.add_argument("--rest-threshold", type=int, default=40)
+    parser.add_argument("--health-threshold", type=int, default=40)
+    parser.add_argument("--reserve", type=int, default=0)
+    args = parser.parse_args()
+
+    logger.debug(f"Simulate {args.players} players for {args.days} days")
+    simulation_catalog = asyncio.run(load_catalog())
+    simulation_policy = SimulationPolicy(
+        hunger_threshold=args.hunger_threshold,
+        rest_threshold=args.rest_threshold,
+        health_threshold=args.health_threshold,
+        reserve=args.reserve
+    )
+    print(json.dumps(simulate(
+        catalog=simulation_catalog,
+        players=args.players,
+        days=args.days,
+        policy=simulation_policy,
+        seed=args.seed,
+        report_step=args.report_step
+    ), indent=2))
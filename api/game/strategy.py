@@ -0,0 +1,367 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from config import logger
+from core.engine import async_session_maker, engine
+from core import repository_entity
+from game import models
+from game.simulator import SimulationCatalog, load_catalog
+from sqlalchemy import select
+from typing import List, Tuple
+
+import argparse
+import asyncio
+import heapq
+import json
+import os
+
+
+State = namedtuple(
+    "State", ("hunger", "rest", "health", "authority", "deadly_days", "balances", "owned", "businesses", "history")
+)
+Action = namedtuple(
+    "Action", (
+        "kind", "id", "name", "currency", "price", "income", "changes", "authority",
+        "requirements", "min_authority", "item", "income_period",
+    )
+)
+
+STATS = ("hunger", "rest", "health")
+
+_actions: Tuple[Action, ...] = ()
+
+
+def _mean(low: int | None, high: int | None) -> float:
+    return ((low or 0) + (high or 0)) / 2
+
+
+def _authority_mean(row: dict) -> float:
+    """ Game._get_authority_benefit: no benefit when min or max is empty or zero
+    """
+    if row.get("authority_benefit_min") and row.get("authority_benefit_max"):
+        return _mean(row["authority_benefit_min"], row["authority_benefit_max"])
+    return 0
+
+
+def compile_actions(catalog: SimulationCatalog) -> Tuple[Action, ...]:
+    """ Every catalog row as action with expected rolls and the requirement graph edges.
+    Rows without currency are skipped like in the simulator
+    :param catalog:
+    :return:
+    """
+    actions = []
+
+    def requirements(row: dict) -> Tuple[Tuple[str, int], ...]:
+        return tuple(
+            (kind, row[f"{kind}_id"]) for kind in ("transport", "home", "skill") if row.get(f"{kind}_id")
+        )
+
+    for kind, rows in (("work", catalog.works), ("street", catalog.street_actions)):
+        for row in rows:
+            if not catalog.has_currency(row):
+                continue
+            actions.append(Action(
+                kind=kind, id=row["id"], name=row["name"], currency=catalog.currency_index[row["currency_id"]],
+                price=0, income=_mean(row["income_min"], row["income_max"]),
+                changes=tuple(-_mean(row[f"{stat}_harm_min"], row[f"{stat}_harm_max"]) for stat in STATS),
+                authority=_authority_mean(row), requirements=requirements(row),
+                min_authority=0, item=None, income_period=0,
+            ))
+
+    for kind, rows in (("food", catalog.foods), ("health", catalog.healths), ("leisure", catalog.leisures)):
+        for row in rows:
+            if not catalog.has_currency(row):
+                continue
+            actions.append(Action(
+                kind=kind, id=row["id"], name=row["name"], currency=catalog.currency_index[row["currency_id"]],
+                price=row["price"], income=0,
+                changes=tuple(_mean(row[f"{stat}_benefit_min"], row[f"{stat}_benefit_max"]) for stat in STATS),
+                authority=_authority_mean(row), requirements=(),
+                min_authority=0, item=None, income_period=0,
+            ))
+
+    for kind, rows in catalog.items.items():
+        for row in rows:
+            if not catalog.has_currency(row):
+                continue
+            is_business = kind == "business"
+            actions.append(Action(
+                kind=kind, id=row["id"], name=row["name"], currency=catalog.currency_index[row["currency_id"]],
+                price=row["price"], income=row["income"] if is_business else 0,
+                changes=(0, 0, 0), authority=0,
+                requirements=requirements(row) if is_business else (),
+                min_authority=(row.get("min_authority") or 0) if is_business else 0,
+                item=(kind, row["id"]), income_period=row["income_period"] if is_business else 0,
+            ))
+    return tuple(actions)
+
+
+def apply_action(state: State, action_index: int, day: int) -> State | None:
+    """ Expected result of one game day with action, like the game flows followed by Game.next_day
+    :param state:
+    :param action_index:
+    :param day: game day before action
+    :return: new state or None if action is not possible or player dies
+    """
+    action = _actions[action_index]
+    if action.item and action.item in state.owned:
+        return None
+    if action.min_authority > state.authority:
+        return None
+    for requirement in action.requirements:
+        if requirement not in state.owned:
+            return None
+
+    balances = list(state.balances)
+    if action.price:
+        if balances[action.currency] < action.price:
+            return None
+        balances[action.currency] -= action.price
+    if not action.item:
+        balances[action.currency] += action.income
+
+    stats = [state.hunger, state.rest, state.health]
+    dead_mode = False
+    for index, change in enumerate(action.changes):
+        value = stats[index] + change
+        if value <= 0:
+            value = 0
+            dead_mode = True
+        stats[index] = min(value, 100)
+    deadly_days = state.deadly_days + 1 if dead_mode else 0
+    if deadly_days > 7:
+        return None
+
+    owned = state.owned
+    businesses = state.businesses
+    if action.item:
+        owned = owned | {action.item}
+        if action.kind == "business":
+            businesses = businesses + ((action_index, day + 1),)
+
+    for business_index, start_day in businesses:
+        business = _actions[business_index]
+        passed = day + 1 - start_day
+        if business.income_period and passed > 0 and passed % business.income_period == 0:
+            balances[business.currency] += business.income
+
+    return State(
+        hunger=stats[0], rest=stats[1], health=stats[2], authority=state.authority + action.authority,
+        deadly_days=deadly_days, balances=tuple(balances), owned=owned, businesses=businesses,
+        history=state.history + (action_index,),
+    )
+
+
+def score(state: State, weights: Tuple[float, ...]) -> float:
+    """ Money weighted by currency plus price of owned items, so buying an item does not lose score
+    :param state:
+    :param weights:
+    :return:
+    """
+    assets = sum(
+        action.price * weights[action.currency] for action in _actions if action.item in state.owned
+    ) if state.owned else 0
+    return sum(amount * weight for amount, weight in zip(state.balances, weights)) + assets
+
+
+def _state_key(state: State) -> tuple:
+    return (
+        round(state.hunger, 1), round(state.rest, 1), round(state.health, 1), round(state.authority, 1),
+        state.deadly_days, tuple(round(amount, 1) for amount in state.balances), state.owned, state.businesses,
+    )
+
+
+def _init_worker(actions: Tuple[Action, ...]) -> None:
+    global _actions
+    _actions = actions
+
+
+def expand(args: Tuple[List[State], int, int, Tuple[float, ...]]) -> List[Tuple[float, State]]:
+    """ All next states of beam chunk, only the best width of them
+    :param args: states, day, width, weights
+    :return: scored states
+    """
+    states, day, width, weights = args
+    children = []
+    for state in states:
+        for action_index in range(len(_actions)):
+            child = apply_action(state, action_index, day)
+            if child is not None:
+                children.append((score(child, weights), child))
+    return heapq.nlargest(width, children, key=lambda item: item[0])
+
+
+def search(
+        actions: Tuple[Action, ...],
+        start: State,
+        days: int,
+        width: int,
+        weights: Tuple[float, ...],
+        workers: int | None = None,
+        start_day: int = 1
+) -> State | None:
+    """ Beam search of the best score action sequence. Each day the beam is expanded in chunks
+    by worker processes, catalog actions are sent to every worker once
+    :param actions:
+    :param start: player state
+    :param days: search depth
+    :param width: beam width
+    :param weights: value of currency units
+    :param workers: processes, cpu count by default
+    :param start_day: game day of player
+    :return: best state with history or None if player can not survive
+    """
+    _init_worker(actions)
+    workers = workers or os.cpu_count() or 1
+    beam = [start]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(actions,)) as pool:
+        for day in range(start_day, start_day + days):
+            chunk_size = max(1, -(-len(beam) // (workers * 4)))
+            chunks = [(beam[index:index + chunk_size], day, width, weights) for index in range(0, len(beam), chunk_size)]
+
+            children = {}
+            for part in pool.map(expand, chunks):
+                for child_score, child in part:
+                    key = _state_key(child)
+                    if key not in children or children[key][0] < child_score:
+                        children[key] = (child_score, child)
+            if not children:
+                return None
+            beam = [child for _, child in heapq.nlargest(width, children.values(), key=lambda item: item[0])]
+            logger.debug(f"Strategy search day {day}: {len(children)} states")
+    return beam[0]
+
+
+def describe(state: State, actions: Tuple[Action, ...], weights: Tuple[float, ...], degenerate_share: float) -> dict:
+    """ Best sequence as runs of the same action, action shares and degenerate strategy flag
+    :param state:
+    :param actions:
+    :param weights:
+    :param degenerate_share: share of days of one action to flag strategy as degenerate
+    :return:
+    """
+    _init_worker(actions)
+    sequence = []
+    counts = {}
+    for action_index in state.history:
+        action = actions[action_index]
+        name = f"{action.kind} {action.id} ({action.name})"
+        counts[name] = counts.get(name, 0) + 1
+        if sequence and sequence[-1]["action"] == name:
+            sequence[-1]["days"] += 1
+        else:
+            sequence.append({"action": name, "days": 1})
+
+    days = len(state.history)
+    shares = {name: round(count / days, 4) for name, count in sorted(counts.items(), key=lambda item: -item[1])}
+    dominant = next(iter(shares.items()), (None, 0))
+    return {
+        "score": round(score(state, weights), 2),
+        "balances": [round(amount, 2) for amount in state.balances],
+        "stats": {"hunger": state.hunger, "rest": state.rest, "health": state.health, "authority": state.authority},
+        "owned": sorted(f"{kind} {item_id}" for kind, item_id in state.owned),
+        "sequence": sequence,
+        "action_share": shares,
+        "dominant_action": {"action": dominant[0], "share": dominant[1]},
+        "degenerate": dominant[1] >= degenerate_share,
+    }
+
+
+async def load_player_state(player_id: int, catalog: SimulationCatalog) -> Tuple[State, int]:
+    """ Search start state of the player from db
+    :param player_id:
+    :param catalog:
+    :return: state and game day of player
+    """
+    async with async_session_maker() as session:
+        player = await repository_entity.PlayerEntity(session=session).get_player_by_id(player_id, profile="plan")
+        if not player:
+            raise ValueError(f"Player {player_id} is not found")
+        result = await session.execute(
+            select(models.business_player.c.business_id, models.business_player.c.last_collected_day).filter(
+                models.business_player.c.player_id == player_id
+            )
+        )
+        business_days = dict(result.all())
+
+    balances = [0] * len(catalog.currency_ids)
+    for currency_id, amount in repository_entity.PlayerEntity.get_balance_amounts(player).items():
+        balances[catalog.currency_index[currency_id]] = amount
+    owned = frozenset(
+        (kind, item_id)
+        for kind, item_ids in repository_entity.PlayerEntity.get_owned_ids(player).items() for item_id in item_ids
+    )
+    actions = compile_actions(catalog)
+    businesses = tuple(
+        (index, business_days.get(action.id) or player.day)
+        for index, action in enumerate(actions) if action.kind == "business" and ("business", action.id) in owned
+    )
+    state = State(
+        hunger=player.hunger, rest=player.rest, health=player.health, authority=player.authority,
+        deadly_days=player.deadly_days, balances=tuple(balances), owned=owned, businesses=businesses, history=(),
+    )
+    return state, player.day
+
+
+def new_player_state(catalog: SimulationCatalog) -> State:
+    return State(
+        hunger=100, rest=100, health=100, authority=0, deadly_days=0,
+        balances=tuple([0] * len(catalog.currency_ids)), owned=frozenset(), businesses=(), history=(),
+    )
+
+
+def parse_weights(value: str | None, catalog: SimulationCatalog) -> Tuple[float, ...]:
+    """ Currency weights as currency_id:weight list, 1 for currencies without weight
+    :param value:
+    :param catalog:
+    :return:
+    """
+    weights = [1.0] * len(catalog.currency_ids)
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        currency_id, weight = item.split(":")
+        weights[catalog.currency_index[int(currency_id)]] = float(weight)
+    return tuple(weights)
+
+
+async def load(player_id: int | None) -> Tuple[SimulationCatalog, State, int]:
+    """ Catalog and start state, db connections are closed before worker processes start
+    :param player_id:
+    :return:
+    """
+    catalog = await load_catalog()
+    if player_id is None:
+        state, day = new_player_state(catalog), 1
+    else:
+        state, day = await load_player_state(player_id, catalog)
+    await engine.dispose()
+    return catalog, state, day
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Beam search of the best income action sequence on catalog tables")
+    parser.add_argument("--player-id", type=int, default=None, help="start from player state, new player by default")
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--width", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--weights", type=str, default=None, help="currency_id:weight,...")
+    parser.add_argument("--degenerate-share", type=float, default=0.9)
+    args = parser.parse_args()
+
+    search_catalog, start_state, game_day = asyncio.run(load(args.player_id))
+    search_actions = compile_actions(search_catalog)
+    search_weights = parse_weights(args.weights, search_catalog)
+    best = search(
+        actions=search_actions,
+        start=start_state,
+        days=args.days,
+        width=args.width,
+        weights=search_weights,
+        workers=args.workers,
+        start_day=game_day
+    )
+    if best is None:
+        print(json.dumps({"message": "Player can not survive with this catalog"}))
+    else:
+        print(json.dumps(describe(best, search_actions, search_weights, args.degenerate_share), indent=2))
@@ -3,6 +3,8 @@ import asyncio
 from config import logger
 from core.repository_entity import init_db
 from fastapi import FastAPI
+from game.exchange import run_exchange_ticker
+from game.market import run_market
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 from routes import routes
@@ -16,6 +18,8 @@ logger.debug("Start application")
 
 loop = asyncio.get_running_loop()
 loop.create_task(init_db())
+loop.create_task(run_exchange_ticker())
+loop.create_task(run_market())
 
 
 @app.middleware("http")
@@ -0,0 +1,30 @@
+"""added player rng
+
+Revision ID: 0b7e4f2c9d31
+Revises: f25c8e3d1a97
+Create Date: 2026-10-18 19:12:40.531207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7e4f2c9d31'
+down_revision: Union[str, None] = 'f25c8e3d1a97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('player', sa.Column('rng_seed', sa.BigInteger(), nullable=True))
+    op.add_column('player', sa.Column('rng_counter', sa.BigInteger(), server_default='0', nullable=False))
+    op.execute("UPDATE player SET rng_seed = floor(random() * 9223372036854775807)::bigint")
+    op.alter_column('player', 'rng_seed', nullable=False)
+
+
+def downgrade() -> None:
+    op.drop_column('player', 'rng_counter')
+    op.drop_column('player', 'rng_seed')
@@ -0,0 +1,42 @@
+"""added player balance vector
+
+Revision ID: 1c9a5d7e3f48
+Revises: 0b7e4f2c9d31
+Create Date: 2026-10-18 20:37:15.804126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c9a5d7e3f48'
+down_revision: Union[str, None] = '0b7e4f2c9d31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('player', sa.Column('balance_vector', postgresql.ARRAY(sa.Integer()), nullable=True))
+    # position of amount in vector is currency id, currencies without balance row are NULL
+    op.execute(
+        """
+        UPDATE player SET balance_vector = vectors.vector
+        FROM (
+            SELECT players.id AS player_id, array_agg(balance.amount ORDER BY positions.position) AS vector
+            FROM player AS players
+            JOIN generate_series(1, (SELECT coalesce(max(id), 0) FROM currency)) AS positions(position) ON true
+            LEFT OUTER JOIN balance
+                ON balance.player_id = players.id AND balance.currency_id = positions.position
+            GROUP BY players.id
+        ) AS vectors
+        WHERE player.id = vectors.player_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('player', 'balance_vector')
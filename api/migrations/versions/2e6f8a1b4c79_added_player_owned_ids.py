@@ -0,0 +1,45 @@
+"""added player owned ids
+
+Revision ID: 2e6f8a1b4c79
+Revises: 1c9a5d7e3f48
+Create Date: 2026-10-18 21:54:02.917364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2e6f8a1b4c79'
+down_revision: Union[str, None] = '1c9a5d7e3f48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+owned_kinds = ('home', 'skill', 'transport', 'business')
+
+
+def upgrade() -> None:
+    for kind in owned_kinds:
+        op.add_column(
+            'player',
+            sa.Column(f'owned_{kind}_ids', postgresql.ARRAY(sa.Integer()), server_default='{}', nullable=False)
+        )
+        op.execute(
+            f"""
+            UPDATE player SET owned_{kind}_ids = owned.item_ids
+            FROM (
+                SELECT player_id, array_agg({kind}_id ORDER BY {kind}_id) AS item_ids
+                FROM {kind}_player GROUP BY player_id
+            ) AS owned
+            WHERE player.id = owned.player_id
+            """
+        )
+
+
+def downgrade() -> None:
+    for kind in reversed(owned_kinds):
+        op.drop_column('player', f'owned_{kind}_ids')
@@ -0,0 +1,475 @@
+""" Parity of game rules in game.domain with the rules logic.py applied to the ORM player
+before the domain core. Legacy functions below are the old Game methods over a plain player object,
+both sides draw from generators with the same seed, so every roll is the same
+"""
+from game import domain, exceptions
+from types import SimpleNamespace
+
+import pytest
+import random
+
+
+STATE_FIELDS = ("hunger", "rest", "health", "authority", "day", "age", "deadly_days", "alive")
+ITEM_LISTS = {"transport": "transport_list", "home": "home_list", "skill": "skills", "business": "business_list"}
+
+
+class Draws:
+    """ randint source for both implementations
+    """
+
+    def __init__(self, seed: int):
+        self.random = random.Random(seed)
+
+    def randint(self, min_value: int, max_value: int) -> int:
+        return self.random.randint(min_value, max_value)
+
+
+def legacy_check_dead(player) -> None:
+    dead_mode = False
+
+    for attr in ("hunger", "rest", "health"):
+        if getattr(player, attr) <= 0:
+            setattr(player, attr, 0)
+            dead_mode = True
+        elif getattr(player, attr) >= 100:
+            setattr(player, attr, 100)
+
+    if dead_mode:
+        player.deadly_days += 1
+    else:
+        if player.deadly_days:
+            player.deadly_days = 0
+
+    if player.deadly_days > 7:
+        player.alive = False
+
+
+def legacy_next_day(player) -> None:
+    player.day += 1
+    if 365 % player.day == 0:
+        player.age += 1
+    legacy_check_dead(player)
+
+
+def legacy_change_player_stats(player, **changes) -> None:
+    for attr, value in changes.items():
+        if not value:
+            continue
+        setattr(player, attr, getattr(player, attr) + value)
+
+
+def legacy_get_authority_benefit(row, draws: Draws) -> int | None:
+    if hasattr(row, "authority_benefit_min") and hasattr(row, "authority_benefit_max"):
+        if not row.authority_benefit_min or not row.authority_benefit_max:
+            return None
+        return draws.randint(row.authority_benefit_min, row.authority_benefit_max)
+    return None
+
+
+def legacy_set_player_benefit(player, row, draws: Draws) -> None:
+    legacy_change_player_stats(
+        player,
+        hunger=draws.randint(row.hunger_benefit_min, row.hunger_benefit_max),
+        rest=draws.randint(row.rest_benefit_min, row.rest_benefit_max),
+        health=draws.randint(row.health_benefit_min, row.health_benefit_max),
+        authority=legacy_get_authority_benefit(row, draws),
+    )
+
+
+def legacy_set_player_harm(player, row, draws: Draws) -> None:
+    hunger_harm = draws.randint(row.hunger_harm_min, row.hunger_harm_max)
+    rest_harm = draws.randint(row.rest_harm_min, row.rest_harm_max)
+    health_harm = draws.randint(row.health_harm_min, row.health_harm_max)
+    legacy_change_player_stats(
+        player,
+        hunger=-hunger_harm,
+        rest=-rest_harm,
+        health=-health_harm,
+        authority=legacy_get_authority_benefit(row, draws),
+    )
+
+
+def legacy_update_balance(player, row, draws: Draws) -> int:
+    mode = "increment"
+    if hasattr(row, "price") and row.price:
+        amount = -row.price
+        mode = "decrement"
+    else:
+        amount = draws.randint(row.income_min, row.income_max)
+    if mode == "decrement":
+        for balance in player.balances:
+            if balance.currency_id == row.currency_id and balance.amount < row.price:
+                raise exceptions.NoMoneyError("You do not have enough money to make this purchase")
+    for balance in player.balances:
+        if balance.currency_id == row.currency_id:
+            balance.amount += amount
+    return amount
+
+
+def legacy_check_availability(player, row) -> None:
+    for possibility in ("transport", "home", "skill"):
+        if not hasattr(row, possibility):
+            continue
+        required = getattr(row, possibility)
+        if required and required not in getattr(player, ITEM_LISTS[possibility]):
+            raise exceptions.NoPossibilityError(f"You do not have suitable {possibility} - {required}")
+
+
+def legacy_check_object_in_player(player, kind: str, row) -> None:
+    if row in getattr(player, ITEM_LISTS[kind]):
+        raise exceptions.AlreadyExistError(f"{kind} already exists")
+
+
+def legacy_buy_service(player, row, draws: Draws) -> None:
+    legacy_set_player_benefit(player, row, draws)
+    legacy_update_balance(player, row, draws)
+    legacy_next_day(player)
+
+
+def legacy_perform_action(player, row, draws: Draws) -> int:
+    legacy_check_availability(player, row)
+    legacy_set_player_harm(player, row, draws)
+    income = legacy_update_balance(player, row, draws)
+    legacy_next_day(player)
+    return income
+
+
+def legacy_buy_item(player, kind: str, row, draws: Draws) -> None:
+    legacy_check_object_in_player(player, kind, row)
+    legacy_update_balance(player, row, draws)
+    getattr(player, ITEM_LISTS[kind]).append(row)
+    legacy_next_day(player)
+
+
+def domain_buy_service(state: domain.PlayerState, plan: domain.ActionPlan) -> None:
+    domain.change_stats(state, domain.roll_stats(plan, state.rng))
+    domain_update_balance(state, plan)
+    domain.next_day(state)
+
+
+def domain_perform_action(state: domain.PlayerState, plan: domain.ActionPlan) -> int:
+    missing = domain.get_missing_requirement(state, plan)
+    if missing:
+        raise exceptions.NoPossibilityError(f"You do not have suitable {missing}")
+    domain.change_stats(state, domain.roll_stats(plan, state.rng))
+    income = domain_update_balance(state, plan)
+    domain.next_day(state)
+    return income
+
+
+def domain_buy_item(state: domain.PlayerState, plan: domain.ActionPlan) -> None:
+    if domain.owns(state, plan):
+        raise exceptions.AlreadyExistError(f"{plan.kind} already exists")
+    domain_update_balance(state, plan)
+    state.owned[plan.kind].add(plan.id)
+    domain.next_day(state)
+
+
+def domain_update_balance(state: domain.PlayerState, plan: domain.ActionPlan) -> int:
+    amount = domain.roll_balance_change(plan, state.rng)
+    if amount < 0:
+        domain.check_money(state, plan.currency_id, plan.cost, "You do not have enough money to make this purchase")
+    domain.change_balance(state, plan.currency_id, amount)
+    return amount
+
+
+def new_player(**values) -> SimpleNamespace:
+    player = SimpleNamespace(
+        hunger=50, rest=50, health=50, authority=0, day=1, age=18, deadly_days=0, alive=True,
+        balances=[SimpleNamespace(currency_id=1, amount=10), SimpleNamespace(currency_id=2, amount=500)],
+        transport_list=[], home_list=[], skills=[], business_list=[],
+    )
+    for attr, value in values.items():
+        setattr(player, attr, value)
+    return player
+
+
+def map_state(player, seed: int) -> domain.PlayerState:
+    return domain.PlayerState(
+        hunger=player.hunger,
+        rest=player.rest,
+        health=player.health,
+        authority=player.authority,
+        day=player.day,
+        age=player.age,
+        deadly_days=player.deadly_days,
+        alive=player.alive,
+        rng=Draws(seed),
+        balances={balance.currency_id: balance.amount for balance in player.balances},
+        owned={kind: {item.id for item in getattr(player, name)} for kind, name in ITEM_LISTS.items()},
+    )
+
+
+def assert_same(player, state: domain.PlayerState) -> None:
+    for attr in STATE_FIELDS:
+        assert getattr(state, attr) == getattr(player, attr), attr
+    assert state.balances == {balance.currency_id: balance.amount for balance in player.balances}
+    for kind, name in ITEM_LISTS.items():
+        assert state.owned[kind] == {item.id for item in getattr(player, name)}, kind
+
+
+def item_row(item_id: int, price: int, currency_id: int = 2, **values) -> SimpleNamespace:
+    row = SimpleNamespace(
+        id=item_id, name=f"item {item_id}", price=price, currency_id=currency_id,
+        transport=None, transport_id=None, home=None, home_id=None, skill=None, skill_id=None,
+    )
+    for attr, value in values.items():
+        setattr(row, attr, value)
+    return row
+
+
+def service_row(price: int = 5, **values) -> SimpleNamespace:
+    row = SimpleNamespace(
+        id=1, name="service", price=price, currency_id=2, income_min=None, income_max=None,
+        hunger_benefit_min=1, hunger_benefit_max=20, rest_benefit_min=0, rest_benefit_max=15,
+        health_benefit_min=2, health_benefit_max=9, authority_benefit_min=1, authority_benefit_max=3,
+    )
+    for attr, value in values.items():
+        setattr(row, attr, value)
+    return row
+
+
+def action_row(**values) -> SimpleNamespace:
+    row = SimpleNamespace(
+        id=1, name="action", currency_id=2, income_min=10, income_max=40,
+        hunger_harm_min=1, hunger_harm_max=12, rest_harm_min=2, rest_harm_max=10,
+        health_harm_min=0, health_harm_max=5, authority_benefit_min=1, authority_benefit_max=4,
+        transport=None, transport_id=None, home=None, home_id=None, skill=None, skill_id=None,
+    )
+    for attr, value in values.items():
+        setattr(row, attr, value)
+    return row
+
+
+def run_both(player, seed: int, legacy_flow, domain_flow):
+    """ Run flow on a copy of player by the old rules and on its state by domain, compare outcome
+    :return: legacy result, domain result, legacy player, state
+    """
+    state = map_state(player, seed)
+    legacy_result = legacy_error = domain_result = domain_error = None
+    try:
+        legacy_result = legacy_flow(player, Draws(seed))
+    except (exceptions.NoMoneyError, exceptions.NoPossibilityError, exceptions.AlreadyExistError) as e:
+        legacy_error = type(e)
+    try:
+        domain_result = domain_flow(state)
+    except (exceptions.NoMoneyError, exceptions.NoPossibilityError, exceptions.AlreadyExistError) as e:
+        domain_error = type(e)
+    assert domain_error == legacy_error
+    assert domain_result == legacy_result
+    return player, state
+
+
+@pytest.mark.parametrize("seed", range(50))
+@pytest.mark.parametrize("kind", ["food", "health", "leisure"])
+def test_buy_service(seed, kind):
+    row = service_row()
+    player = new_player(hunger=seed, rest=100 - seed, health=seed % 7)
+    plan = domain.compile_plan(kind, row)
+    player, state = run_both(
+        player, seed,
+        lambda p, draws: legacy_buy_service(p, row, draws),
+        lambda s: domain_buy_service(s, plan)
+    )
+    assert_same(player, state)
+
+
+@pytest.mark.parametrize("seed", range(50))
+@pytest.mark.parametrize("kind", ["work", "streetaction"])
+def test_perform_action(seed, kind):
+    row = action_row()
+    player = new_player(hunger=seed * 2, rest=seed, health=100 - seed, authority=seed)
+    plan = domain.compile_plan(kind, row)
+    player, state = run_both(
+        player, seed,
+        lambda p, draws: legacy_perform_action(p, row, draws),
+        lambda s: domain_perform_action(s, plan)
+    )
+    assert_same(player, state)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_perform_action_days_until_death(seed):
+    row = action_row(hunger_harm_min=5, hunger_harm_max=30, health_harm_min=0, health_harm_max=0)
+    player = new_player()
+    state = map_state(player, seed)
+    plan = domain.compile_plan("work", row)
+    legacy_draws = Draws(seed)
+    for day in range(40):
+        assert legacy_perform_action(player, row, legacy_draws) == domain_perform_action(state, plan)
+        assert_same(player, state)
+        if not player.alive:
+            break
+    assert not state.alive
+    assert state.deadly_days == 8
+
+
+@pytest.mark.parametrize("kind", ["home", "skill", "transport", "business"])
+@pytest.mark.parametrize("amount", [0, 99, 100, 101])
+def test_buy_item_money_check(kind, amount):
+    row = item_row(3, price=100)
+    player = new_player(balances=[SimpleNamespace(currency_id=2, amount=amount)])
+    plan = domain.compile_plan(kind, row)
+    player, state = run_both(
+        player, 1,
+        lambda p, draws: legacy_buy_item(p, kind, row, draws),
+        lambda s: domain_buy_item(s, plan)
+    )
+    assert_same(player, state)
+
+
+@pytest.mark.parametrize("kind", ["home", "skill", "transport", "business"])
+def test_buy_owned_item(kind):
+    row = item_row(3, price=10)
+    player = new_player(**{ITEM_LISTS[kind]: [row]})
+    plan = domain.compile_plan(kind, row)
+    player, state = run_both(
+        player, 1,
+        lambda p, draws: legacy_buy_item(p, kind, row, draws),
+        lambda s: domain_buy_item(s, plan)
+    )
+    assert_same(player, state)
+
+
+@pytest.mark.parametrize("owned", [(), ("transport",), ("skill",), ("transport", "skill"), ("transport", "home", "skill")])
+def test_missing_requirement(owned):
+    requirements = {kind: item_row(index + 1, price=1) for index, kind in enumerate(("transport", "home", "skill"))}
+    row = action_row(
+        transport=requirements["transport"], transport_id=requirements["transport"].id,
+        skill=requirements["skill"], skill_id=requirements["skill"].id,
+    )
+    player = new_player(**{ITEM_LISTS[kind]: [requirements[kind]] for kind in owned})
+    plan = domain.compile_plan("work", row)
+    assert plan.requirements == (("transport", 1), ("skill", 3))
+    player, state = run_both(
+        player, 7,
+        lambda p, draws: legacy_perform_action(p, row, draws),
+        lambda s: domain_perform_action(s, plan)
+    )
+    assert_same(player, state)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_price_zero_with_income_roll(seed):
+    row = service_row(price=0, income_min=3, income_max=9)
+    player = new_player()
+    plan = domain.compile_plan("leisure", row)
+    assert plan.cost == 0 and plan.income_roll == (3, 9)
+    player, state = run_both(
+        player, seed,
+        lambda p, draws: legacy_buy_service(p, row, draws),
+        lambda s: domain_buy_service(s, plan)
+    )
+    assert_same(player, state)
+
+
+@pytest.mark.parametrize("authority_range", [(0, 0), (0, 5), (3, 0), (None, None), (2, 2)])
+@pytest.mark.parametrize("seed", range(10))
+def test_authority_range(authority_range, seed):
+    row = action_row(authority_benefit_min=authority_range[0], authority_benefit_max=authority_range[1])
+    player = new_player(authority=10)
+    plan = domain.compile_plan("streetaction", row)
+    player, state = run_both(
+        player, seed,
+        lambda p, draws: legacy_perform_action(p, row, draws),
+        lambda s: domain_perform_action(s, plan)
+    )
+    assert_same(player, state)
+    assert domain.count_rolls(plan) == 3 + (plan.authority_roll is not None) + 1
+
+
+@pytest.mark.parametrize("stats", [
+    (0, 50, 50), (-5, 120, 50), (100, 100, 100), (150, 0, -1), (1, 1, 1), (99, 101, 0),
+])
+@pytest.mark.parametrize("deadly_days", [0, 3, 7, 8])
+def test_check_dead_clamping(stats, deadly_days):
+    hunger, rest, health = stats
+    player = new_player(hunger=hunger, rest=rest, health=health, deadly_days=deadly_days)
+    state = map_state(player, 1)
+    legacy_check_dead(player)
+    domain.check_dead(state)
+    assert_same(player, state)
+
+
+@pytest.mark.parametrize("day", [1, 4, 72, 364, 365, 366, 800])
+def test_next_day(day):
+    player = new_player(day=day, hunger=0)
+    state = map_state(player, 1)
+    legacy_next_day(player)
+    domain.next_day(state)
+    assert_same(player, state)
+
+
+def test_death_after_seven_deadly_days():
+    player = new_player(hunger=0)
+    state = map_state(player, 1)
+    for day in range(1, 9):
+        legacy_next_day(player)
+        domain.next_day(state)
+        assert_same(player, state)
+        assert state.deadly_days == day
+        assert state.alive == (day <= 7)
+
+
+def test_deadly_days_reset_on_recovery():
+    player = new_player(hunger=0, deadly_days=6)
+    state = map_state(player, 1)
+    legacy_next_day(player)
+    domain.next_day(state)
+    player.hunger = state.hunger = 30
+    legacy_next_day(player)
+    domain.next_day(state)
+    assert_same(player, state)
+    assert state.deadly_days == 0 and state.alive
+
+
+@pytest.mark.parametrize("kind", ["work", "streetaction"])
+def test_income_without_balance(kind):
+    row = action_row(currency_id=3)
+    player = new_player()
+    plan = domain.compile_plan(kind, row)
+    player, state = run_both(
+        player, 5,
+        lambda p, draws: legacy_perform_action(p, row, draws),
+        lambda s: domain_perform_action(s, plan)
+    )
+    assert_same(player, state)
+    assert 3 not in state.balances
+
+
+@pytest.mark.parametrize("kind", ["home", "skill", "transport", "business"])
+def test_buy_item_without_balance(kind):
+    """ Intended difference: old rules skipped money check and debit when player had no balance
+    of item currency, so the item was free. Domain rules treat missing balance as zero
+    """
+    row = item_row(3, price=10, currency_id=3)
+    player = new_player()
+    state = map_state(player, 1)
+    plan = domain.compile_plan(kind, row)
+
+    legacy_buy_item(player, kind, row, Draws(1))
+    assert row in getattr(player, ITEM_LISTS[kind])
+
+    with pytest.raises(exceptions.NoMoneyError):
+        domain_buy_item(state, plan)
+    assert state.owned[kind] == set()
+    assert state.day == 1
+
+
+@pytest.mark.parametrize("changes", [
+    [(2, 30)], [(3, 30)], [(2, -10), (3, 5)], [(3, 5), (3, -5)], [(3, -5)], [(1, 4), (2, -600), (1, 1)],
+])
+def test_net_balance_changes(changes):
+    """ Atomic mode applies net changes of the request in one statement, orm mode applies them one by one
+    """
+    state = map_state(new_player(), 1)
+    net_changes = domain.get_net_balance_changes(state, changes)
+    assert 3 not in net_changes or net_changes[3] < 0
+
+    expected = dict(state.balances)
+    for currency_id, amount in changes:
+        domain.change_balance(state, currency_id, amount)
+    for currency_id, amount in net_changes.items():
+        if currency_id in expected:
+            expected[currency_id] += amount
+    assert expected == state.balances
@@ -16,7 +16,7 @@ class User(SQLAlchemyBaseUserTable[int], Base):
     is_active: bool = Column(Boolean, default=True, nullable=False)
     is_superuser: bool = Column(Boolean, default=False, nullable=False)
     is_verified: bool = Column(Boolean, default=False, nullable=False)
-    players = relationship("Player", lazy="selectin", join_depth=2)
+    players = relationship("Player", lazy="raise")
 
 
 async def get_user_db(session: AsyncSession = Depends(get_async_session)):